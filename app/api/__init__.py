@@ -8,7 +8,10 @@ Time: 2025/6/13 16:34
 """
 from fastapi import APIRouter
 
-from app.api.routes import layout
+from app.api.routes import jobs, layout, metrics, ocr
 
 base_router = APIRouter()
 base_router.include_router(layout.router)
+base_router.include_router(ocr.router)
+base_router.include_router(jobs.router)
+base_router.include_router(metrics.router)
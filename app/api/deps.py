@@ -6,3 +6,24 @@ Author: youshun xu
 File: deps
 Time: 2025/6/13 16:37
 """
+from fastapi import Header, HTTPException
+
+from app.core.engine.scheduling import normalize_tenant
+from app.core.pdf.rasterize import check_pdf_path
+
+
+def get_tenant(x_tenant_id: str = Header(None)) -> str:
+    """
+    提交请求的租户，由调用方通过 X-Tenant-Id 请求头标记，批量通道按租户公平分配
+    """
+    return normalize_tenant(x_tenant_id)
+
+
+def checked_pdf_path(pdf_path: str) -> str:
+    """
+    检查客户端提交的 pdf_path，不在上传目录或允许的 url 主机中时返回 400
+    """
+    try:
+        return check_pdf_path(pdf_path)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
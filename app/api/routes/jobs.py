@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: jobs
+Time: 2025/6/20 11:02
+"""
+import asyncio
+import json
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from app.api.deps import checked_pdf_path, get_tenant
+from app.api.routes.layout import LayoutRequestModel
+from app.api.routes.schema import JobResponse, JobResultResponse, JobStatusResponse
+from app.config.conf import JOB_POLL_INTERVAL
+from app.core.engine.celery_task import (
+    celery_app,
+    default_layout_task,
+    default_ocr_task,
+    layout_guided_ocr_task,
+    pdf_ingest_task,
+)
+from app.core.engine.checkpoint import build_checkpoint_store
+from app.core.engine.dedup import page_dedup_scope
+from app.core.engine.jobs import JobStore, job_status, page_async_result, JOB_DISPATCHING
+from app.core.engine.scheduling import lane_priority
+from app.core.engine.transport import decode_base64_image, pack_image
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+JOB_TASKS = {
+    "layout": default_layout_task,
+    "ocr": default_ocr_task,
+    "layout_ocr": layout_guided_ocr_task,
+}
+
+
+class JobRequestModel(LayoutRequestModel):
+    task: str = "layout"
+
+
+@router.post(
+    "",
+    dependencies=[],
+    response_model=JobResponse
+)
+def create_job(
+        body: JobRequestModel,
+        tenant: str = Depends(get_tenant),
+):
+    if body.task not in JOB_TASKS:
+        raise HTTPException(status_code=400, detail=f"unsupported task: {body.task}")
+    task_name = JOB_TASKS[body.task]
+    lane = body.resolve_lane()
+    store = JobStore()
+
+    if body.pdf_path:
+        params = {"pdf_path": checked_pdf_path(body.pdf_path), "dpi": body.dpi, "max_in_flight": body.max_in_flight,
+                  "tenant": tenant, "lane": lane}
+        job_id = store.create(task_name, params=params)
+        _send_pdf_ingest(job_id, task_name, params)
+        return JobResponse(job_id=job_id)
+
+    job_id = store.create(task_name, total=len(body.images))
+    dedup_scope = page_dedup_scope(tenant, job_id)
+    for image_id, img_base64 in body.images.items():
+        async_result = celery_app.send_task(
+            task_name, args=(image_id, pack_image(decode_base64_image(img_base64))),
+            kwargs={"dedup_scope": dedup_scope}, priority=lane_priority(lane),
+        )
+        store.add_page(job_id, image_id, image_id, async_result.id)
+    store.finish_dispatch(job_id, len(body.images))
+    return JobResponse(job_id=job_id)
+
+
+def _send_pdf_ingest(job_id: str, task_name: str, params: dict):
+    celery_app.send_task(pdf_ingest_task, args=(
+        job_id, params["pdf_path"], task_name, params["dpi"], params["max_in_flight"], params["tenant"], params["lane"]
+    ))
+
+
+@router.get(
+    "/{job_id}",
+    dependencies=[],
+    response_model=JobStatusResponse
+)
+def get_job(job_id: str):
+    status = job_status(JobStore(), job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"job {job_id} not found")
+    return JobStatusResponse(**status)
+
+
+@router.post(
+    "/{job_id}/resume",
+    dependencies=[],
+    response_model=JobResponse
+)
+def resume_job(job_id: str, force: bool = False):
+    """
+    按原参数重新投递 pdf 任务，已有检查点的页面不再计算，只执行未完成和失败的页面。
+    投递进程异常退出时任务状态停留在 DISPATCHING，需要 force=true 恢复
+    """
+    store = JobStore()
+    job = store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"job {job_id} not found")
+    if "params" not in job:
+        raise HTTPException(status_code=400, detail="only pdf jobs can be resumed")
+    if job["status"] == JOB_DISPATCHING and not force:
+        raise HTTPException(status_code=409, detail=f"job {job_id} is still dispatching")
+    store.resume(job_id)
+    _send_pdf_ingest(job_id, job["task_name"], job["params"])
+    return JobResponse(job_id=job_id)
+
+
+@router.get(
+    "/{job_id}/result",
+    dependencies=[],
+    response_model=JobResultResponse
+)
+def get_job_result(job_id: str):
+    """
+    由页面检查点按页码组装的 pdf 任务结果，任务未结束时返回已完成的部分
+    """
+    job = JobStore().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"job {job_id} not found")
+    if "params" not in job:
+        raise HTTPException(status_code=400, detail="only pdf jobs have an assembled result")
+    return JobResultResponse(**build_checkpoint_store().assemble(job_id, job.get("total", 0)))
+
+
+def _poll_finished_pages(store: JobStore, job_id: str, pending: dict, offset: int):
+    """
+    拉取新投递的页面，并返回已结束的页面事件。
+    同一页重试时以最后一次投递为准（pending 按页保存最后一次投递），pdf 任务投递结束前失败的页面可能还会重试，
+    等到被新的投递替换或投递结束后再推送，每页只推送一次最终结果
+    """
+    # 先读任务状态再读页面列表，状态已不是投递中时列表中已包含所有重试
+    job = store.get(job_id)
+    new_pages = store.pages(job_id, offset)
+    for page in new_pages:
+        pending[page["page"]] = page
+    dispatching = job["status"] == JOB_DISPATCHING
+    retryable = "params" in job and dispatching
+
+    events = []
+    for page_no, page in list(pending.items()):
+        async_result = page_async_result(page)
+        if not async_result.ready():
+            continue
+        if async_result.successful():
+            result = async_result.result.get(page["image_id"])
+            events.append(("page", {"page": page_no, "status": "SUCCESS", "result": result}))
+        elif retryable:
+            continue
+        else:
+            events.append(("page", {"page": page_no, "status": async_result.state, "error": str(async_result.result)}))
+        del pending[page_no]
+    finished = not dispatching and not pending
+    return events, offset + len(new_pages), finished, job
+
+
+@router.get(
+    "/{job_id}/events",
+    dependencies=[],
+)
+async def stream_job_events(job_id: str):
+    """
+    Server-Sent Events: 每页任务结束后立即推送 page 事件，全部结束后推送 done 事件
+    """
+    store = JobStore()
+    if await run_in_threadpool(store.get, job_id) is None:
+        raise HTTPException(status_code=404, detail=f"job {job_id} not found")
+
+    async def event_stream():
+        pending, offset = {}, 0
+        while True:
+            events, offset, finished, job = await run_in_threadpool(
+                _poll_finished_pages, store, job_id, pending, offset
+            )
+            for event, data in events:
+                yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+            if finished:
+                done = {"job_id": job_id, "status": job["status"], "total": job.get("total"),
+                        "error": job.get("error")}
+                yield f"event: done\ndata: {json.dumps(done, ensure_ascii=False)}\n\n"
+                return
+            if not events:
+                await asyncio.sleep(JOB_POLL_INTERVAL)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -6,10 +6,19 @@ Author: youshun xu
 File: layout
 Time: 2025/6/13 16:34
 """
-from fastapi import APIRouter
+import uuid
+
+from fastapi import APIRouter, Depends
 from pydantic import BaseModel, model_validator
 
+from app.api.deps import checked_pdf_path, get_tenant
 from app.api.routes.schema import LayoutResponse
+from app.config.conf import PDF_RENDER_DPI, PDF_MAX_IN_FLIGHT, TASK_RESULT_TIMEOUT
+from app.core.engine.celery_task import celery_app, default_layout_task
+from app.core.engine.dedup import page_dedup_scope
+from app.core.engine.scheduling import LANE_PRIORITIES, lane_priority, resolve_lane
+from app.core.engine.transport import decode_base64_image, is_image_handle, pack_image
+from app.core.pdf.ingest import stream_pdf_results
 
 router = APIRouter(prefix="/layout", tags=["layout"])
 
@@ -17,6 +26,10 @@ router = APIRouter(prefix="/layout", tags=["layout"])
 class LayoutRequestModel(BaseModel):
     images: dict = None
     pdf_path: str = None
+    dpi: int = PDF_RENDER_DPI
+    max_in_flight: int = PDF_MAX_IN_FLIGHT
+    # 调度通道 interactive / bulk，为空时 pdf 和大量图片走批量通道
+    lane: str = None
 
     @model_validator(mode="after")
     def check(self):
@@ -24,8 +37,16 @@ class LayoutRequestModel(BaseModel):
             raise ValueError("Only one of 'images' or 'pdf_path' is allowed, not both.")
         if not self.images and not self.pdf_path:
             raise ValueError("")
+        if self.lane is not None and self.lane not in LANE_PRIORITIES:
+            raise ValueError(f"lane must be one of {sorted(LANE_PRIORITIES)}")
+        # 图片引用只能由服务端生成，客户端只能上传 base64
+        if self.images and any(not isinstance(img, str) or is_image_handle(img) for img in self.images.values()):
+            raise ValueError("images must be base64 strings")
         return self
 
+    def resolve_lane(self) -> str:
+        return resolve_lane(self.lane, len(self.images or {}), bool(self.pdf_path))
+
 
 @router.post(
     "",
@@ -33,11 +54,27 @@ class LayoutRequestModel(BaseModel):
     response_model=LayoutResponse
 )
 def default_layout(
-        body: LayoutRequestModel
+        body: LayoutRequestModel,
+        tenant: str = Depends(get_tenant),
 ):
     if body.pdf_path:
-        # TODO download pdf to local temp dir and convert to image
-        pass
+        body.pdf_path = checked_pdf_path(body.pdf_path)
+    results = {}
+    lane = body.resolve_lane()
+    if body.pdf_path:
+        for page_no, page_result in stream_pdf_results(
+                body.pdf_path, dpi=body.dpi, max_in_flight=body.max_in_flight, tenant=tenant, lane=lane
+        ):
+            results[str(page_no)] = page_result
     if body.images:
-        # TODO
-        pass
+        dedup_scope = page_dedup_scope(tenant, uuid.uuid4().hex)
+        async_results = [
+            celery_app.send_task(
+                default_layout_task, args=(image_id, pack_image(decode_base64_image(img_base64))),
+                kwargs={"dedup_scope": dedup_scope}, priority=lane_priority(lane),
+            )
+            for image_id, img_base64 in body.images.items()
+        ]
+        for async_result in async_results:
+            results.update(async_result.get(timeout=TASK_RESULT_TIMEOUT))
+    return LayoutResponse(results=results)
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: metrics
+Time: 2025/6/30 14:20
+"""
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+
+from app.common.metrics import collect_all, render_prometheus
+
+router = APIRouter(tags=["metrics"])
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@router.get(
+    "/metrics",
+    dependencies=[],
+    response_class=PlainTextResponse,
+)
+async def get_metrics():
+    """
+    Prometheus 指标: api 进程自身的指标，METRICS_SINK=redis 时合并所有 worker 写入的指标
+    """
+    histograms = await run_in_threadpool(collect_all)
+    return PlainTextResponse(render_prometheus(histograms), media_type=PROMETHEUS_CONTENT_TYPE)
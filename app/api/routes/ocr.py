@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: ocr
+Time: 2025/6/24 15:20
+"""
+import uuid
+
+from fastapi import APIRouter, Depends
+
+from app.api.deps import checked_pdf_path, get_tenant
+from app.api.routes.layout import LayoutRequestModel
+from app.api.routes.schema import OcrResponse
+from app.config.conf import TASK_RESULT_TIMEOUT
+from app.core.engine.celery_task import celery_app, default_ocr_task
+from app.core.engine.dedup import page_dedup_scope
+from app.core.engine.scheduling import lane_priority
+from app.core.engine.transport import decode_base64_image, pack_image
+from app.core.pdf.ingest import stream_pdf_ocr
+
+router = APIRouter(prefix="/ocr", tags=["ocr"])
+
+
+class OcrRequestModel(LayoutRequestModel):
+    # pdf 有可用的内嵌文字时直接使用，不做 OCR
+    use_text_layer: bool = True
+
+
+@router.post(
+    "",
+    dependencies=[],
+    response_model=OcrResponse
+)
+def default_ocr(
+        body: OcrRequestModel,
+        tenant: str = Depends(get_tenant),
+):
+    if body.pdf_path:
+        body.pdf_path = checked_pdf_path(body.pdf_path)
+    results = {}
+    lane = body.resolve_lane()
+    if body.pdf_path:
+        for page_no, page_result in stream_pdf_ocr(
+                body.pdf_path, dpi=body.dpi, max_in_flight=body.max_in_flight,
+                use_text_layer=body.use_text_layer, tenant=tenant, lane=lane,
+        ):
+            results[str(page_no)] = page_result
+    if body.images:
+        dedup_scope = page_dedup_scope(tenant, uuid.uuid4().hex)
+        async_results = [
+            celery_app.send_task(
+                default_ocr_task, args=(image_id, pack_image(decode_base64_image(img_base64))),
+                kwargs={"dedup_scope": dedup_scope}, priority=lane_priority(lane),
+            )
+            for image_id, img_base64 in body.images.items()
+        ]
+        for async_result in async_results:
+            results.update(async_result.get(timeout=TASK_RESULT_TIMEOUT))
+    return OcrResponse(results=results)
@@ -10,4 +10,34 @@ from pydantic import BaseModel
 
 
 class LayoutResponse(BaseModel):
-    pass
+    # {image_id 或 pdf 页码(从0开始): {"layout_dets": [...], "page_info": {...}}}
+    results: dict = {}
+
+
+class JobResponse(BaseModel):
+    job_id: str
+
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    status: str
+    error: str = None
+    total: int = None  # pdf 仍在投递时为空
+    dispatched: int
+    finished: int
+    states: dict  # {celery 任务状态: 页数}，重试的页面按最后一次投递统计
+    retried: int = 0  # 重新投递的次数
+    done: bool
+
+
+class JobResultResponse(BaseModel):
+    job_id: str
+    total: int = None
+    pages: dict = {}  # {页码: 单页结果}，按页码排序
+    missing: list = []  # 没有结果的页码
+    failures: dict = {}  # {页码: {"attempts", "error"}}，仍未成功的页面最后一次的错误
+
+
+class OcrResponse(BaseModel):
+    # {image_id 或 pdf 页码(从0开始): {"text", "bbox", "chars", "table_markdown", "triage"}}，triage 仅 pdf 有
+    results: dict = {}
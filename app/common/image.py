@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: image
+Time: 2025/6/28 10:20
+"""
+from io import BytesIO
+
+import cv2
+import numpy as np
+from PIL import Image
+
+JPEG_MAGIC = b"\xff\xd8"
+
+# 忽略 EXIF 方向，与原来 PIL 解码的结果保持一致（坐标基于未旋转的像素）
+DECODE_FLAGS = cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION
+# JPEG 解码时由 libjpeg 在 DCT 阶段直接缩小，不生成全尺寸图片
+REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8 | cv2.IMREAD_IGNORE_ORIENTATION),
+    (4, cv2.IMREAD_REDUCED_COLOR_4 | cv2.IMREAD_IGNORE_ORIENTATION),
+    (2, cv2.IMREAD_REDUCED_COLOR_2 | cv2.IMREAD_IGNORE_ORIENTATION),
+)
+
+
+def decode_image_pil(img_data: bytes) -> np.ndarray:
+    """
+    PIL 解码，用于 opencv 不支持的格式
+    """
+    img = Image.open(BytesIO(img_data))
+    img = img.convert("RGB")
+    return cv2.cvtColor(np.asarray(img), cv2.COLOR_RGB2BGR)
+
+
+def decode_image(img_data: bytes) -> np.ndarray:
+    """
+    直接解码为 BGR 格式的 np.ndarray，灰度、CMYK、带透明通道的图片都在解码时转换为 3 通道，
+    np.frombuffer 不复制输入字节
+    """
+    img = cv2.imdecode(np.frombuffer(img_data, dtype=np.uint8), DECODE_FLAGS)
+    if img is None:
+        return decode_image_pil(img_data)
+    return img
+
+
+def image_size(img_data: bytes):
+    """
+    只读取文件头获取图片尺寸，不解码像素
+    :return: (width, height)，无法识别时返回 None
+    """
+    try:
+        with Image.open(BytesIO(img_data)) as img:
+            return img.size
+    except Exception:
+        return None
+
+
+def reduce_factor(size, min_long_side: int) -> int:
+    """
+    缩小后长边仍不小于 min_long_side 的最大缩小倍数
+    """
+    if not size or not min_long_side:
+        return 1
+    long_side = max(size)
+    for factor, _ in REDUCED_DECODE_FLAGS:
+        if long_side / factor >= min_long_side:
+            return factor
+    return 1
+
+
+def decode_image_reduced(img_data: bytes, min_long_side: int):
+    """
+    模型输入尺寸远小于原图时在解码阶段缩小，只对 JPEG 生效（其他格式的缩小仍需先完整解码，没有收益）
+    :param min_long_side: 缩小后长边的最小值，一般为模型的输入尺寸
+    :return: (BGR 图片, 原图尺寸 (width, height))
+    """
+    if img_data[:2] == JPEG_MAGIC:
+        size = image_size(img_data)
+        factor = reduce_factor(size, min_long_side)
+        if factor > 1:
+            flags = dict(REDUCED_DECODE_FLAGS)[factor]
+            img = cv2.imdecode(np.frombuffer(img_data, dtype=np.uint8), flags)
+            if img is not None:
+                return img, size
+    img = decode_image(img_data)
+    return img, (img.shape[1], img.shape[0])
+
+
+def ink_bbox(gray: np.ndarray, threshold: int = 200):
+    """
+    灰度图中深色像素（墨迹）的外接框
+    :return: (x0, y0, x1, y1)，没有墨迹时返回 None
+    """
+    ys, xs = np.nonzero(gray < threshold)
+    if not len(xs):
+        return None
+    return int(xs.min()), int(ys.min()), int(xs.max()) + 1, int(ys.max()) + 1
+
+
+def dct_hash(gray: np.ndarray, size=(32, 32), keep=(8, 8)) -> bytes:
+    """
+    DCT 感知哈希: 缩放到 size (height, width) 后取左上角 keep 大小的低频系数，与中位数比较得到比特串
+    :return: keep[0] * keep[1] 比特打包成的字节串
+    """
+    small = cv2.resize(gray, (size[1], size[0]), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:keep[0], :keep[1]]
+    return np.packbits((low > np.median(low)).ravel()).tobytes()
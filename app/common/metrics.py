@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: metrics
+Time: 2025/6/30 10:30
+"""
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from app.config.conf import METRICS_ENABLED, METRICS_SINK, METRICS_FLUSH_INTERVAL
+from app.core.engine.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+STAGE_METRIC = "pdf_extract_stage_seconds"
+TASK_METRIC = "pdf_extract_task_seconds"
+METRIC_LABELS = {STAGE_METRIC: "stage", TASK_METRIC: "task"}
+METRIC_HELP = {
+    STAGE_METRIC: "Time spent in each processing stage",
+    TASK_METRIC: "Celery task run time",
+}
+
+# 阶段名
+STAGE_DECODE = "decode"
+STAGE_PAGE_DEDUP = "page_dedup"
+STAGE_LAYOUT_INFERENCE = "layout_inference"
+STAGE_OCR_DET = "ocr_det"
+STAGE_OCR_CLS = "ocr_cls"
+STAGE_OCR_REC = "ocr_rec"
+STAGE_TABLE_STRUCTURE = "table_structure"
+STAGE_FORMULA_REC = "formula_rec"
+STAGE_OVERLAP = "overlap_suppression"
+STAGE_SORT = "sort"
+STAGE_RESULT_BUILD = "result_build"
+STAGE_SERIALIZE = "serialize"
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+REDIS_METRICS_KEY = "metrics:histograms"
+
+
+class Histogram:
+    """
+    固定分桶的直方图，counts 为各个桶的非累计计数，最后一个桶为 +Inf
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other: "Histogram"):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.sum += other.sum
+        self.count += other.count
+
+
+class Metrics:
+    """
+    进程内的指标: histograms 为累计值，pending 为尚未写入 sink 的增量
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.pending = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def observe(self, metric: str, label: str, seconds: float):
+        key = (metric, label)
+        with self._lock:
+            for histograms in (self.histograms, self.pending):
+                histogram = histograms.get(key)
+                if histogram is None:
+                    histogram = histograms[key] = Histogram()
+                histogram.observe(seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            snapshot = {}
+            for key, histogram in self.histograms.items():
+                copied = snapshot[key] = Histogram()
+                copied.merge(histogram)
+            return snapshot
+
+    def take_pending(self) -> dict:
+        with self._lock:
+            pending, self.pending = self.pending, {}
+            self._last_flush = time.monotonic()
+            return pending
+
+    def flush_due(self, interval: float) -> bool:
+        return bool(self.pending) and time.monotonic() - self._last_flush >= interval
+
+
+metrics = Metrics()
+_local = threading.local()
+
+
+def observe(stage: str, seconds: float, metric: str = STAGE_METRIC):
+    if not METRICS_ENABLED:
+        return
+    metrics.observe(metric, stage, seconds)
+    timings = getattr(_local, "timings", None)
+    if timings is not None and metric == STAGE_METRIC:
+        timings[stage] = round(timings.get(stage, 0) + seconds * 1000, 3)
+
+
+class _Timer:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class _NoopTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_NOOP_TIMER = _NoopTimer()
+
+
+def timer(stage: str):
+    """
+    with timer(STAGE_DECODE): ...
+    未开启指标时返回共享的空计时器
+    """
+    if not METRICS_ENABLED:
+        return _NOOP_TIMER
+    return _Timer(stage)
+
+
+def timed(stage: str):
+    """
+    函数计时装饰器，未开启指标时直接返回原函数
+    """
+    def decorator(func):
+        if not METRICS_ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Timer(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def collect_timings():
+    """
+    收集当前线程中各阶段的耗时(ms)，用于写入任务结果
+    with collect_timings() as timings: ...
+    """
+    previous = getattr(_local, "timings", None)
+    _local.timings = timings = {}
+    try:
+        yield timings
+    finally:
+        _local.timings = previous
+
+
+def attach_timings(result: dict, timings: dict) -> dict:
+    if timings:
+        result["timings"] = dict(timings)
+    return result
+
+
+class RedisMetricsSink:
+    """
+    多个 worker 进程的直方图增量累加到同一个 redis hash，api 进程从中读取汇总值
+    field 格式: {metric}|{label}|{桶序号 / sum / count}
+    """
+
+    def __init__(self, client=None, key: str = REDIS_METRICS_KEY):
+        self.client = client or get_redis_client()
+        self.key = key
+
+    def write(self, histograms: dict):
+        pipe = self.client.pipeline(transaction=False)
+        for (metric, label), histogram in histograms.items():
+            prefix = f"{metric}|{label}"
+            for i, count in enumerate(histogram.counts):
+                if count:
+                    pipe.hincrby(self.key, f"{prefix}|{i}", count)
+            pipe.hincrbyfloat(self.key, f"{prefix}|sum", histogram.sum)
+            pipe.hincrby(self.key, f"{prefix}|count", histogram.count)
+        pipe.execute()
+
+    def read(self) -> dict:
+        histograms = {}
+        for field, value in self.client.hgetall(self.key).items():
+            metric, label, slot = (field.decode() if isinstance(field, bytes) else field).rsplit("|", 2)
+            histogram = histograms.setdefault((metric, label), Histogram())
+            if slot == "sum":
+                histogram.sum = float(value)
+            elif slot == "count":
+                histogram.count = int(value)
+            else:
+                histogram.counts[int(slot)] = int(value)
+        return histograms
+
+
+def get_sink():
+    if METRICS_SINK == "redis":
+        return RedisMetricsSink()
+    return None
+
+
+def flush_metrics(sink=None, force: bool = False):
+    """
+    把本进程尚未写出的增量写入 sink，默认按 METRICS_FLUSH_INTERVAL 节流
+    """
+    sink = sink or get_sink()
+    if sink is None or not (force or metrics.flush_due(METRICS_FLUSH_INTERVAL)):
+        return
+    pending = metrics.take_pending()
+    try:
+        sink.write(pending)
+    except Exception as e:
+        logger.warning(f"写入指标失败: {e}")
+
+
+def render_prometheus(histograms: dict) -> str:
+    """
+    Prometheus text exposition format
+    """
+    lines = []
+    for metric in METRIC_LABELS:
+        items = sorted(
+            ((label, histogram) for (name, label), histogram in histograms.items() if name == metric),
+            key=lambda item: item[0],
+        )
+        if not items:
+            continue
+        label_name = METRIC_LABELS[metric]
+        lines.append(f"# HELP {metric} {METRIC_HELP[metric]}")
+        lines.append(f"# TYPE {metric} histogram")
+        for label, histogram in items:
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), histogram.counts):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{{label_name}="{label}",le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_sum{{{label_name}="{label}"}} {histogram.sum}')
+            lines.append(f'{metric}_count{{{label_name}="{label}"}} {histogram.count}')
+    return "\n".join(lines) + "\n"
+
+
+def collect_all() -> dict:
+    """
+    本进程的指标与 sink 中其他进程的指标合并
+    """
+    histograms = metrics.snapshot()
+    sink = get_sink()
+    if sink is not None:
+        try:
+            for key, histogram in sink.read().items():
+                histograms.setdefault(key, Histogram()).merge(histogram)
+        except Exception as e:
+            logger.warning(f"读取指标失败: {e}")
+    return histograms
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: tiling
+Time: 2025/7/3 10:15
+"""
+import math
+
+import cv2
+import numpy as np
+
+from app.common.utils import find_overlap_blocks_to_remove
+
+# 距离切块内部边界小于该像素数的检测框视为被切开
+EDGE_MARGIN = 4
+# 相邻切块的两个被切开的框在公共区域内的 IoU 达到该值时视为同一个目标
+SEAM_IOU_THRESHOLD = 0.5
+FULL_PAGE = -1
+
+
+class TilePlan:
+    """
+    一张大图的切块方案
+    scale: 切块前的缩放比例（切块数超过 max_tiles 时缩小整页）
+    tiles: (k, 4) 的切块坐标 [x0, y0, x1, y1]，基于缩放后的图片
+    """
+
+    def __init__(self, scale: float, tiles: np.ndarray, width: int, height: int, full_page: bool):
+        self.scale = scale
+        self.tiles = tiles
+        self.width = width
+        self.height = height
+        self.full_page = full_page
+
+    def crops(self, image: np.ndarray) -> list:
+        """
+        :return: 模型输入列表，切块为缩放后图片的视图，不复制像素；开启 full_page 时最后一个为整页
+        """
+        if self.scale != 1:
+            image = cv2.resize(image, (self.width, self.height), interpolation=cv2.INTER_AREA)
+        crops = [image[y0:y1, x0:x1] for x0, y0, x1, y1 in self.tiles]
+        if self.full_page:
+            crops.append(image)
+        return crops
+
+    def tile_ids(self, counts: list) -> np.ndarray:
+        """
+        :param counts: 与 crops 一一对应的检测框数量
+        :return: 每个检测框所属的切块序号，整页的检测框为 FULL_PAGE
+        """
+        ids = list(range(len(self.tiles))) + ([FULL_PAGE] if self.full_page else [])
+        return np.repeat(np.asarray(ids, dtype=np.int64), counts)
+
+    def offset(self, bboxes: np.ndarray, tile_ids: np.ndarray) -> np.ndarray:
+        """
+        切块内的坐标加上切块的偏移，得到缩放后整页的坐标，除以 scale 即为原图坐标
+        """
+        bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        offsets = np.zeros((len(bboxes), 4), dtype=np.float64)
+        in_tile = tile_ids != FULL_PAGE
+        offsets[in_tile] = self.tiles[tile_ids[in_tile]][:, [0, 1, 0, 1]]
+        return bboxes + offsets
+
+
+class Tiler:
+    """
+    超大页面切成有重叠的切块批量检测，再合并切块接缝处被切开的框
+    """
+
+    def __init__(self, min_pixels: int, tile_size: int, overlap: int, max_tiles: int = 64,
+                 min_long_side: int = 0, full_page: bool = False, overlap_ratio_threshold: float = 0.8):
+        """
+        :param min_pixels: 像素数超过该值时切块
+        :param tile_size: 切块边长，决定单个切块的内存上限
+        :param overlap: 相邻切块的最小重叠像素，应大于需要完整检出的目标尺寸
+        :param max_tiles: 切块数上限，超过时先缩小整页
+        :param min_long_side: 长边超过该值时也切块（长图），0 表示不按长边判断
+        :param full_page: 同时检测缩小后的整页，保留超过单个切块的大目标
+        """
+        self.min_pixels = min_pixels
+        self.tile_size = tile_size
+        self.overlap = min(overlap, tile_size // 2)
+        self.max_tiles = max_tiles
+        self.min_long_side = min_long_side
+        self.full_page = full_page
+        self.overlap_ratio_threshold = overlap_ratio_threshold
+
+    def applies(self, width: int, height: int) -> bool:
+        if width * height > self.min_pixels:
+            return True
+        return bool(self.min_long_side) and max(width, height) > self.min_long_side
+
+    def _starts(self, length: int) -> np.ndarray:
+        if length <= self.tile_size:
+            return np.zeros(1, dtype=np.int64)
+        # 切块均匀分布，实际重叠不小于 overlap
+        n = math.ceil((length - self.tile_size) / (self.tile_size - self.overlap)) + 1
+        return np.linspace(0, length - self.tile_size, n).round().astype(np.int64)
+
+    def _count(self, width: int, height: int) -> int:
+        return len(self._starts(width)) * len(self._starts(height))
+
+    def plan(self, width: int, height: int) -> TilePlan:
+        scale = 1.0
+        while self._count(round(width * scale), round(height * scale)) > self.max_tiles:
+            scale *= 0.9
+        width, height = max(round(width * scale), 1), max(round(height * scale), 1)
+        xs, ys = self._starts(width), self._starts(height)
+        x0, y0 = np.meshgrid(xs, ys)
+        x0, y0 = x0.ravel(), y0.ravel()
+        tiles = np.stack(
+            [x0, y0, np.minimum(x0 + self.tile_size, width), np.minimum(y0 + self.tile_size, height)], axis=1
+        )
+        return TilePlan(scale, tiles, width, height, self.full_page)
+
+    def merge(self, plan: TilePlan, bboxes: np.ndarray, tile_ids: np.ndarray, labels=None, scores=None):
+        """
+        合并各切块的检测结果
+        1. 接缝两侧被切开的同一目标（同类别、公共区域内 IoU 足够大）合并为外接框
+        2. 整页检测只保留放不进任何一个切块的大目标
+        3. 重叠区域内被多个切块重复检出的目标用 find_overlap_blocks_to_remove 去重
+        :param bboxes: (n, 4) 切块内的 [x0, y0, x1, y1]
+        :param tile_ids: (n,) 每个框所属的切块序号
+        :param labels: (n,) 类别，不同类别的框不合并
+        :param scores: (n,) 置信度，合并后取最大值
+        :return: (合并后的原图坐标 (m, 4), 每个框的代表检测序号 (m,), 是否由多个框合并 (m,))
+        """
+        bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        tile_ids = np.asarray(tile_ids, dtype=np.int64)
+        n = len(bboxes)
+        if n == 0:
+            return np.zeros((0, 4), dtype=np.float64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=bool)
+        labels = np.zeros(n, dtype=np.int64) if labels is None else np.asarray(labels)
+        scores = np.ones(n, dtype=np.float64) if scores is None else np.asarray(scores, dtype=np.float64)
+
+        # 缩放后整页的坐标，便于和切块边界比较
+        page_boxes = plan.offset(bboxes, tile_ids)
+        in_tile = tile_ids != FULL_PAGE
+        keep = in_tile.copy()
+        if plan.full_page and not in_tile.all():
+            keep[~in_tile] = ~self._fits_in_tile(plan, page_boxes[~in_tile])
+
+        parent = np.arange(n)
+        cut = np.zeros(n, dtype=bool)
+        cut[in_tile] = self._touches_inner_edge(plan, page_boxes[in_tile], tile_ids[in_tile])
+        for i, j in self._seam_pairs(plan, page_boxes, tile_ids, labels, np.flatnonzero(cut)):
+            root_i, root_j = _find(parent, i), _find(parent, j)
+            if root_i != root_j:
+                parent[max(root_i, root_j)] = min(root_i, root_j)
+
+        roots = np.array([_find(parent, i) for i in range(n)])
+        groups = {}
+        for idx in np.flatnonzero(keep):
+            groups.setdefault(roots[idx], []).append(idx)
+        merged_boxes, representative, merged = [], [], []
+        for members in groups.values():
+            members = np.asarray(members)
+            group_boxes = page_boxes[members]
+            merged_boxes.append(np.concatenate([group_boxes[:, :2].min(axis=0), group_boxes[:, 2:].max(axis=0)]))
+            representative.append(members[np.argmax(scores[members])])
+            merged.append(len(members) > 1)
+        merged_boxes = np.asarray(merged_boxes).reshape(-1, 4)
+        representative = np.asarray(representative, dtype=np.int64)
+        merged = np.asarray(merged, dtype=bool)
+
+        # 重叠区域内同一目标的完整框和残片互相包含，面积大的排在前面，去重时高度相同的框删除后面的残片
+        area = (merged_boxes[:, 2] - merged_boxes[:, 0]) * (merged_boxes[:, 3] - merged_boxes[:, 1])
+        order = np.argsort(-area, kind="stable")
+        merged_boxes, representative, merged = merged_boxes[order], representative[order], merged[order]
+        removed = find_overlap_blocks_to_remove(merged_boxes, self.overlap_ratio_threshold)
+        keep = ~removed
+        return merged_boxes[keep] / plan.scale, representative[keep], merged[keep]
+
+    @staticmethod
+    def _fits_in_tile(plan: TilePlan, boxes: np.ndarray) -> np.ndarray:
+        tiles = plan.tiles[None, :, :]
+        boxes = boxes[:, None, :]
+        inside = (boxes[..., 0] >= tiles[..., 0]) & (boxes[..., 1] >= tiles[..., 1]) \
+            & (boxes[..., 2] <= tiles[..., 2]) & (boxes[..., 3] <= tiles[..., 3])
+        return inside.any(axis=1)
+
+    @staticmethod
+    def _touches_inner_edge(plan: TilePlan, boxes: np.ndarray, tile_ids: np.ndarray) -> np.ndarray:
+        """
+        框贴着切块的内部边界（不是页面边界）时可能被接缝切开
+        """
+        tiles = plan.tiles[tile_ids]
+        return ((tiles[:, 0] > 0) & (boxes[:, 0] <= tiles[:, 0] + EDGE_MARGIN)) \
+            | ((tiles[:, 1] > 0) & (boxes[:, 1] <= tiles[:, 1] + EDGE_MARGIN)) \
+            | ((tiles[:, 2] < plan.width) & (boxes[:, 2] >= tiles[:, 2] - EDGE_MARGIN)) \
+            | ((tiles[:, 3] < plan.height) & (boxes[:, 3] >= tiles[:, 3] - EDGE_MARGIN))
+
+    @staticmethod
+    def _seam_pairs(plan: TilePlan, boxes: np.ndarray, tile_ids: np.ndarray, labels: np.ndarray, candidates):
+        """
+        被切开的框两两比较: 来自不同切块、同类别，且裁剪到两个切块的公共区域后 IoU 足够大
+        """
+        if len(candidates) < 2:
+            return []
+        i, j = np.triu_indices(len(candidates), k=1)
+        i, j = candidates[i], candidates[j]
+        valid = (tile_ids[i] != tile_ids[j]) & (labels[i] == labels[j])
+        i, j = i[valid], j[valid]
+        if len(i) == 0:
+            return []
+        tile_i, tile_j = plan.tiles[tile_ids[i]], plan.tiles[tile_ids[j]]
+        shared = np.concatenate(
+            [np.maximum(tile_i[:, :2], tile_j[:, :2]), np.minimum(tile_i[:, 2:], tile_j[:, 2:])], axis=1
+        )
+        clip_i, clip_j = _clip(boxes[i], shared), _clip(boxes[j], shared)
+        inter = _area(np.concatenate(
+            [np.maximum(clip_i[:, :2], clip_j[:, :2]), np.minimum(clip_i[:, 2:], clip_j[:, 2:])], axis=1
+        ))
+        union = _area(clip_i) + _area(clip_j) - inter
+        with np.errstate(divide="ignore", invalid="ignore"):
+            matched = inter / union >= SEAM_IOU_THRESHOLD
+        return zip(i[matched].tolist(), j[matched].tolist())
+
+
+def _find(parent: np.ndarray, idx: int) -> int:
+    while parent[idx] != idx:
+        parent[idx] = parent[parent[idx]]
+        idx = parent[idx]
+    return idx
+
+
+def _clip(boxes: np.ndarray, regions: np.ndarray) -> np.ndarray:
+    return np.concatenate([np.maximum(boxes[:, :2], regions[:, :2]), np.minimum(boxes[:, 2:], regions[:, 2:])], axis=1)
+
+
+def _area(boxes: np.ndarray) -> np.ndarray:
+    return np.clip(boxes[:, 2] - boxes[:, 0], 0, None) * np.clip(boxes[:, 3] - boxes[:, 1], 0, None)
+
+
+def build_tiler(tiling_config):
+    """
+    :param tiling_config: yaml 中的 tiling 配置，未配置或 enabled 为 false 时返回 None
+    """
+    if not tiling_config or not tiling_config.get("enabled", False):
+        return None
+    return Tiler(
+        min_pixels=int(tiling_config.get("min_pixels", 20000000)),
+        tile_size=int(tiling_config.get("tile_size", 2048)),
+        overlap=int(tiling_config.get("overlap", 256)),
+        max_tiles=int(tiling_config.get("max_tiles", 64)),
+        min_long_side=int(tiling_config.get("min_long_side", 0)),
+        full_page=bool(tiling_config.get("full_page", False)),
+    )
@@ -9,6 +9,7 @@ Time: 2025/6/13 15:13
 import logging
 
 import cv2
+import html2text
 import numpy as np
 from PIL import Image
 from omegaconf import OmegaConf
@@ -17,13 +18,24 @@ from app.config.conf import BASE_DIR
 
 logger = logging.getLogger(__name__)
 
+# 块数量达到该值时重叠检测改用 sort-and-sweep，避免构造 n² 个块对
+SWEEP_MIN_BLOCKS = 256
+
 
 def load_config(config_name: str):
-    config_path = BASE_DIR / "config" / f"{config_name}.yaml"
+    config_path = BASE_DIR / f"{config_name}.yaml"
     config = OmegaConf.load(config_path)
     return config
 
 
+def html_to_markdown(html_content: str):
+    if not html_content:
+        return ""
+    converter = html2text.HTML2Text()
+    converter.ignore_links = True
+    return converter.handle(html_content)
+
+
 def colormap(N=256, normalized=False):
     """
     Generate the color map.
@@ -161,36 +173,114 @@ def calculate_area_overlap(bbox1, bbox2, overlap_ratio_threshold=0.8):
         return False  # 否则，不删除
 
 
-def remove_small_blocks_from_overlaps(result):
+def get_bboxes_from_polys(polys) -> np.ndarray:
+    """
+    批量将多边形坐标转换为 [x1, y1, x2, y2] 格式的 bbox 数组，结果与逐个调用 get_bbox_from_points 一致。
+    :param polys: 多边形坐标列表，每个元素为 [x1, y1, x2, y2, ...]
+    :return: 形状为 (n, 4) 的 float64 数组
+    """
+    if len(polys) == 0:
+        return np.zeros((0, 4), dtype=np.float64)
+    try:
+        points = np.asarray(polys, dtype=np.float64).reshape(len(polys), -1, 2)
+    except ValueError:
+        # 各个 poly 的点数不一致时逐个计算
+        return np.asarray([get_bbox_from_points(poly) for poly in polys], dtype=np.float64)
+    return np.concatenate([points.min(axis=1), points.max(axis=1)], axis=1)
+
+
+def _overlap_pairs_dense(bboxes: np.ndarray):
+    """
+    一次性计算所有 i < j 的块对，适用于块数量较少的页面。
+    """
+    i, j = np.triu_indices(len(bboxes), k=1)
+    return i, j
+
+
+def _overlap_pairs_sweep(bboxes: np.ndarray):
+    """
+    按 x1 排序后做 sort-and-sweep，只保留 x 方向上有交集的候选块对。
+    """
+    n = len(bboxes)
+    order = np.argsort(bboxes[:, 0], kind="stable")
+    x1_sorted = bboxes[order, 0]
+    x2_sorted = bboxes[order, 2]
+    # 排序后位置 a 之后、x1 小于 a 的 x2 的块都可能与 a 相交
+    ends = np.searchsorted(x1_sorted, x2_sorted, side="left")
+    counts = np.maximum(ends - np.arange(1, n + 1), 0)
+    total = int(counts.sum())
+    if total == 0:
+        empty = np.zeros(0, dtype=np.intp)
+        return empty, empty
+    a = np.repeat(np.arange(n), counts)
+    starts = np.cumsum(counts) - counts
+    b = a + 1 + (np.arange(total) - np.repeat(starts, counts))
+    ia, ib = order[a], order[b]
+    return np.minimum(ia, ib), np.maximum(ia, ib)
+
+
+def find_overlap_blocks_to_remove(bboxes, overlap_ratio_threshold=0.8, sweep_min_blocks=SWEEP_MIN_BLOCKS):
+    """
+    向量化计算需要删除的重叠块，判定规则与逐对调用 calculate_area_overlap 完全一致:
+    对每一对 i < j 的块，如果交集面积占较小块面积的比例 >= 阈值，则删除高度较小的块（高度相同时删除 j）。
+    :param bboxes: 形状为 (n, 4) 的 [x1, y1, x2, y2] 数组
+    :param overlap_ratio_threshold: 面积重叠占较小面积的阈值（默认80%）
+    :param sweep_min_blocks: 块数量达到该值时使用 sort-and-sweep 生成候选块对，否则直接枚举所有块对
+    :return: 长度为 n 的 bool 数组，True 表示需要删除
+    """
+    bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+    n = len(bboxes)
+    to_remove = np.zeros(n, dtype=bool)
+    if n < 2:
+        return to_remove
+
+    if n >= sweep_min_blocks:
+        i, j = _overlap_pairs_sweep(bboxes)
+    else:
+        i, j = _overlap_pairs_dense(bboxes)
+    if len(i) == 0:
+        return to_remove
+
+    b1, b2 = bboxes[i], bboxes[j]
+    x_left = np.maximum(b1[:, 0], b2[:, 0])
+    y_top = np.maximum(b1[:, 1], b2[:, 1])
+    x_right = np.minimum(b1[:, 2], b2[:, 2])
+    y_bottom = np.minimum(b1[:, 3], b2[:, 3])
+    intersect = (x_right > x_left) & (y_bottom > y_top)
+    if not intersect.any():
+        return to_remove
+
+    i, j = i[intersect], j[intersect]
+    b1, b2 = b1[intersect], b2[intersect]
+    overlap_area = (x_right[intersect] - x_left[intersect]) * (y_bottom[intersect] - y_top[intersect])
+    area = (bboxes[:, 2] - bboxes[:, 0]) * (bboxes[:, 3] - bboxes[:, 1])
+    smaller_area = np.minimum(area[i], area[j])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        overlapped = overlap_area / smaller_area >= overlap_ratio_threshold
+
+    i, j = i[overlapped], j[overlapped]
+    height = np.abs(bboxes[:, 3] - bboxes[:, 1])
+    smaller_first = height[i] < height[j]
+    to_remove[i[smaller_first]] = True
+    to_remove[j[~smaller_first]] = True
+    return to_remove
+
+
+def remove_small_blocks_from_overlaps(result, overlap_ratio_threshold=0.8):
     if not result:
         return result
 
     blocks = result["layout_dets"]
-    if len(blocks) == 1:
-        result["layout_dets"] = blocks
-    blocks_to_remove = []
     logger.info(f"解析到{len(blocks)}个块")
-    # 遍历每一对块
-    for i in range(len(blocks)):
-        for j in range(i + 1, len(blocks)):
-            bbox1 = get_bbox_from_points(blocks[i]["poly"])  # 转换为 [x1, y1, x2, y2]
-            bbox2 = get_bbox_from_points(blocks[j]["poly"])  # 转换为 [x1, y1, x2, y2]
-
-            # 判断是否需要删除较小的块
-            if calculate_area_overlap(bbox1, bbox2):
-                # 计算高度
-                height1 = max(bbox1[3], bbox1[1]) - min(bbox1[3], bbox1[1])
-                height2 = max(bbox2[3], bbox2[1]) - min(bbox2[3], bbox2[1])
-
-                if height1 < height2:
-                    blocks_to_remove.append(i)
-                else:
-                    blocks_to_remove.append(j)
+    if len(blocks) < 2:
+        return result
+
+    bboxes = get_bboxes_from_polys([block["poly"] for block in blocks])  # 转换为 [x1, y1, x2, y2]
+    to_remove = find_overlap_blocks_to_remove(bboxes, overlap_ratio_threshold)
 
     # 删除重叠较小的块
-    blocks_to_remove = set(blocks_to_remove)  # 去重
-    blocks = [block for idx, block in enumerate(blocks) if idx not in blocks_to_remove]
-    logger.info(f"删除了{len(blocks_to_remove)}个重叠块")
+    blocks = [block for block, removed in zip(blocks, to_remove) if not removed]
+    logger.info(f"删除了{int(to_remove.sum())}个重叠块")
     # 更新页面的块数据
     result["layout_dets"] = blocks
 
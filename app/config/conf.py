@@ -9,6 +9,8 @@ Time: 2025/6/13 18:23
 import os
 from pathlib import Path
 
+import pytz
+
 BASE_DIR = Path(__file__).resolve().parent
 
 TZ = pytz.timezone(os.getenv("TZ", "Asia/Shanghai"))
@@ -21,3 +23,106 @@ REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 REDIS_PASSWORD = os.getenv("REDIS_PASSWORD")
 REDIS_CACHE_DB = int(os.getenv("REDIS_CACHE_DB", 0))
 CELERY_BROKER_DB = int(os.getenv("CELERY_BROKER_DB", 1))
+
+# [image transport]
+# base64: 图片以 base64 字符串随任务参数传递; redis/local: 图片存入内容寻址存储，任务只传递引用
+IMAGE_TRANSPORT = os.getenv("IMAGE_TRANSPORT", "base64")
+IMAGE_STORE_DIR = os.getenv("IMAGE_STORE_DIR", "/dev/shm/pdf-extract/images")
+IMAGE_STORE_TTL = int(os.getenv("IMAGE_STORE_TTL", 3600 * 24))
+
+# [result cache]
+# redis / memory / none
+RESULT_CACHE_BACKEND = os.getenv("RESULT_CACHE_BACKEND", "redis")
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", 3600 * 24 * 7))
+RESULT_CACHE_MAXSIZE = int(os.getenv("RESULT_CACHE_MAXSIZE", 1024))  # 仅对 memory 生效
+RESULT_CACHE_MAX_ITEM_BYTES = int(os.getenv("RESULT_CACHE_MAX_ITEM_BYTES", 8 * 1024 * 1024))
+
+# [pdf]
+PDF_RENDER_DPI = int(os.getenv("PDF_RENDER_DPI", 200))
+PDF_MAX_PAGE_PIXELS = int(os.getenv("PDF_MAX_PAGE_PIXELS", 6000 * 6000))  # 超过该像素数时自动降低 DPI
+PDF_MAX_IN_FLIGHT = int(os.getenv("PDF_MAX_IN_FLIGHT", 16))  # 同一文档同时在队列中的最大页数
+PDF_DOWNLOAD_TIMEOUT = int(os.getenv("PDF_DOWNLOAD_TIMEOUT", 60))
+# 客户端提交的 pdf_path 只能是该目录下的文件（可以写相对该目录的路径），为空时不接受本地路径
+PDF_UPLOAD_DIR = os.getenv("PDF_UPLOAD_DIR", "")
+# 允许下载 pdf 的 http(s) 主机名，逗号分隔，为空时不接受 url
+PDF_URL_ALLOWED_HOSTS = {host.strip().lower() for host in os.getenv("PDF_URL_ALLOWED_HOSTS", "").split(",") if host.strip()}
+TASK_RESULT_TIMEOUT = int(os.getenv("TASK_RESULT_TIMEOUT", 600))
+
+# [job]
+JOB_TTL = int(os.getenv("JOB_TTL", 3600 * 24))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 0.5))  # SSE 推送时轮询任务状态的间隔(秒)
+# 页面检查点: redis / memory（memory 仅用于单进程调试，api 和 worker 不共享）
+CHECKPOINT_BACKEND = os.getenv("CHECKPOINT_BACKEND", "redis")
+JOB_PAGE_MAX_ATTEMPTS = int(os.getenv("JOB_PAGE_MAX_ATTEMPTS", 3))  # 单页最多执行次数（含第一次）
+JOB_RETRY_BACKOFF = float(os.getenv("JOB_RETRY_BACKOFF", 2))  # 第 n 次重试前等待 JOB_RETRY_BACKOFF * 2^(n-1) 秒
+JOB_RETRY_BACKOFF_MAX = float(os.getenv("JOB_RETRY_BACKOFF_MAX", 60))
+
+# [scheduling]
+# redis broker 的消息优先级，0 最高; kombu 默认的优先级档位为 0/3/6/9
+TASK_PRIORITY_INTERACTIVE = int(os.getenv("TASK_PRIORITY_INTERACTIVE", 0))
+TASK_PRIORITY_BULK = int(os.getenv("TASK_PRIORITY_BULK", 6))
+INTERACTIVE_MAX_PAGES = int(os.getenv("INTERACTIVE_MAX_PAGES", 8))  # 未指定通道时，超过该页数的请求和所有 pdf 走批量通道
+DEFAULT_TENANT = os.getenv("DEFAULT_TENANT", "default")  # 请求未携带 X-Tenant-Id 时的租户
+# 批量通道的租户公平分配: redis / memory / none
+FAIR_SHARE_BACKEND = os.getenv("FAIR_SHARE_BACKEND", "redis")
+BULK_MAX_IN_FLIGHT = int(os.getenv("BULK_MAX_IN_FLIGHT", 64))  # 所有租户批量页面同时在队列中的总数，由活跃租户平分
+# 租户超过该秒数没有申请份额视为已退出（如投递进程异常退出），不再参与平分，重新申请时清除旧计数
+FAIR_SHARE_TENANT_TTL = int(os.getenv("FAIR_SHARE_TENANT_TTL", TASK_RESULT_TIMEOUT))
+FAIR_SHARE_POLL_INTERVAL = float(os.getenv("FAIR_SHARE_POLL_INTERVAL", 0.2))
+
+# [page dedup]
+# 整页推理前的分流，默认关闭: 空白页直接返回空结果；版面检测在同一作用域内复用近似重复页（扫描件的重复页、同一模板的表单）的结果，
+# OCR 只跳过空白页。redis / memory / none
+PAGE_DEDUP_BACKEND = os.getenv("PAGE_DEDUP_BACKEND", "none")
+PAGE_DEDUP_SCOPE = os.getenv("PAGE_DEDUP_SCOPE", "document")  # document: 只在同一文档内复用; tenant: 同一租户的页面之间复用; none: 只跳过空白页
+PAGE_DEDUP_TTL = int(os.getenv("PAGE_DEDUP_TTL", 3600 * 24))  # 已处理页面在作用域中保留的时间(秒)
+PAGE_DEDUP_WINDOW = int(os.getenv("PAGE_DEDUP_WINDOW", 512))  # 每个哈希分段桶保留最近的页面数
+PAGE_DEDUP_MAX_DISTANCE = int(os.getenv("PAGE_DEDUP_MAX_DISTANCE", 7))  # 64 位感知哈希的汉明距离上限，只用于筛选候选页
+PAGE_DEDUP_MAX_INK_DIFF = int(os.getenv("PAGE_DEDUP_MAX_INK_DIFF", 12))  # 缩略图对齐后墨迹不一致的最大连通区域面积(px)上限，约为几个数字，增加一行明细即超过
+PAGE_BLANK_MAX_INK = int(os.getenv("PAGE_BLANK_MAX_INK", 4))  # 缩略图中墨迹像素数不超过该值视为空白页
+
+# [raw outputs]
+# 保存模型原始输出（置信度过滤、重叠块删除和排序之前的版面检测框，drop_score 过滤之前的文本行）的目录，为空时不保存。
+# 调整后处理参数后用 python -m app.core.engine.postprocess 重新后处理，不需要重新推理
+RAW_OUTPUT_DIR = os.getenv("RAW_OUTPUT_DIR", "")
+RAW_OUTPUT_SHARD_MB = int(os.getenv("RAW_OUTPUT_SHARD_MB", 256))  # 单个分片文件的大小上限
+
+# [pipeline]
+REGION_OCR_BATCH_SIZE = int(os.getenv("REGION_OCR_BATCH_SIZE", 16))  # 每个区域识别任务包含的文本区域数
+REGION_CROP_PADDING = int(os.getenv("REGION_CROP_PADDING", 4))
+REGION_TABLE_BATCH_SIZE = int(os.getenv("REGION_TABLE_BATCH_SIZE", 8))  # 每个表格识别任务包含的表格数
+REGION_FORMULA_BATCH_SIZE = int(os.getenv("REGION_FORMULA_BATCH_SIZE", 32))  # 每个公式识别任务包含的公式数
+
+# [text layer]
+TEXT_LAYER_MIN_CHARS = int(os.getenv("TEXT_LAYER_MIN_CHARS", 20))  # 内嵌文字少于该字符数的页面视为扫描页
+TEXT_LAYER_MAX_INVALID_RATIO = float(os.getenv("TEXT_LAYER_MAX_INVALID_RATIO", 0.1))  # 无法映射的字符占比上限
+TEXT_LAYER_MIN_IMAGE_AREA_RATIO = float(os.getenv("TEXT_LAYER_MIN_IMAGE_AREA_RATIO", 0.05))  # 需要单独 OCR 的图片最小面积占比
+OCR_PAGE_COST_MS = float(os.getenv("OCR_PAGE_COST_MS", 3000))  # 尚未观测到 OCR 耗时前，用于估算节省时间的单页 OCR 耗时
+
+# [worker]
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "true").lower() in ("1", "true", "yes")  # worker 启动时预加载所消费队列的模型
+# prefork 池在 fork 子进程前由主进程加载模型，子进程以写时复制方式共享权重，仅 DEVICE=cpu 时生效
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "false").lower() in ("1", "true", "yes")
+WORKER_MAX_TASKS_PER_CHILD = int(os.getenv("WORKER_MAX_TASKS_PER_CHILD", 0))  # 0 表示不按任务数回收子进程
+# 子进程内存上限(MB)，超过后执行完当前任务即回收; 0 表示自动: fork 时主进程 RSS + WORKER_MAX_MEMORY_GROWTH_MB
+WORKER_MAX_MEMORY_PER_CHILD_MB = int(os.getenv("WORKER_MAX_MEMORY_PER_CHILD_MB", 0))
+WORKER_MAX_MEMORY_GROWTH_MB = int(os.getenv("WORKER_MAX_MEMORY_GROWTH_MB", 3072))
+
+# [micro batch]
+# 大于 1 时开启动态微批，需要 worker 使用 threads 池（-P threads -c N，N 不小于该值）
+MICRO_BATCH_MAX_SIZE = int(os.getenv("MICRO_BATCH_MAX_SIZE", 1))
+MICRO_BATCH_MAX_WAIT_MS = float(os.getenv("MICRO_BATCH_MAX_WAIT_MS", 20))  # 凑批的最长等待时间
+
+# [metrics]
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() in ("1", "true", "yes")
+METRICS_SINK = os.getenv("METRICS_SINK", "none")  # none / redis，redis 时各 worker 的指标汇总到 /metrics
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", 10))  # worker 写出指标的最小间隔(秒)
+WORKER_STATS_TTL = int(os.getenv("WORKER_STATS_TTL", 3600))  # 进程的缓存/模型统计快照超过该时间(秒)未更新时不再返回
+
+# [onnxruntime]
+# 非 0 时覆盖 yaml 中 onnxruntime.intra_op_num_threads / inter_op_num_threads，prefork 多进程时按 CPU 核数 / 并发数设置
+ONNX_INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", 0))
+ONNX_INTER_OP_THREADS = int(os.getenv("ONNX_INTER_OP_THREADS", 0))
+
+# [ocr]
+OCR_CHAR_FORMAT = os.getenv("OCR_CHAR_FORMAT", "dict")  # 字符结果格式 dict / columnar
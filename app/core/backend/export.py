@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: export
+Time: 2025/7/2 11:05
+"""
+import argparse
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+
+from app.common.utils import load_config
+from app.core.backend.onnx_runtime import quantized_model_path
+
+logger = logging.getLogger(__name__)
+
+LAYOUT_TASK_NAME = "layout_detection"
+OCR_TASK_NAME = "ocr"
+TABLE_TASK_NAME = "table_parsing"
+OCR_MODELS = ("det", "rec", "cls")
+
+DEFAULT_OPSET = 13
+
+
+def export_layout(weights: str, output: str, img_size: int, dynamic: bool = False, opset: int = DEFAULT_OPSET) -> str:
+    """
+    doclayout_yolo 权重导出为 onnx
+    :param dynamic: 导出动态 batch/尺寸，predict_batch 可以一次推理多页；静态尺寸时逐页推理，CPU 上通常更快
+    """
+    from doclayout_yolo import YOLOv10
+
+    exported = YOLOv10(weights).export(format="onnx", imgsz=img_size, dynamic=dynamic, simplify=True, opset=opset)
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    shutil.move(exported, output)
+    logger.info(f"版面模型已导出: {output}")
+    return output
+
+
+def export_paddle(model_dir: str, output: str, opset: int = DEFAULT_OPSET) -> str:
+    """
+    PaddleOCR 推理模型（inference.pdmodel / inference.pdiparams）通过 paddle2onnx 导出为 onnx
+    """
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    subprocess.run(
+        [
+            "paddle2onnx",
+            "--model_dir", model_dir,
+            "--model_filename", "inference.pdmodel",
+            "--params_filename", "inference.pdiparams",
+            "--save_file", output,
+            "--opset_version", str(opset),
+            "--enable_onnx_checker", "True",
+        ],
+        check=True,
+    )
+    logger.info(f"{model_dir} 已导出: {output}")
+    return output
+
+
+def quantize(model_path: str, output: str = None, op_types: list = None, per_channel: bool = False) -> str:
+    """
+    INT8 动态量化: 权重离线量化为 int8，激活在推理时按批动态量化，不需要校准数据
+    :param op_types: 需要量化的算子，默认为 onnxruntime 支持动态量化的全部算子；
+        卷积模型的 ConvInteger 在部分 CPU 上反而更慢，可以只量化 MatMul
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    output = output or quantized_model_path(model_path)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # 量化前先做形状推断和图优化，失败时直接量化原模型
+        source = os.path.join(tmp_dir, "preprocessed.onnx")
+        try:
+            quant_pre_process(model_path, source)
+        except Exception as e:
+            logger.warning(f"量化预处理失败，直接量化原模型: {e}")
+            source = model_path
+        quantize_dynamic(
+            source, output, weight_type=QuantType.QInt8, op_types_to_quantize=op_types, per_channel=per_channel
+        )
+    logger.info(f"量化模型已导出: {output}")
+    return output
+
+
+def main():
+    parser = argparse.ArgumentParser(description="export models for the onnxruntime backend")
+    parser.add_argument("task", choices=["layout", "ocr", "table"])
+    parser.add_argument("--models", nargs="+", choices=OCR_MODELS, default=["det", "rec"], help="ocr 需要导出的模型")
+    parser.add_argument("--dynamic", action="store_true", help="版面模型导出动态 batch/尺寸")
+    parser.add_argument("--opset", type=int, default=DEFAULT_OPSET)
+    parser.add_argument("--quantize", action="store_true", help="同时导出 INT8 动态量化模型 (*.int8.onnx)")
+    parser.add_argument("--op-types", nargs="+", default=None, help="需要量化的算子，如 MatMul Conv")
+    parser.add_argument("--per-channel", action="store_true")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    outputs = []
+    if args.task == "layout":
+        model_config = load_config(LAYOUT_TASK_NAME)[LAYOUT_TASK_NAME].model_config
+        outputs.append(export_layout(
+            model_config.model_path, model_config.onnxruntime.model_path, model_config.get("img_size", 1024),
+            args.dynamic, args.opset,
+        ))
+    elif args.task == "table":
+        model_config = load_config(TABLE_TASK_NAME)[TABLE_TASK_NAME].model_config
+        outputs.append(export_paddle(
+            model_config.table_model_dir, model_config.onnxruntime.table_model_path, args.opset
+        ))
+    else:
+        model_config = load_config(OCR_TASK_NAME)[OCR_TASK_NAME].model_config
+        for name in args.models:
+            outputs.append(export_paddle(
+                model_config[f"{name}_model_dir"], model_config.onnxruntime[f"{name}_model_path"], args.opset
+            ))
+
+    if args.quantize:
+        for output in outputs:
+            quantize(output, op_types=args.op_types, per_channel=args.per_channel)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: onnx_runtime
+Time: 2025/7/2 09:45
+"""
+import logging
+import os
+import threading
+from pathlib import Path
+
+from app.config.conf import ONNX_INTER_OP_THREADS, ONNX_INTRA_OP_THREADS
+
+logger = logging.getLogger(__name__)
+
+# 推理后端
+BACKEND_TORCH = "torch"
+BACKEND_PADDLE = "paddle"
+BACKEND_ONNXRUNTIME = "onnxruntime"
+
+DEFAULT_PROVIDERS = ("CPUExecutionProvider",)
+QUANTIZED_SUFFIX = ".int8.onnx"
+
+
+def get_backend(model_config, default: str) -> str:
+    """
+    :param model_config: yaml 中的 model_config
+    :param default: 未配置 backend 时使用的原生后端
+    """
+    return str(model_config.get("backend") or default).lower()
+
+
+def quantized_model_path(model_path: str) -> str:
+    """
+    INT8 动态量化模型的路径: xxx.onnx -> xxx.int8.onnx
+    """
+    path = Path(model_path)
+    return str(path.with_name(path.stem + QUANTIZED_SUFFIX))
+
+
+def resolve_model_path(model_path: str, ort_config, name: str = None) -> str:
+    """
+    ort_config.quantized 为 true，或为模型名列表且包含 name 时，使用量化后的模型
+    """
+    quantized = ort_config.get("quantized", False)
+    if not isinstance(quantized, bool):
+        quantized = name in quantized
+    return quantized_model_path(model_path) if quantized else model_path
+
+
+def build_session_options(ort_config):
+    """
+    :param ort_config: yaml 中的 onnxruntime 配置，线程数为 0 时由 onnxruntime 决定；
+        环境变量 ONNX_INTRA_OP_THREADS / ONNX_INTER_OP_THREADS 优先于 yaml
+    """
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    intra_op_threads = ONNX_INTRA_OP_THREADS or int(ort_config.get("intra_op_num_threads", 0))
+    inter_op_threads = ONNX_INTER_OP_THREADS or int(ort_config.get("inter_op_num_threads", 0))
+    options.intra_op_num_threads = intra_op_threads
+    options.inter_op_num_threads = inter_op_threads
+    # inter_op 线程只在并行执行模式下使用
+    options.execution_mode = ort.ExecutionMode.ORT_PARALLEL if inter_op_threads > 1 \
+        else ort.ExecutionMode.ORT_SEQUENTIAL
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return options
+
+
+def get_providers(ort_config) -> list:
+    """
+    按配置顺序选择可用的 execution provider，例如 [OpenVINOExecutionProvider, CPUExecutionProvider]
+    """
+    import onnxruntime as ort
+
+    available = ort.get_available_providers()
+    configured = list(ort_config.get("providers", DEFAULT_PROVIDERS))
+    providers = [provider for provider in configured if provider in available]
+    if len(providers) < len(configured):
+        logger.warning(f"onnxruntime 不支持{sorted(set(configured) - set(providers))}，可用的 provider: {available}")
+    return providers or list(DEFAULT_PROVIDERS)
+
+
+def create_session(model_path: str, ort_config):
+    import onnxruntime as ort
+
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"onnx 模型不存在: {model_path}，先执行 python -m app.core.backend.export 导出")
+    session = ort.InferenceSession(
+        model_path, sess_options=build_session_options(ort_config), providers=get_providers(ort_config)
+    )
+    logger.info(f"加载 onnx 模型 {model_path}，providers: {session.get_providers()}")
+    return session
+
+
+class OnnxSession:
+    """
+    延迟创建的 InferenceSession。
+    onnxruntime 在创建会话时即启动线程池，父进程创建过会话后 fork 出的子进程再推理或创建会话会卡死，
+    所以会话在第一次推理的进程中创建，prefork 主进程预加载模型时不会创建会话
+    """
+
+    def __init__(self, model_path: str, ort_config):
+        self.model_path = model_path
+        self.ort_config = ort_config
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = create_session(self.model_path, self.ort_config)
+                    self._pid = os.getpid()
+        elif self._pid != os.getpid():
+            raise RuntimeError(f"onnx 会话在进程{self._pid}中创建，不能在 fork 出的子进程中使用")
+        return self._session
+
+    def get_inputs(self):
+        return self.session.get_inputs()
+
+    def run(self, output_names, input_feed: dict):
+        return self.session.run(output_names, input_feed)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: yolo_onnx
+Time: 2025/7/2 10:20
+"""
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from app.core.backend.onnx_runtime import OnnxSession, resolve_model_path
+
+# 与 ultralytics Results 一致的字段，LayoutYOLOv10._format_result 无需区分后端
+OnnxBoxes = namedtuple("OnnxBoxes", ["xyxy", "cls", "conf"])
+OnnxResult = namedtuple("OnnxResult", ["boxes"])
+
+PAD_VALUE = 114
+
+
+def letterbox(image: np.ndarray, height: int, width: int):
+    """
+    等比缩放后居中填充到 (height, width)，与 ultralytics LetterBox(auto=False) 一致
+    :return: 填充后的图片, 缩放比例, (左侧填充, 顶部填充)
+    """
+    h, w = image.shape[:2]
+    ratio = min(height / h, width / w)
+    new_w, new_h = int(round(w * ratio)), int(round(h * ratio))
+    if (new_w, new_h) != (w, h):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    pad_w, pad_h = (width - new_w) / 2, (height - new_h) / 2
+    top, bottom = int(round(pad_h - 0.1)), int(round(pad_h + 0.1))
+    left, right = int(round(pad_w - 0.1)), int(round(pad_w + 0.1))
+    image = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(PAD_VALUE,) * 3)
+    return image, ratio, (left, top)
+
+
+class YOLOv10Onnx:
+    """
+    onnxruntime 上的 YOLOv10 推理，predict 的参数与返回值与 doclayout_yolo.YOLOv10.predict 一致。
+    YOLOv10 导出的模型自带端到端后处理，输出 (batch, 300, 6): x0, y0, x1, y1, score, class，不需要 NMS
+    """
+
+    def __init__(self, config):
+        """
+        :param config: layout_detection.yaml 中的 model_config
+        """
+        ort_config = config.get("onnxruntime", {})
+        self.session = OnnxSession(resolve_model_path(ort_config["model_path"], ort_config), ort_config)
+        self.img_size = config.get("img_size", 1024)
+        # 与 YOLOv10.predict 的默认置信度一致
+        self.conf_thres = config.get("conf_thres", 0.25)
+        self._input = None
+
+    @property
+    def input_meta(self):
+        """
+        :return: (输入名, 是否支持动态 batch, 输入高, 输入宽)
+        """
+        if self._input is None:
+            model_input = self.session.get_inputs()[0]
+            batch, _, height, width = model_input.shape
+            self._input = (
+                model_input.name,
+                not isinstance(batch, int) or batch > 1,
+                height if isinstance(height, int) else self.img_size,
+                width if isinstance(width, int) else self.img_size,
+            )
+        return self._input
+
+    def predict(self, source, iou=None, verbose=False, device=None, conf=None):
+        """
+        :param source: BGR 图片或图片列表
+        :param iou: 兼容 YOLOv10.predict，端到端模型不使用
+        :return: 与输入一一对应的 OnnxResult 列表
+        """
+        images = source if isinstance(source, list) else [source]
+        name, dynamic_batch, height, width = self.input_meta
+        conf = self.conf_thres if conf is None else conf
+
+        inputs, metas = [], []
+        for image in images:
+            padded, ratio, pad = letterbox(image, height, width)
+            inputs.append(padded[..., ::-1].transpose(2, 0, 1))
+            metas.append((ratio, pad, image.shape[:2]))
+        blob = np.ascontiguousarray(np.stack(inputs), dtype=np.float32) / 255.0
+
+        if dynamic_batch:
+            outputs = self.session.run(None, {name: blob})[0]
+        else:
+            outputs = np.concatenate([self.session.run(None, {name: blob[i:i + 1]})[0] for i in range(len(blob))])
+        return [self._postprocess(output, meta, conf) for output, meta in zip(outputs, metas)]
+
+    @staticmethod
+    def _postprocess(output: np.ndarray, meta, conf: float):
+        ratio, (left, top), (height, width) = meta
+        output = output[output[:, 4] > conf]
+        boxes = output[:, :4].copy()
+        boxes[:, [0, 2]] = ((boxes[:, [0, 2]] - left) / ratio).clip(0, width)
+        boxes[:, [1, 3]] = ((boxes[:, [1, 3]] - top) / ratio).clip(0, height)
+        return OnnxResult(OnnxBoxes(xyxy=boxes, cls=output[:, 5], conf=output[:, 4]))
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: batching
+Time: 2025/6/27 16:40
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+from app.config.conf import MICRO_BATCH_MAX_SIZE, MICRO_BATCH_MAX_WAIT_MS
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    动态微批: 多个线程各自提交单张图片，后台线程收集最多 max_batch_size 张、或等待最多 max_wait_ms 毫秒后
+    调用一次 predict_batch，再把结果分别交还给各自的提交方。
+    配合 celery threads 池使用（-P threads -c N），同一 worker 中并发执行的 N 个任务的图片会合并成一次推理。
+    """
+
+    def __init__(self, predict_batch, max_batch_size: int = MICRO_BATCH_MAX_SIZE,
+                 max_wait_ms: float = MICRO_BATCH_MAX_WAIT_MS, name: str = "batcher"):
+        """
+        :param predict_batch: 接收输入列表、返回等长结果列表的批量推理函数
+        """
+        self.predict_batch = predict_batch
+        self.max_batch_size = max(int(max_batch_size), 1)
+        self.max_wait = max(max_wait_ms, 0) / 1000
+        self.name = name
+        self._histogram = Counter()
+        self._stats_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+
+    def submit(self, item) -> Future:
+        future = Future()
+        self._ensure_started().put((item, future))
+        return future
+
+    def predict(self, items: list) -> list:
+        """
+        提交多张图片并等待全部结果
+        """
+        futures = [self.submit(item) for item in items]
+        return [future.result() for future in futures]
+
+    def _ensure_started(self):
+        # 后台线程不会随 fork 复制到子进程，子进程第一次提交时重新创建
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return self._queue
+        with self._start_lock:
+            if self._pid != os.getpid() or not self._thread.is_alive():
+                self._queue = queue.Queue()
+                self._thread = threading.Thread(
+                    target=self._run, args=(self._queue,), name=f"{self.name}-micro-batch", daemon=True
+                )
+                self._thread.start()
+                self._pid = os.getpid()
+        return self._queue
+
+    def _run(self, pending: queue.Queue):
+        while True:
+            batch = [pending.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                try:
+                    timeout = deadline - time.monotonic()
+                    batch.append(pending.get(timeout=timeout) if timeout > 0 else pending.get_nowait())
+                except queue.Empty:
+                    break
+            self._execute(batch)
+
+    def _execute(self, batch: list):
+        items = [item for item, _ in batch]
+        futures = [future for _, future in batch]
+        try:
+            results = self.predict_batch(items)
+            if len(results) != len(items):
+                raise ValueError(f"predict_batch returned {len(results)} results for {len(items)} inputs")
+        except Exception as e:
+            logger.exception(f"{self.name} 批量推理失败，批大小{len(items)}")
+            for future in futures:
+                future.set_exception(e)
+        else:
+            for future, result in zip(futures, results):
+                future.set_result(result)
+        with self._stats_lock:
+            self._histogram[len(items)] += 1
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            histogram = dict(sorted(self._histogram.items()))
+        batches = sum(histogram.values())
+        items = sum(size * count for size, count in histogram.items())
+        return {
+            "name": self.name,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": batches,
+            "items": items,
+            "mean_batch_size": round(items / batches, 2) if batches else 0,
+            "histogram": histogram,
+        }
+
+
+def build_micro_batcher(predict_batch, name: str, max_batch_size: int = MICRO_BATCH_MAX_SIZE,
+                        max_wait_ms: float = MICRO_BATCH_MAX_WAIT_MS):
+    """
+    max_batch_size <= 1 时不开启微批，返回 None
+    """
+    if max_batch_size <= 1:
+        return None
+    return MicroBatcher(predict_batch, max_batch_size, max_wait_ms, name=name)
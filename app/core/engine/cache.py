@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: cache
+Time: 2025/6/18 15:40
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from omegaconf import OmegaConf
+
+from app.config.conf import (
+    BASE_DIR,
+    RESULT_CACHE_BACKEND,
+    RESULT_CACHE_TTL,
+    RESULT_CACHE_MAXSIZE,
+    RESULT_CACHE_MAX_ITEM_BYTES,
+)
+from app.core.engine.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# 结果格式变化时修改该版本号，使旧的缓存全部失效
+CACHE_VERSION = 1
+
+
+class CacheBackend:
+    def get(self, key: str):
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes):
+        raise NotImplementedError
+
+
+class LRUCacheBackend(CacheBackend):
+    """
+    进程内 LRU 缓存，主要用于测试和单机调试
+    """
+
+    def __init__(self, maxsize: int = RESULT_CACHE_MAXSIZE, ttl: int = RESULT_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expire_at, value = item
+            if self.ttl and expire_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    存储在 REDIS_CACHE_DB 中，过期由 ttl 控制，容量淘汰依赖 redis 的 maxmemory-policy（建议 allkeys-lru）
+    """
+    key_prefix = "result:"
+
+    def __init__(self, client=None, ttl: int = RESULT_CACHE_TTL):
+        self.client = client or get_redis_client()
+        self.ttl = ttl
+
+    def get(self, key: str):
+        return self.client.get(self.key_prefix + key)
+
+    def set(self, key: str, value: bytes):
+        self.client.set(self.key_prefix + key, value, ex=self.ttl or None)
+
+
+def config_fingerprint(config) -> str:
+    """
+    根据模型配置（模型路径、阈值等）以及模型文件的大小和修改时间计算指纹
+    """
+    if OmegaConf.is_config(config):
+        config = OmegaConf.to_container(config, resolve=True)
+    model_files = {}
+    for key, value in sorted(config.items()):
+        if key.endswith(("model_path", "model_dir")) and value:
+            path = value if os.path.isabs(value) else BASE_DIR.parent / value
+            if os.path.exists(path):
+                stat = os.stat(path)
+                model_files[key] = [stat.st_size, int(stat.st_mtime)]
+    content = json.dumps({"version": CACHE_VERSION, "config": config, "model_files": model_files},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+
+
+class ResultCache:
+    """
+    模型结果缓存，key 为 namespace + 模型配置指纹 + 图片字节的 sha256
+    """
+
+    def __init__(self, backend: CacheBackend, namespace: str, config, max_item_bytes: int = RESULT_CACHE_MAX_ITEM_BYTES):
+        self.backend = backend
+        self.namespace = namespace
+        self.fingerprint = config_fingerprint(config)
+        self.max_item_bytes = max_item_bytes
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def key(self, image_bytes: bytes) -> str:
+        return f"{self.namespace}:{self.fingerprint}:{hashlib.sha256(image_bytes).hexdigest()}"
+
+    def get(self, image_bytes: bytes):
+        try:
+            value = self.backend.get(self.key(image_bytes))
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"读取结果缓存失败: {e}")
+            value = None
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(value)
+
+    def set(self, image_bytes: bytes, result):
+        value = json.dumps(result, ensure_ascii=False).encode("utf-8")
+        if len(value) > self.max_item_bytes:
+            logger.info(f"结果大小{len(value)}超过缓存上限，不缓存")
+            return
+        try:
+            self.backend.set(self.key(image_bytes), value)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"写入结果缓存失败: {e}")
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "namespace": self.namespace,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class NullResultCache:
+    """
+    关闭缓存时使用，接口与 ResultCache 一致
+    """
+
+    def __init__(self, namespace: str = ""):
+        self.namespace = namespace
+        self.misses = 0
+
+    def get(self, image_bytes: bytes):
+        self.misses += 1
+        return None
+
+    def set(self, image_bytes: bytes, result):
+        pass
+
+    def stats(self) -> dict:
+        return {"namespace": self.namespace, "hits": 0, "misses": self.misses, "errors": 0, "hit_rate": 0.0}
+
+
+class HammingMemo:
+    """
+    按感知哈希近似匹配的结果缓存: 哈希的汉明距离不超过 max_distance 视为同一内容。
+    max_distance 为 0 时直接以哈希为键读写 ResultCache，每个结果单独一个条目；
+    大于 0 时哈希相近的条目放在同一个桶里（桶键由调用方根据图片的粗粒度特征计算），
+    每个桶是 ResultCache 中的一个列表，最多保留最近写入的 bucket_size 条
+    """
+
+    def __init__(self, cache, max_distance: int, bucket_size: int = 256):
+        """
+        :param cache: ResultCache 或 NullResultCache
+        :param bucket_size: 只在 max_distance 大于 0 时使用
+        """
+        self.cache = cache
+        self.max_distance = max_distance
+        self.bucket_size = bucket_size
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _bucket_key(bucket) -> bytes:
+        return f"bucket:{bucket}".encode("utf-8")
+
+    @staticmethod
+    def _exact_key(phash: bytes) -> bytes:
+        return b"phash:" + phash
+
+    def lookup(self, buckets: list, phash: bytes):
+        """
+        :param buckets: 需要检查的桶，依次查找; max_distance 为 0 时不使用
+        :return: 距离最近且不超过 max_distance 的结果，没有时返回 None
+        """
+        if self.max_distance == 0:
+            best = self.cache.get(self._exact_key(phash))
+        else:
+            best = self._lookup_buckets(buckets, phash)
+        if best is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return best
+
+    def _lookup_buckets(self, buckets: list, phash: bytes):
+        bits = np.unpackbits(np.frombuffer(phash, dtype=np.uint8))
+        best, best_distance = None, self.max_distance + 1
+        for bucket in buckets:
+            entries = self.cache.get(self._bucket_key(bucket)) or []
+            if not entries:
+                continue
+            stored = np.unpackbits(
+                np.frombuffer(b"".join(bytes.fromhex(item[0]) for item in entries), dtype=np.uint8)
+            ).reshape(len(entries), -1)
+            if stored.shape[1] != len(bits):
+                continue
+            distances = (stored != bits).sum(axis=1)
+            idx = int(distances.argmin())
+            if distances[idx] < best_distance:
+                best, best_distance = entries[idx][1], int(distances[idx])
+        return best
+
+    def add(self, bucket, phash: bytes, result):
+        """
+        max_distance 大于 0 时读-改-写整个桶，并发写入同一个桶时可能丢失条目，只影响命中率
+        """
+        if self.max_distance == 0:
+            self.cache.set(self._exact_key(phash), result)
+            return
+        key = self._bucket_key(bucket)
+        entries = self.cache.get(key) or []
+        entries.insert(0, [phash.hex(), result])
+        self.cache.set(key, entries[:self.bucket_size])
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            **self.cache.stats(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+def build_result_cache(namespace: str, config, backend: str = RESULT_CACHE_BACKEND):
+    """
+    :param namespace: 缓存命名空间，一般为任务名
+    :param config: 模型配置，用于计算指纹
+    :param backend: redis / memory / none
+    """
+    if backend == "redis":
+        return ResultCache(RedisCacheBackend(), namespace, config)
+    if backend == "memory":
+        return ResultCache(LRUCacheBackend(), namespace, config)
+    if backend == "none":
+        return NullResultCache(namespace)
+    raise ValueError(f"unsupported result cache backend: {backend}")
@@ -7,22 +7,52 @@ File: celery_task
 Time: 2025/6/16 14:31
 """
 from celery import Celery
+from celery.backends.redis import RedisBackend
 from kombu import Queue
 
-from app.config.conf import TZ, REDIS_HOST, REDIS_PORT, REDIS_PASSWORD, CELERY_BROKER_DB
+from app.common.metrics import STAGE_SERIALIZE, timer
+
+from app.config.conf import (
+    TZ,
+    REDIS_HOST,
+    REDIS_PORT,
+    REDIS_PASSWORD,
+    CELERY_BROKER_DB,
+    WORKER_MAX_TASKS_PER_CHILD,
+    WORKER_MAX_MEMORY_PER_CHILD_MB,
+)
 
 # Task name
 default_layout_task = "default_layout_task"
+batch_layout_task = "batch_layout_task"
 default_ocr_task = "default_ocr_task"
+batch_ocr_task = "batch_ocr_task"
 table_ocr_task = "table_ocr_task"
+batch_table_ocr_task = "batch_table_ocr_task"
 latex_ocr_task = "latex_ocr_task"
+batch_latex_ocr_task = "batch_latex_ocr_task"
+pdf_ingest_task = "pdf_ingest_task"
+layout_guided_ocr_task = "layout_guided_ocr_task"
+region_ocr_task = "region_ocr_task"
+merge_regions_task = "merge_regions_task"
+
+
+class TimedRedisBackend(RedisBackend):
+    """
+    记录任务结果写入 result backend 前的序列化耗时（serialize 阶段）
+    """
+
+    def encode(self, data):
+        with timer(STAGE_SERIALIZE):
+            return super().encode(data)
 
 
 class Config:
     broker_url = (
         f"redis://:{REDIS_PASSWORD}@{REDIS_HOST}:{REDIS_PORT}/{CELERY_BROKER_DB}"
     )
-    result_backend = broker_url
+    # "<backend 类>+<url>"，连接参数与 redis backend 相同
+    result_backend = f"{__name__}:TimedRedisBackend+{broker_url}"
 
     task_serializer = "json"
     result_serializer = "json"
@@ -34,13 +64,17 @@ class Config:
     # task config
     # task_ignore_result = True  # 是否全局设置任务忽略结果
     task_track_started = (
-        False  # 当任务启动时报告,需要注意此设置和ignore_result相关配置冲突
+        True  # 当任务启动时报告,需要注意此设置和ignore_result相关配置冲突; 异步任务接口依赖 STARTED 状态展示进度
     )
     task_acks_late = False
+    # 交互/批量通道通过消息优先级区分（redis 中 0 最高），chord、replace 产生的子任务沿用父任务的优先级
+    task_inherit_parent_priority = True
 
     # worker config
     worker_prefetch_multiplier = 1  # 每个worker每次IO所获取的任务数量
-    worker_max_tasks_per_child = 1000  # 执行该任务数后销毁重建新进程
+    worker_max_tasks_per_child = WORKER_MAX_TASKS_PER_CHILD or None  # 执行该任务数后销毁重建新进程
+    # 子进程 RSS 超过该值(KB)后销毁重建，未配置时由 registry 在 worker_init 时按主进程 RSS 自动设置
+    worker_max_memory_per_child = WORKER_MAX_MEMORY_PER_CHILD_MB * 1024 or None
     worker_cancel_long_running_tasks_on_connection_loss = False
 
     # 开启监控
@@ -56,15 +90,26 @@ class Config:
     task_queues = (
         Queue("layout_task_queue"),
         Queue("ocr_task_queue"),
+        Queue("ingest_task_queue"),
+        Queue("table_task_queue"),
+        Queue("formula_task_queue"),
     )
 
     task_routes = (
         [
             (default_layout_task, {"queue": "layout_task_queue"}),
+            (batch_layout_task, {"queue": "layout_task_queue"}),
             (default_ocr_task, {"queue": "ocr_task_queue"}),
-            (table_ocr_task, {"queue": "ocr_task_queue"}),
-            (latex_ocr_task, {"queue": "ocr_task_queue"}),
-        ]
+            (batch_ocr_task, {"queue": "ocr_task_queue"}),
+            (table_ocr_task, {"queue": "table_task_queue"}),
+            (batch_table_ocr_task, {"queue": "table_task_queue"}),
+            (latex_ocr_task, {"queue": "formula_task_queue"}),
+            (batch_latex_ocr_task, {"queue": "formula_task_queue"}),
+            (pdf_ingest_task, {"queue": "ingest_task_queue"}),
+            (layout_guided_ocr_task, {"queue": "layout_task_queue"}),
+            (region_ocr_task, {"queue": "ocr_task_queue"}),
+            (merge_regions_task, {"queue": "ocr_task_queue"}),
+        ],
     )
 
     beat_schedule = {}
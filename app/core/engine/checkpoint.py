@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: checkpoint
+Time: 2025/7/6 10:20
+"""
+import json
+import threading
+
+from app.config.conf import CHECKPOINT_BACKEND, JOB_TTL
+from app.core.engine.redis_client import get_redis_client
+
+
+class CheckpointStore:
+    """
+    文档任务的页面检查点: 每页成功后保存结果，失败时记录尝试次数和最后一次错误。
+    恢复任务时跳过已保存的页面，整篇文档的结果由检查点按页码组装
+    """
+
+    def save_page(self, job_id: str, page_no: int, result: dict):
+        raise NotImplementedError
+
+    def load_pages(self, job_id: str) -> dict:
+        """
+        :return: {页码: 单页结果}
+        """
+        raise NotImplementedError
+
+    def done_pages(self, job_id: str) -> set:
+        raise NotImplementedError
+
+    def record_failure(self, job_id: str, page_no: int, error: str) -> int:
+        """
+        :return: 该页累计失败次数
+        """
+        raise NotImplementedError
+
+    def failures(self, job_id: str) -> dict:
+        """
+        :return: {页码: {"attempts": 失败次数, "error": 最后一次错误}}，页面成功后移除
+        """
+        raise NotImplementedError
+
+    def assemble(self, job_id: str, total: int) -> dict:
+        """
+        按页码组装文档结果，未完成的页面列在 missing 中
+        """
+        pages = self.load_pages(job_id)
+        return {
+            "job_id": job_id,
+            "total": total,
+            "pages": {page_no: pages[page_no] for page_no in sorted(pages)},
+            "missing": [page_no for page_no in range(total) if page_no not in pages],
+            "failures": self.failures(job_id),
+        }
+
+
+class RedisCheckpointStore(CheckpointStore):
+    """
+    存储在 REDIS_CACHE_DB 中，与 JobStore 的过期时间一致:
+        checkpoint:{job_id}:pages     hash，页码 -> 单页结果
+        checkpoint:{job_id}:failures  hash，页码 -> 失败次数和错误
+    """
+
+    def __init__(self, client=None, ttl: int = JOB_TTL):
+        self.client = client or get_redis_client()
+        self.ttl = ttl
+
+    @staticmethod
+    def _pages_key(job_id: str) -> str:
+        return f"checkpoint:{job_id}:pages"
+
+    @staticmethod
+    def _failures_key(job_id: str) -> str:
+        return f"checkpoint:{job_id}:failures"
+
+    def save_page(self, job_id: str, page_no: int, result: dict):
+        pipe = self.client.pipeline()
+        pipe.hset(self._pages_key(job_id), page_no, json.dumps(result, ensure_ascii=False))
+        pipe.expire(self._pages_key(job_id), self.ttl)
+        pipe.hdel(self._failures_key(job_id), page_no)
+        pipe.execute()
+
+    def load_pages(self, job_id: str) -> dict:
+        return {int(page_no): json.loads(value) for page_no, value in self.client.hgetall(self._pages_key(job_id)).items()}
+
+    def done_pages(self, job_id: str) -> set:
+        return {int(page_no) for page_no in self.client.hkeys(self._pages_key(job_id))}
+
+    def record_failure(self, job_id: str, page_no: int, error: str) -> int:
+        key = self._failures_key(job_id)
+        value = self.client.hget(key, page_no)
+        attempts = (json.loads(value)["attempts"] if value else 0) + 1
+        self.client.hset(key, page_no, json.dumps({"attempts": attempts, "error": error}, ensure_ascii=False))
+        self.client.expire(key, self.ttl)
+        return attempts
+
+    def failures(self, job_id: str) -> dict:
+        return {int(page_no): json.loads(value) for page_no, value in self.client.hgetall(self._failures_key(job_id)).items()}
+
+
+class MemoryCheckpointStore(CheckpointStore):
+    """
+    进程内检查点，用于单机调试和测试
+    """
+
+    def __init__(self):
+        self._pages = {}
+        self._failures = {}
+        self._lock = threading.Lock()
+
+    def save_page(self, job_id: str, page_no: int, result: dict):
+        with self._lock:
+            self._pages.setdefault(job_id, {})[page_no] = result
+            self._failures.get(job_id, {}).pop(page_no, None)
+
+    def load_pages(self, job_id: str) -> dict:
+        with self._lock:
+            return dict(self._pages.get(job_id, {}))
+
+    def done_pages(self, job_id: str) -> set:
+        with self._lock:
+            return set(self._pages.get(job_id, {}))
+
+    def record_failure(self, job_id: str, page_no: int, error: str) -> int:
+        with self._lock:
+            failures = self._failures.setdefault(job_id, {})
+            attempts = failures.get(page_no, {}).get("attempts", 0) + 1
+            failures[page_no] = {"attempts": attempts, "error": error}
+            return attempts
+
+    def failures(self, job_id: str) -> dict:
+        with self._lock:
+            return {page_no: dict(value) for page_no, value in self._failures.get(job_id, {}).items()}
+
+
+def build_checkpoint_store(backend: str = CHECKPOINT_BACKEND) -> CheckpointStore:
+    """
+    :param backend: redis / memory
+    """
+    if backend == "redis":
+        return RedisCheckpointStore()
+    if backend == "memory":
+        return MemoryCheckpointStore()
+    raise ValueError(f"unsupported checkpoint backend: {backend}")
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: dedup
+Time: 2025/7/6 16:10
+"""
+import json
+import logging
+import threading
+import time
+import uuid
+import zlib
+from collections import deque
+
+import cv2
+import numpy as np
+
+from app.common.image import dct_hash
+from app.common.metrics import STAGE_PAGE_DEDUP, timer
+from app.config.conf import (
+    PAGE_BLANK_MAX_INK,
+    PAGE_DEDUP_BACKEND,
+    PAGE_DEDUP_MAX_DISTANCE,
+    PAGE_DEDUP_MAX_INK_DIFF,
+    PAGE_DEDUP_SCOPE,
+    PAGE_DEDUP_TTL,
+    PAGE_DEDUP_WINDOW,
+)
+from app.core.engine.cache import config_fingerprint
+from app.core.engine.redis_client import get_redis_client
+from app.core.engine.scheduling import normalize_tenant
+
+logger = logging.getLogger(__name__)
+
+# 缩略图宽度(px)，高度按页面宽高比。空白页判断、感知哈希和版面级别的比较都在缩略图上进行，
+# 150dpi 的 A4 页面缩小约 5 倍，一个 10pt 数字约占 3 x 4 个像素，2 x 2 的扫描噪点被平均到背景中
+THUMB_WIDTH = 256
+# 与页面背景（中位数灰度）相差超过该值的像素视为墨迹，深色背景上的浅色文字同样计入
+INK_CONTRAST = 48
+# 墨迹强度的量化位数，降低索引中缩略图的存储大小
+INK_LEVEL_BITS = 4
+# 比较前对墨迹强度图和差异图做高斯平滑的 sigma(px)，消除 JPEG 压缩和亚像素偏移带来的笔画边缘差异
+INK_BLUR = 1.0
+# 对齐、平滑后墨迹强度相差超过该值的像素视为不一致
+DIFF_CONTRAST = 40
+HASH_BITS = 64
+# 每页最多比较的候选页数，按哈希距离从近到远
+MAX_CANDIDATES = 4
+# 只做空白页分流、不查找近似重复页的作用域
+BLANK_ONLY_SCOPE = ""
+
+
+class PageFingerprint:
+    """
+    整页图片的分流特征: 64 位 DCT 感知哈希用于索引，缩略图的墨迹强度用于确认两页的版面一致
+    """
+
+    def __init__(self, phash: int, size, ink: np.ndarray, content: int):
+        """
+        :param size: 原图尺寸 (width, height)，只有尺寸相同的页面才复用结果
+        :param ink: 量化到 INK_LEVEL_BITS 位的 uint8 墨迹强度缩略图
+        :param content: 缩略图中的墨迹像素数
+        """
+        self.phash = phash
+        self.size = tuple(size)
+        self.ink = ink
+        self.content = content
+        self._intensity = None
+
+    def meta(self) -> dict:
+        return {"phash": self.phash, "size": list(self.size), "shape": list(self.ink.shape), "content": self.content}
+
+    def pack_ink(self) -> bytes:
+        return zlib.compress(self.ink.tobytes())
+
+    @classmethod
+    def from_stored(cls, meta: dict, ink: bytes) -> "PageFingerprint":
+        ink = np.frombuffer(zlib.decompress(ink), dtype=np.uint8).reshape(meta["shape"])
+        return cls(meta["phash"], meta["size"], ink, meta["content"])
+
+    def intensity(self) -> np.ndarray:
+        """
+        :return: 还原到 0-255 并平滑后的 float32 墨迹强度图
+        """
+        if self._intensity is None:
+            ink = self.ink.astype(np.float32) * (255 / ((1 << INK_LEVEL_BITS) - 1))
+            self._intensity = cv2.GaussianBlur(ink, (0, 0), INK_BLUR)
+        return self._intensity
+
+
+def page_fingerprint(img: np.ndarray, size) -> PageFingerprint:
+    """
+    :param img: 送入模型的图片（可能已在解码时缩小）
+    :param size: 原图尺寸 (width, height)
+    """
+    gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    height = max(round(gray.shape[0] * THUMB_WIDTH / gray.shape[1]), 1)
+    # 按面积平均缩小，扫描噪点被平均到背景中
+    thumb = cv2.resize(gray, (THUMB_WIDTH, height), interpolation=cv2.INTER_AREA)
+    ink = cv2.absdiff(thumb, np.full_like(thumb, int(np.median(thumb))))
+    content = int(np.count_nonzero(ink > INK_CONTRAST))
+    return PageFingerprint(int.from_bytes(dct_hash(thumb), "big"), size, ink >> (8 - INK_LEVEL_BITS), content)
+
+
+def align_pages(a: PageFingerprint, b: PageFingerprint):
+    """
+    两页缩略图按相位相关对齐
+    :return: (b 相对 a 的偏移 (dx, dy)，缩略图像素；不一致区域中最大连通区域的面积(px))。
+        扫描噪点、压缩和位置偏差只产生零散的像素，增删一行文字或移动一个版面块会形成一整块差异区域
+    """
+    if a.ink.shape != b.ink.shape:
+        return (0.0, 0.0), a.ink.size
+    height, width = a.ink.shape
+    ink_a, ink_b = a.intensity(), b.intensity()
+    (dx, dy), _ = cv2.phaseCorrelate(ink_a, ink_b)
+    ink_b = cv2.warpAffine(ink_b, np.float32([[1, 0, -dx], [0, 1, -dy]]), (width, height), flags=cv2.INTER_LINEAR)
+    diff = cv2.GaussianBlur(cv2.absdiff(ink_a, ink_b), (0, 0), INK_BLUR) > DIFF_CONTRAST
+    count, _, stats, _ = cv2.connectedComponentsWithStats(diff.astype(np.uint8), connectivity=8)
+    return (dx, dy), int(stats[1:, cv2.CC_STAT_AREA].max()) if count > 1 else 0
+
+
+class PageIndex:
+    """
+    已处理页面的近似重复索引，按作用域（租户或文档）隔离。
+    多段索引: 64 位哈希分成 max_distance + 1 段，汉明距离不超过 max_distance 的两个哈希至少有一段完全相同，
+    查找时只取分段命中的候选页计算距离，不需要扫描作用域内的所有页面。
+    每个分段桶保留最近的 window 页，页面在 ttl 秒后过期
+    """
+
+    def __init__(self, namespace: str, config, max_distance: int = PAGE_DEDUP_MAX_DISTANCE,
+                 window: int = PAGE_DEDUP_WINDOW, ttl: int = PAGE_DEDUP_TTL):
+        """
+        :param config: 模型配置，配置或模型文件变化后不再复用旧结果
+        """
+        self.prefix = f"dedup:{namespace}:{config_fingerprint(config)}"
+        self.max_distance = max_distance
+        self.window = window
+        self.ttl = ttl
+        bands = min(max(max_distance, 0) + 1, HASH_BITS)
+        self.band_bounds = [(HASH_BITS * i // bands, HASH_BITS * (i + 1) // bands) for i in range(bands)]
+
+    def band_keys(self, phash: int) -> list:
+        return [f"{i}:{(phash >> low) & ((1 << (high - low)) - 1):x}" for i, (low, high) in enumerate(self.band_bounds)]
+
+    def candidates(self, scope: str, fingerprint: PageFingerprint) -> list:
+        """
+        :return: 尺寸相同、哈希距离不超过 max_distance 的候选页 [(距离, entry_id, meta)]，按距离排序
+        """
+        entry_ids = self._band_members(scope, self.band_keys(fingerprint.phash))
+        candidates = []
+        for entry_id, meta in self._load_meta(scope, entry_ids).items():
+            distance = bin(meta["phash"] ^ fingerprint.phash).count("1")
+            if distance <= self.max_distance and tuple(meta["size"]) == fingerprint.size:
+                candidates.append((distance, entry_id, meta))
+        return sorted(candidates, key=lambda item: item[0])
+
+    def add(self, scope: str, fingerprint: PageFingerprint, result):
+        self._store(scope, self.band_keys(fingerprint.phash), uuid.uuid4().hex[:16], json.dumps(fingerprint.meta()),
+                    fingerprint.pack_ink(), json.dumps(result, ensure_ascii=False))
+
+    def _band_members(self, scope: str, band_keys: list) -> set:
+        raise NotImplementedError
+
+    def _load_meta(self, scope: str, entry_ids: set) -> dict:
+        """
+        :return: {entry_id: meta}，已过期的页面不返回
+        """
+        raise NotImplementedError
+
+    def load_ink(self, scope: str, entry_id: str):
+        raise NotImplementedError
+
+    def load_result(self, scope: str, entry_id: str):
+        raise NotImplementedError
+
+    def _store(self, scope: str, band_keys: list, entry_id: str, meta: str, ink: bytes, result: str):
+        raise NotImplementedError
+
+
+class RedisPageIndex(PageIndex):
+    """
+    存储在 REDIS_CACHE_DB 中，所有 worker 共享:
+        {prefix}:{scope}:band:{分段}         list，分段命中的页面 id，最近的在前
+        {prefix}:{scope}:entry:{页面 id}     hash，meta / ink（压缩的墨迹强度缩略图）/ result
+    """
+
+    def __init__(self, namespace: str, config, client=None, **kwargs):
+        super().__init__(namespace, config, **kwargs)
+        self.client = client or get_redis_client()
+
+    def _key(self, scope: str, kind: str, name: str) -> str:
+        return f"{self.prefix}:{scope}:{kind}:{name}"
+
+    def _band_members(self, scope: str, band_keys: list) -> set:
+        pipe = self.client.pipeline()
+        for band in band_keys:
+            pipe.lrange(self._key(scope, "band", band), 0, -1)
+        return {entry_id.decode() for members in pipe.execute() for entry_id in members}
+
+    def _load_meta(self, scope: str, entry_ids: set) -> dict:
+        entry_ids = list(entry_ids)
+        pipe = self.client.pipeline()
+        for entry_id in entry_ids:
+            pipe.hget(self._key(scope, "entry", entry_id), "meta")
+        return {entry_id: json.loads(meta) for entry_id, meta in zip(entry_ids, pipe.execute()) if meta}
+
+    def load_ink(self, scope: str, entry_id: str):
+        return self.client.hget(self._key(scope, "entry", entry_id), "ink")
+
+    def load_result(self, scope: str, entry_id: str):
+        value = self.client.hget(self._key(scope, "entry", entry_id), "result")
+        return json.loads(value) if value else None
+
+    def _store(self, scope: str, band_keys: list, entry_id: str, meta: str, ink: bytes, result: str):
+        entry_key = self._key(scope, "entry", entry_id)
+        pipe = self.client.pipeline()
+        pipe.hset(entry_key, mapping={"meta": meta, "ink": ink, "result": result})
+        pipe.expire(entry_key, self.ttl)
+        for band in band_keys:
+            band_key = self._key(scope, "band", band)
+            pipe.lpush(band_key, entry_id)
+            pipe.ltrim(band_key, 0, self.window - 1)
+            pipe.expire(band_key, self.ttl)
+        pipe.execute()
+
+
+class MemoryPageIndex(PageIndex):
+    """
+    进程内索引，用于单机调试和测试
+    """
+
+    def __init__(self, namespace: str, config, clock=time.monotonic, **kwargs):
+        super().__init__(namespace, config, **kwargs)
+        self.clock = clock
+        self._bands = {}
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _band_members(self, scope: str, band_keys: list) -> set:
+        with self._lock:
+            return {entry_id for band in band_keys for entry_id in self._bands.get((scope, band), ())}
+
+    def _entry(self, scope: str, entry_id: str):
+        entry = self._entries.get((scope, entry_id))
+        if entry is None or entry[0] < self.clock():
+            return None
+        return entry
+
+    def _load_meta(self, scope: str, entry_ids: set) -> dict:
+        with self._lock:
+            entries = {entry_id: self._entry(scope, entry_id) for entry_id in entry_ids}
+        return {entry_id: json.loads(entry[1]) for entry_id, entry in entries.items() if entry}
+
+    def load_ink(self, scope: str, entry_id: str):
+        with self._lock:
+            entry = self._entry(scope, entry_id)
+        return entry[2] if entry else None
+
+    def load_result(self, scope: str, entry_id: str):
+        with self._lock:
+            entry = self._entry(scope, entry_id)
+        return json.loads(entry[3]) if entry else None
+
+    def _store(self, scope: str, band_keys: list, entry_id: str, meta: str, ink: bytes, result: str):
+        with self._lock:
+            self._entries[(scope, entry_id)] = (self.clock() + self.ttl, meta, ink, result)
+            for band in band_keys:
+                members = self._bands.setdefault((scope, band), deque(maxlen=self.window))
+                if len(members) == members.maxlen:
+                    self._entries.pop((scope, members[-1]), None)
+                members.appendleft(entry_id)
+
+
+class PageDedup:
+    """
+    整页推理前的分流: 空白页（缩略图中几乎没有墨迹）直接返回空结果；
+    配置了 index 时，同一作用域内哈希相近、缩略图对齐后没有成块差异的已处理页面复用其结果，不调用模型。
+    只有版面检测使用近似重复页: 改动一个数字不会移动版面块，复用的结果按两页的偏移平移到当前页；
+    OCR 的结果逐字对应页面内容，不复用近似重复页，完全相同的图片由结果缓存命中
+    """
+
+    def __init__(self, index: PageIndex = None, max_ink_diff: int = PAGE_DEDUP_MAX_INK_DIFF,
+                 blank_max_ink: int = PAGE_BLANK_MAX_INK, namespace: str = ""):
+        """
+        :param index: 近似重复页索引，为 None 时只跳过空白页
+        :param namespace: 没有 index 时统计中使用的命名空间
+        """
+        self.index = index
+        self.max_ink_diff = max_ink_diff
+        self.blank_max_ink = blank_max_ink
+        self.namespace = index.prefix if index is not None else namespace
+        self.pages = 0
+        self.blank = 0
+        self.duplicate = 0
+        self.errors = 0
+
+    def triage(self, scope: str, img: np.ndarray, size, empty_result, shift_result=None):
+        """
+        :param scope: 作用域，BLANK_ONLY_SCOPE 时只跳过空白页
+        :param empty_result: 空白页的结果 empty_result(size)
+        :param shift_result: 把近似重复页的结果平移到当前页坐标 shift_result(result, dx, dy)，返回 None 时不复用
+        :return: (PageFingerprint, 结果)，结果为 None 表示需要模型推理，推理后调用 add 加入索引
+        """
+        with timer(STAGE_PAGE_DEDUP):
+            fingerprint = page_fingerprint(img, size)
+            self.pages += 1
+            if fingerprint.content <= self.blank_max_ink:
+                self.blank += 1
+                return fingerprint, empty_result(size)
+            result = None
+            if self.index is not None and shift_result is not None and scope != BLANK_ONLY_SCOPE:
+                result = self._lookup(scope, fingerprint, shift_result)
+        if result is not None:
+            self.duplicate += 1
+        return fingerprint, result
+
+    def _lookup(self, scope: str, fingerprint: PageFingerprint, shift_result):
+        try:
+            for _, entry_id, meta in self.index.candidates(scope, fingerprint)[:MAX_CANDIDATES]:
+                ink = self.index.load_ink(scope, entry_id)
+                if ink is None:
+                    continue
+                (dx, dy), ink_diff = align_pages(fingerprint, PageFingerprint.from_stored(meta, ink))
+                if ink_diff > self.max_ink_diff:
+                    continue
+                result = self.index.load_result(scope, entry_id)
+                if result is None:
+                    continue
+                # 缩略图上的偏移换算到原图坐标，候选页的内容在当前页的 (dx, dy) 处，结果反向平移
+                scale = fingerprint.size[0] / fingerprint.ink.shape[1]
+                return shift_result(result, -dx * scale, -dy * scale)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"查找近似重复页失败: {e}")
+        return None
+
+    def add(self, scope: str, fingerprint: PageFingerprint, result):
+        if self.index is None or scope == BLANK_ONLY_SCOPE:
+            return
+        try:
+            self.index.add(scope, fingerprint, result)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"写入近似重复页索引失败: {e}")
+
+    def stats(self) -> dict:
+        skipped = self.blank + self.duplicate
+        return {
+            "namespace": self.namespace,
+            "pages": self.pages,
+            "blank": self.blank,
+            "duplicate": self.duplicate,
+            "errors": self.errors,
+            "skip_rate": skipped / self.pages if self.pages else 0.0,
+        }
+
+
+def build_page_dedup(namespace: str, config, backend: str = PAGE_DEDUP_BACKEND, near_duplicates: bool = True):
+    """
+    :param namespace: 索引命名空间，一般为任务名
+    :param config: 模型配置，用于计算指纹
+    :param backend: redis / memory / none，none 时返回 None，不做分流
+    :param near_duplicates: 是否复用近似重复页的结果，False 时只跳过空白页（OCR）
+    """
+    if backend == "none":
+        return None
+    if backend not in ("redis", "memory"):
+        raise ValueError(f"unsupported page dedup backend: {backend}")
+    if not near_duplicates:
+        return PageDedup(namespace=namespace)
+    if backend == "redis":
+        return PageDedup(RedisPageIndex(namespace, config))
+    return PageDedup(MemoryPageIndex(namespace, config))
+    raise ValueError(f"unsupported page dedup backend: {backend}")
+
+
+def page_dedup_scope(tenant: str = None, doc_id: str = None, mode: str = PAGE_DEDUP_SCOPE) -> str:
+    """
+    页面任务的去重作用域，由投递方按请求的租户或文档计算
+    :param mode: tenant / document / none
+    """
+    if mode == "tenant":
+        return f"tenant:{normalize_tenant(tenant)}"
+    if mode == "document" and doc_id:
+        return f"doc:{doc_id}"
+    return BLANK_ONLY_SCOPE
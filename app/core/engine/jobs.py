@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: jobs
+Time: 2025/6/20 10:15
+"""
+import json
+import time
+import uuid
+
+from celery import states as celery_states
+from celery.result import AsyncResult
+
+from app.config.conf import JOB_TTL
+from app.core.engine.celery_task import celery_app
+from app.core.engine.redis_client import get_redis_client
+
+# 任务状态
+JOB_DISPATCHING = "DISPATCHING"  # 仍在投递页面（pdf 边渲染边投递）
+JOB_DISPATCHED = "DISPATCHED"  # 所有页面已投递
+JOB_FAILED = "FAILED"  # 投递过程出错
+
+
+class JobStore:
+    """
+    异步任务元数据，存储在 REDIS_CACHE_DB 中:
+        job:{job_id}        hash，任务状态、总页数、pdf 任务的投递参数等
+        job:{job_id}:pages  list，每页对应的 celery 任务，按投递顺序追加，重试的页面会追加多次
+    每页的执行状态和结果直接使用 celery 的 result backend，pdf 任务每页的最终结果另存在 CheckpointStore
+    """
+
+    def __init__(self, client=None, ttl: int = JOB_TTL):
+        self.client = client or get_redis_client()
+        self.ttl = ttl
+
+    @staticmethod
+    def _job_key(job_id: str) -> str:
+        return f"job:{job_id}"
+
+    @staticmethod
+    def _pages_key(job_id: str) -> str:
+        return f"job:{job_id}:pages"
+
+    def create(self, task_name: str, total: int = None, params: dict = None) -> str:
+        """
+        :param params: pdf 任务的投递参数，恢复任务时按原参数重新投递
+        """
+        job_id = uuid.uuid4().hex
+        mapping = {
+            "status": JOB_DISPATCHING,
+            "task_name": task_name,
+            "created_at": time.time(),
+        }
+        if total is not None:
+            mapping["total"] = total
+        if params is not None:
+            mapping["params"] = json.dumps(params, ensure_ascii=False)
+        self.client.hset(self._job_key(job_id), mapping=mapping)
+        self.client.expire(self._job_key(job_id), self.ttl)
+        return job_id
+
+    def add_page(self, job_id: str, page: str, image_id: str, task_id: str):
+        pages_key = self._pages_key(job_id)
+        self.client.rpush(pages_key, json.dumps({"page": page, "image_id": image_id, "task_id": task_id}))
+        self.client.expire(pages_key, self.ttl)
+
+    def finish_dispatch(self, job_id: str, total: int):
+        self.client.hset(self._job_key(job_id), mapping={"status": JOB_DISPATCHED, "total": total})
+
+    def fail_dispatch(self, job_id: str, error: str):
+        self.client.hset(self._job_key(job_id), mapping={"status": JOB_FAILED, "error": error})
+
+    def resume(self, job_id: str):
+        self.client.hdel(self._job_key(job_id), "error")
+        self.client.hset(self._job_key(job_id), "status", JOB_DISPATCHING)
+        self.client.expire(self._job_key(job_id), self.ttl)
+        self.client.expire(self._pages_key(job_id), self.ttl)
+
+    def get(self, job_id: str):
+        job = self.client.hgetall(self._job_key(job_id))
+        if not job:
+            return None
+        job = {key.decode(): value.decode() for key, value in job.items()}
+        if "total" in job:
+            job["total"] = int(job["total"])
+        if "params" in job:
+            job["params"] = json.loads(job["params"])
+        return job
+
+    def pages(self, job_id: str, start: int = 0) -> list:
+        return [json.loads(page) for page in self.client.lrange(self._pages_key(job_id), start, -1)]
+
+
+def page_async_result(page: dict) -> AsyncResult:
+    return AsyncResult(page["task_id"], app=celery_app)
+
+
+def latest_pages(pages: list) -> list:
+    """
+    重试的页面有多条记录，只保留每页最后一次投递
+    """
+    return list({page["page"]: page for page in pages}.values())
+
+
+def job_status(store: JobStore, job_id: str):
+    """
+    汇总任务进度，返回 None 表示任务不存在
+    """
+    job = store.get(job_id)
+    if job is None:
+        return None
+    pages = store.pages(job_id)
+    latest = latest_pages(pages)
+    states = {}
+    for page in latest:
+        state = page_async_result(page).state
+        states[state] = states.get(state, 0) + 1
+    dispatched = sum(states.values())
+    # 与 AsyncResult.ready() 一致，REVOKED 等终止状态也算完成
+    finished = sum(count for state, count in states.items() if state in celery_states.READY_STATES)
+    return {
+        "job_id": job_id,
+        "status": job["status"],
+        "error": job.get("error"),
+        "total": job.get("total"),
+        "dispatched": dispatched,
+        "finished": finished,
+        "states": states,
+        "retried": len(pages) - len(latest),
+        "done": job["status"] != JOB_DISPATCHING and finished == dispatched,
+    }
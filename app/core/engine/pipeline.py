@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: pipeline
+Time: 2025/6/23 10:20
+"""
+import cv2
+
+from app.common.metrics import STAGE_RESULT_BUILD, timed
+from app.common.utils import html_to_markdown
+from app.config.conf import REGION_CROP_PADDING
+from app.core.ocr.chars import CharColumns, is_columnar, to_dchars
+
+# 版面类别到下游任务的路由，figure 和 abandon 区域不做识别
+TEXT_CATEGORIES = {
+    "title",
+    "plain text",
+    "figure_caption",
+    "table_caption",
+    "table_footnote",
+    "formula_caption",
+}
+TABLE_CATEGORIES = {"table"}
+FORMULA_CATEGORIES = {"isolate_formula"}
+
+REGION_TEXT = "text"
+REGION_TABLE = "table"
+REGION_FORMULA = "formula"
+
+
+def region_kind(category: str):
+    if category in TEXT_CATEGORIES:
+        return REGION_TEXT
+    if category in TABLE_CATEGORIES:
+        return REGION_TABLE
+    if category in FORMULA_CATEGORIES:
+        return REGION_FORMULA
+    return None
+
+
+def crop_regions(image, layout_dets: list, id_to_names: dict, padding: int = REGION_CROP_PADDING):
+    """
+    按版面检测结果裁剪需要识别的区域
+    :param image: BGR 页面图片
+    :param layout_dets: 已排序的版面检测结果
+    :param id_to_names: 类别 id 到类别名的映射
+    :param padding: 裁剪时向外扩展的像素数
+    :return: [{"region_id", "category", "kind", "bbox": [x1, y1, x2, y2], "crop": np.ndarray}]，bbox 为裁剪区域在页面中的坐标
+    """
+    height, width = image.shape[:2]
+    regions = []
+    for region_id, det in enumerate(layout_dets):
+        category = id_to_names.get(int(det["category_id"]))
+        kind = region_kind(category)
+        if kind is None:
+            continue
+        x1, y1, x2, y2 = det["poly"][:4]
+        x1 = max(int(x1) - padding, 0)
+        y1 = max(int(y1) - padding, 0)
+        x2 = min(int(x2 + 0.5) + padding, width)
+        y2 = min(int(y2 + 0.5) + padding, height)
+        if x2 <= x1 or y2 <= y1:
+            continue
+        regions.append({
+            "region_id": region_id,
+            "category": category,
+            "kind": kind,
+            "bbox": [x1, y1, x2, y2],
+            "crop": image[y1:y2, x1:x2],
+        })
+    return regions
+
+
+def encode_crop(crop) -> bytes:
+    ok, buf = cv2.imencode(".png", crop)
+    if not ok:
+        raise ValueError("failed to encode region crop")
+    return buf.tobytes()
+
+
+def split_batches(items: list, batch_size: int):
+    batch_size = max(batch_size, 1)
+    return [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+
+
+def offset_ocr_result(ocr_result: dict, dx: float, dy: float) -> dict:
+    """
+    把区域内的字符坐标平移回页面坐标
+    """
+    if is_columnar(ocr_result["chars"]):
+        ocr_result["chars"] = CharColumns.from_payload(ocr_result["chars"]).offset(dx, dy).to_payload()
+        return ocr_result
+    ocr_result["chars_region"] = [
+        tuple((point[0] + dx, point[1] + dy) for point in char_box)
+        for char_box in ocr_result["chars_region"]
+    ]
+    return ocr_result
+
+
+def merge_region_results(region_results: list) -> dict:
+    """
+    按区域在版面中的顺序合并文本区域的识别结果
+    :param region_results: [{"region_id", "category", "bbox", "ocr": 页面坐标下的 ocr 结果}]
+    :return: 与 TextOcr.predict 相同格式的页面结果，额外带有 regions 字段
+    """
+    merged = {
+        "text": "",
+        "bbox": None,
+        "chars": [],
+        "chars_region": [],
+        "regions": [],
+    }
+    texts = []
+    columns_list = []
+    for region in sorted(region_results, key=lambda item: item["region_id"]):
+        ocr_result = region["ocr"]
+        texts.append(ocr_result["text"])
+        if is_columnar(ocr_result["chars"]):
+            columns_list.append(CharColumns.from_payload(ocr_result["chars"]))
+        else:
+            merged["chars"].extend(ocr_result["chars"])
+            merged["chars_region"].extend(ocr_result["chars_region"])
+        merged["regions"].append({
+            "region_id": region["region_id"],
+            "category": region["category"],
+            "bbox": region["bbox"],
+            "text": ocr_result["text"],
+        })
+    merged["text"] = "\n".join(texts)
+    if columns_list:
+        # 同一个 worker 配置下所有区域的格式一致
+        merged["chars"] = CharColumns.concat(columns_list).to_payload()
+        del merged["chars_region"]
+    return merged
+
+
+@timed(STAGE_RESULT_BUILD)
+def build_ocr_page_result(ocr_results):
+    text = ocr_results["text"]
+    bbox = ocr_results.get("text_region", []) or ocr_results.get("cell_bbox", []) or None
+    # 解析每个字符，列式格式直接输出
+    if is_columnar(ocr_results["chars"]):
+        dchars = ocr_results["chars"]
+    else:
+        dchars = to_dchars([ocr_results["chars"]], [ocr_results["chars_region"]])
+    # 表格转换成html形式
+    table_markdown = html_to_markdown(ocr_results.get("tabel_html", ""))
+    return {
+        "text": text,
+        "bbox": bbox,
+        "chars": dchars,
+        "table_markdown": table_markdown,
+    }
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: postprocess
+Time: 2025/7/7 11:20
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from app.common.metrics import STAGE_OVERLAP, STAGE_SORT, timer
+from app.common.utils import find_overlap_blocks_to_remove, get_bboxes_from_polys, load_config
+from app.config.conf import OCR_CHAR_FORMAT, RAW_OUTPUT_DIR
+from app.core.engine.pipeline import build_ocr_page_result
+from app.core.engine.raw_outputs import RAW_LAYOUT, RAW_OCR, iter_records, list_shards
+from app.core.layout.models.yolo import LAYOUT_CATEGORIES
+from app.core.layout.reading_order import sort_layout_dets
+from app.core.ocr.chars import build_text_result
+
+logger = logging.getLogger(__name__)
+
+# PaddleOCR TextSystem 的默认 drop_score
+DEFAULT_DROP_SCORE = 0.5
+
+
+def batched_nms(bboxes: np.ndarray, scores: np.ndarray, classes: np.ndarray, iou_thres: float) -> np.ndarray:
+    """
+    按类别的 NMS，不同类别的框平移到互不相交的区域后一起计算
+    :return: 保留的下标，按原顺序
+    """
+    if len(bboxes) == 0:
+        return np.zeros(0, dtype=np.intp)
+    boxes = bboxes + (classes.astype(np.float64) * (bboxes.max() + 1))[:, None]
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while len(order):
+        idx, rest = order[0], order[1:]
+        keep.append(idx)
+        width = np.clip(np.minimum(boxes[idx, 2], boxes[rest, 2]) - np.maximum(boxes[idx, 0], boxes[rest, 0]), 0, None)
+        height = np.clip(np.minimum(boxes[idx, 3], boxes[rest, 3]) - np.maximum(boxes[idx, 1], boxes[rest, 1]), 0, None)
+        inter = width * height
+        with np.errstate(divide="ignore", invalid="ignore"):
+            iou = inter / (area[idx] + area[rest] - inter)
+        order = rest[~(iou > iou_thres)]
+    return np.sort(np.asarray(keep, dtype=np.intp))
+
+
+class LayoutPostprocess:
+    """
+    版面检测的后处理: 置信度过滤 → 按类别 NMS（可选）→ 重叠块删除 → 排序。
+    页面任务和离线重新后处理使用同一实现，参数相同时结果一致
+    """
+
+    def __init__(self, id_to_names: dict, conf_thres: float = 0.25, iou_thres: float = None,
+                 overlap_ratio_threshold: float = 0.8, sort_by: str = "reading_order"):
+        """
+        :param conf_thres: 保留置信度大于该值的框
+        :param iou_thres: 不为空时重新做按类别的 NMS。YOLOv10 为端到端检测，页面任务中不再做 NMS，
+            模型配置中的 iou_thres 只传给模型
+        :param overlap_ratio_threshold: 重叠面积占较小块面积的比例达到该值时删除高度较小的块
+        :param sort_by: 见 sort_layout_dets
+        """
+        self.id_to_names = id_to_names
+        self.conf_thres = conf_thres
+        self.iou_thres = iou_thres
+        self.overlap_ratio_threshold = overlap_ratio_threshold
+        self.sort_by = sort_by
+
+    @classmethod
+    def from_config(cls, config, id_to_names: dict, **overrides):
+        """
+        :param config: layout_detection.yaml 中的 model_config
+        :param overrides: 覆盖配置的参数，值为 None 时使用配置
+        """
+        params = {
+            "conf_thres": config.get("conf_thres", 0.25),
+            "overlap_ratio_threshold": config.get("overlap_ratio_threshold", 0.8),
+            "sort_by": config.get("sort_by", "reading_order"),
+        }
+        params.update({key: value for key, value in overrides.items() if value is not None})
+        return cls(id_to_names, **params)
+
+    def __call__(self, layout_results: dict) -> dict:
+        """
+        :param layout_results: 模型输出 {"layout_dets", "page_info"}，不修改传入的结果
+        """
+        dets = layout_results["layout_dets"]
+        if dets:
+            keep = self.select(
+                get_bboxes_from_polys([det["poly"] for det in dets]),
+                np.fromiter((det["category_id"] for det in dets), dtype=np.float64, count=len(dets)),
+                np.fromiter((det["score"] for det in dets), dtype=np.float64, count=len(dets)),
+            )
+            dets = [dets[idx] for idx in keep]
+        return dict(layout_results, layout_dets=self.sort(dets, layout_results["page_info"]["height"]))
+
+    def from_raw(self, header: dict, arrays: dict) -> dict:
+        """
+        由原始输出（raw_outputs.layout_record）生成页面任务的版面结果
+        """
+        boxes, classes, scores = arrays["boxes"], arrays["classes"], arrays["scores"]
+        keep = self.select(get_bboxes_from_polys(boxes), classes, scores)
+        dets = [
+            {"poly": poly, "category_id": float(category_id), "score": float(score)}
+            for poly, category_id, score in zip(boxes[keep].tolist(), classes[keep], scores[keep])
+        ]
+        return {
+            "layout_dets": self.sort(dets, header["height"]),
+            "page_info": {"height": header["height"], "width": header["width"]},
+        }
+
+    def select(self, bboxes: np.ndarray, classes: np.ndarray, scores: np.ndarray) -> np.ndarray:
+        """
+        :return: 保留的框的下标，按原顺序
+        """
+        keep = np.flatnonzero(scores > self.conf_thres)
+        if self.iou_thres:
+            keep = keep[batched_nms(bboxes[keep], scores[keep], classes[keep], self.iou_thres)]
+        with timer(STAGE_OVERLAP):
+            removed = find_overlap_blocks_to_remove(bboxes[keep], self.overlap_ratio_threshold)
+        return keep[~removed]
+
+    def sort(self, dets: list, page_height) -> list:
+        with timer(STAGE_SORT):
+            return sort_layout_dets(dets, sort_by=self.sort_by, id_to_names=self.id_to_names, page_height=page_height)
+
+
+class OcrPostprocess:
+    """
+    文本 OCR 的后处理: 按 drop_score 过滤文本行后生成字符结果
+    """
+
+    def __init__(self, drop_score: float = DEFAULT_DROP_SCORE, char_format: str = OCR_CHAR_FORMAT):
+        self.drop_score = drop_score
+        self.char_format = char_format
+
+    def from_raw(self, header: dict, arrays: dict) -> dict:
+        """
+        由原始输出（raw_outputs.ocr_record）生成页面任务的 OCR 结果
+        """
+        boxes, scores = arrays["boxes"], arrays["scores"]
+        keep = np.flatnonzero(scores >= self.drop_score)
+        rec_res = [(header["texts"][idx], float(scores[idx]), header["char_info"][idx]) for idx in keep]
+        return build_ocr_page_result(build_text_result(boxes[keep], rec_res, self.char_format))
+
+
+def _build_postprocess(kind: str, params: dict):
+    if kind == RAW_LAYOUT:
+        from app.tasks.layout_task import TASK_NAME
+
+        config = load_config(TASK_NAME)[TASK_NAME].model_config
+        return LayoutPostprocess.from_config(config, LAYOUT_CATEGORIES, **params)
+    return OcrPostprocess(**{key: value for key, value in params.items() if value is not None})
+
+
+def process_shard(kind: str, params: dict, shard: str, output_dir: str) -> dict:
+    """
+    重新后处理一个分片，结果按行写入 {output_dir}/{分片名}.jsonl: {"image_id": ..., "result": ...}
+    """
+    postprocess = _build_postprocess(kind, params)
+    output = Path(output_dir) / f"{Path(shard).stem}.jsonl"
+    pages, elapsed = 0, 0.0
+    with open(output, "w", encoding="utf-8") as file:
+        for header, arrays in iter_records(shard):
+            start = time.perf_counter()
+            result = postprocess.from_raw(header, arrays)
+            elapsed += time.perf_counter() - start
+            file.write(json.dumps({"image_id": header["image_id"], "result": result}, ensure_ascii=False) + "\n")
+            pages += 1
+    return {"shard": shard, "output": str(output), "pages": pages, "postprocess_seconds": elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="re-run post-processing on stored raw model outputs")
+    parser.add_argument("kind", choices=[RAW_LAYOUT, RAW_OCR])
+    parser.add_argument("--input", default=RAW_OUTPUT_DIR, help="原始输出目录，默认 RAW_OUTPUT_DIR")
+    parser.add_argument("--output", required=True, help="结果目录，每个分片输出一个 jsonl")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--conf-thres", type=float, help="layout，默认取 layout_detection.yaml")
+    parser.add_argument("--iou-thres", type=float, help="layout，重新做按类别的 NMS，默认不做")
+    parser.add_argument("--overlap-ratio", type=float, help="layout，重叠块删除的阈值，默认取 layout_detection.yaml")
+    parser.add_argument("--sort-by", choices=["top_left_x", "top_left_y", "top_left_y_then_x", "reading_order"])
+    parser.add_argument("--drop-score", type=float, help=f"ocr，默认 {DEFAULT_DROP_SCORE}")
+    parser.add_argument("--char-format", choices=["dict", "columnar"], help="ocr，默认 OCR_CHAR_FORMAT")
+    args = parser.parse_args()
+
+    if args.kind == RAW_LAYOUT:
+        params = {"conf_thres": args.conf_thres, "iou_thres": args.iou_thres,
+                  "overlap_ratio_threshold": args.overlap_ratio, "sort_by": args.sort_by}
+    else:
+        params = {"drop_score": args.drop_score, "char_format": args.char_format}
+    shards = list_shards(args.input, args.kind)
+    Path(args.output).mkdir(parents=True, exist_ok=True)
+
+    start = time.perf_counter()
+    count = len(shards)
+    with ProcessPoolExecutor(max_workers=max(min(args.workers, count), 1)) as executor:
+        reports = list(executor.map(process_shard, [args.kind] * count, [params] * count, shards,
+                                    [args.output] * count))
+    pages = sum(report["pages"] for report in reports)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({"kind": args.kind, "shards": len(shards), "pages": pages, "seconds": round(elapsed, 2),
+                      "pages_per_second": round(pages / elapsed, 1) if elapsed else None}))
+
+
+if __name__ == "__main__":
+    main()
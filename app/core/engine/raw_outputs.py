@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: raw_outputs
+Time: 2025/7/7 10:30
+"""
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+from app.config.conf import RAW_OUTPUT_DIR, RAW_OUTPUT_SHARD_MB
+
+logger = logging.getLogger(__name__)
+
+RAW_LAYOUT = "layout"
+RAW_OCR = "ocr"
+# TextOcr 结果中携带原始文本行的键，由页面任务取出写入原始输出后删除
+RAW_KEY = "raw"
+SHARD_SUFFIX = ".raw"
+
+_LENGTH = struct.Struct("<I")
+
+
+def encode_record(header: dict, arrays: dict) -> bytes:
+    """
+    一页的原始输出: 4 字节头部长度 + 头部 json（含各数组的 dtype / shape）+ 各数组的原始字节，整体 zlib 压缩
+    """
+    header = dict(header, arrays=[[name, array.dtype.str, list(array.shape)] for name, array in arrays.items()])
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    body = b"".join(np.ascontiguousarray(array).tobytes() for array in arrays.values())
+    return zlib.compress(_LENGTH.pack(len(header_bytes)) + header_bytes + body, 1)
+
+
+def decode_record(record: bytes):
+    """
+    :return: (头部, {数组名: np.ndarray})
+    """
+    data = zlib.decompress(record)
+    (header_size,) = _LENGTH.unpack_from(data)
+    offset = _LENGTH.size + header_size
+    header = json.loads(data[_LENGTH.size:offset])
+    arrays = {}
+    for name, dtype, shape in header.pop("arrays"):
+        dtype, count = np.dtype(dtype), int(np.prod(shape))
+        arrays[name] = np.frombuffer(data, dtype=dtype, count=count, offset=offset).reshape(shape)
+        offset += count * dtype.itemsize
+    return header, arrays
+
+
+def layout_record(image_id: str, layout_results: dict):
+    """
+    版面检测模型的输出（置信度不低于 raw_conf_thres，坐标已还原到原图）
+    """
+    dets = layout_results["layout_dets"]
+    count = len(dets)
+    arrays = {
+        "boxes": np.asarray([det["poly"] for det in dets], dtype=np.float64).reshape(count, -1),
+        "classes": np.asarray([det["category_id"] for det in dets], dtype=np.int16).reshape(count),
+        "scores": np.asarray([det["score"] for det in dets], dtype=np.float64).reshape(count),
+    }
+    header = {"image_id": image_id, "height": layout_results["page_info"]["height"],
+              "width": layout_results["page_info"]["width"]}
+    return header, arrays
+
+
+def ocr_record(image_id: str, raw_lines: dict):
+    """
+    :param raw_lines: TextOcr 结果中 RAW_KEY 的内容，drop_score 过滤之前的所有文本行
+    """
+    count = len(raw_lines["texts"])
+    arrays = {
+        "boxes": np.asarray(raw_lines["boxes"], dtype=np.float32).reshape(count, 4, 2),
+        "scores": np.asarray(raw_lines["scores"], dtype=np.float64).reshape(count),
+    }
+    header = {"image_id": image_id, "texts": raw_lines["texts"], "char_info": raw_lines["char_info"]}
+    return header, arrays
+
+
+def raw_lines(dt_boxes, rec_res) -> dict:
+    """
+    TextOcr 的原始文本行，可 json 序列化，随结果一起缓存
+    :param rec_res: [(文本, 分数, 字符信息)]
+    """
+    return {
+        "boxes": [np.asarray(box).tolist() for box in dt_boxes],
+        "scores": [float(rec_result[1]) for rec_result in rec_res],
+        "texts": [rec_result[0] for rec_result in rec_res],
+        "char_info": [list(rec_result[2]) for rec_result in rec_res],
+    }
+
+
+class RawOutputWriter:
+    """
+    每个进程追加写入自己的分片文件 {root}/{kind}/{hostname}-{pid}-{时间戳}-{序号}.raw，
+    分片超过 shard_bytes 后换新文件。每条记录为 4 字节长度 + encode_record 的结果，
+    进程异常退出时最多丢失最后一条未写完的记录，读取时跳过
+    """
+
+    def __init__(self, root: str = RAW_OUTPUT_DIR, shard_bytes: int = RAW_OUTPUT_SHARD_MB * 1024 * 1024):
+        self.root = Path(root)
+        self.shard_bytes = shard_bytes
+        self.records = 0
+        self.errors = 0
+        self._files = {}
+        self._seq = 0
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def save_layout(self, image_id: str, layout_results: dict):
+        self._save(RAW_LAYOUT, *layout_record(image_id, layout_results))
+
+    def save_ocr(self, image_id: str, raw: dict):
+        self._save(RAW_OCR, *ocr_record(image_id, raw))
+
+    def _save(self, kind: str, header: dict, arrays: dict):
+        # 原始输出只用于离线调参，写入失败不影响任务结果
+        try:
+            record = encode_record(header, arrays)
+            with self._lock:
+                file = self._file(kind)
+                file.write(_LENGTH.pack(len(record)) + record)
+                file.flush()
+                self.records += 1
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"写入原始输出失败: {e}")
+
+    def _file(self, kind: str):
+        if self._pid != os.getpid():
+            # fork 出的子进程不能继续写父进程的分片
+            self._files, self._pid = {}, os.getpid()
+        file = self._files.get(kind)
+        if file is not None and file.tell() < self.shard_bytes:
+            return file
+        if file is not None:
+            file.close()
+        directory = self.root / kind
+        directory.mkdir(parents=True, exist_ok=True)
+        self._seq += 1
+        path = directory / f"{socket.gethostname()}-{self._pid}-{int(time.time())}-{self._seq}{SHARD_SUFFIX}"
+        file = self._files[kind] = open(path, "ab")
+        return file
+
+    def close(self):
+        with self._lock:
+            for file in self._files.values():
+                file.close()
+            self._files = {}
+
+    def stats(self) -> dict:
+        return {"root": str(self.root), "records": self.records, "errors": self.errors}
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_raw_writer():
+    """
+    :return: 进程内共享的 RawOutputWriter，RAW_OUTPUT_DIR 为空时返回 None，不保存原始输出
+    """
+    global _writer
+    if not RAW_OUTPUT_DIR:
+        return None
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = RawOutputWriter()
+    return _writer
+
+
+def list_shards(root: str, kind: str) -> list:
+    return sorted(str(path) for path in (Path(root) / kind).glob(f"*{SHARD_SUFFIX}"))
+
+
+def iter_records(path: str):
+    """
+    逐条读取分片中的记录
+    :return: 生成 (头部, {数组名: np.ndarray})
+    """
+    with open(path, "rb") as file:
+        while True:
+            size_bytes = file.read(_LENGTH.size)
+            if len(size_bytes) < _LENGTH.size:
+                break
+            (size,) = _LENGTH.unpack(size_bytes)
+            record = file.read(size)
+            if len(record) < size:
+                logger.warning(f"{path} 末尾的记录不完整，已跳过")
+                break
+            yield decode_record(record)
@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: redis_client
+Time: 2025/6/18 10:05
+"""
+from functools import lru_cache
+
+import redis
+
+from app.config.conf import REDIS_HOST, REDIS_PORT, REDIS_PASSWORD, REDIS_CACHE_DB
+
+
+@lru_cache(maxsize=None)
+def get_redis_client(db: int = REDIS_CACHE_DB):
+    """
+    获取 redis 客户端，同一进程内按 db 复用连接池
+    """
+    return redis.Redis(host=REDIS_HOST, port=REDIS_PORT, password=REDIS_PASSWORD, db=db)
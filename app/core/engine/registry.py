@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: registry
+Time: 2025/6/27 10:15
+"""
+import gc
+import importlib
+import logging
+import os
+import resource
+import threading
+import time
+
+from celery.signals import celeryd_after_setup, worker_init, worker_process_init, worker_ready
+
+from app.config.conf import (
+    DEVICE,
+    MODEL_WARMUP,
+    PRELOAD_MODELS,
+    WORKER_MAX_MEMORY_GROWTH_MB,
+    WORKER_MAX_MEMORY_PER_CHILD_MB,
+)
+
+logger = logging.getLogger(__name__)
+
+LAYOUT_MODEL = "layout"
+OCR_MODEL = "ocr"
+TABLE_MODEL = "table"
+FORMULA_MODEL = "formula"
+
+# 模型名 -> "模块:类"，只有第一次使用时才导入模块，避免 ocr worker 导入 torch/doclayout_yolo
+MODEL_FACTORIES = {
+    LAYOUT_MODEL: "app.tasks.layout_task:LayoutTask",
+    OCR_MODEL: "app.tasks.ocr_task:OcrTask",
+    TABLE_MODEL: "app.tasks.table_task:TableTask",
+    FORMULA_MODEL: "app.tasks.formula_task:FormulaTask",
+}
+
+# 队列 -> 该队列上的任务需要的模型
+QUEUE_MODELS = {
+    "layout_task_queue": (LAYOUT_MODEL,),
+    "ocr_task_queue": (OCR_MODEL,),
+    "ingest_task_queue": (),
+    # 表格单元格内容复用整张表格的 OCR 结果
+    "table_task_queue": (TABLE_MODEL, OCR_MODEL),
+    "formula_task_queue": (FORMULA_MODEL,),
+}
+
+
+def get_rss_mb() -> float:
+    """
+    当前进程的常驻内存(MB)，非 linux 系统退化为峰值内存
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def import_factory(path: str):
+    module_name, attr = path.split(":")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+class ModelRegistry:
+    """
+    进程内的模型注册表: 模型在第一次 get 时加载，之后复用同一个实例
+    """
+
+    def __init__(self, factories: dict, queue_models: dict):
+        self.factories = factories
+        self.queue_models = queue_models
+        self.queues = None
+        self.pool_cls = None
+        self._instances = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str):
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            if name not in self._instances:
+                self._instances[name] = self._load(name)
+            return self._instances[name]
+
+    def _load(self, name: str):
+        if name not in self.factories:
+            raise KeyError(f"unknown model: {name}")
+        if self.queues is not None and name not in self.models_for_queues(self.queues):
+            logger.warning(f"模型{name}不属于当前 worker 的队列{sorted(self.queues)}，仍按需加载")
+        rss_before = get_rss_mb()
+        start = time.perf_counter()
+        instance = import_factory(self.factories[name])()
+        self._stats[name] = {
+            "model": name,
+            "load_seconds": round(time.perf_counter() - start, 3),
+            "rss_delta_mb": round(get_rss_mb() - rss_before, 1),
+        }
+        logger.info(f"模型{name}加载完成: {self._stats[name]}")
+        return instance
+
+    def register(self, name: str, instance):
+        """
+        直接注册已构造的实例（基准测试替换模型等场景）
+        """
+        with self._lock:
+            self._instances[name] = instance
+            self._stats[name] = {"model": name, "load_seconds": 0.0, "rss_delta_mb": 0.0}
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._instances
+
+    def loaded(self) -> dict:
+        return dict(self._instances)
+
+    def models_for_queues(self, queues) -> list:
+        """
+        :param queues: 队列名列表，None 表示全部队列
+        """
+        if queues is None:
+            return list(self.factories)
+        names = []
+        for queue in queues:
+            for name in self.queue_models.get(queue, ()):
+                if name not in names:
+                    names.append(name)
+        return names
+
+    def bind_queues(self, queues):
+        self.queues = set(queues)
+
+    def warmup(self, names: list = None) -> list:
+        """
+        预先加载模型，默认加载当前 worker 消费的队列需要的模型
+        """
+        names = self.models_for_queues(self.queues) if names is None else names
+        start = time.perf_counter()
+        for name in names:
+            self.get(name)
+        if names:
+            logger.info(f"模型预热完成: {names}，耗时{time.perf_counter() - start:.3f}s，RSS {get_rss_mb():.1f}MB")
+        return names
+
+    def stats(self) -> dict:
+        return {
+            "queues": sorted(self.queues) if self.queues is not None else None,
+            "rss_mb": round(get_rss_mb(), 1),
+            "models": [dict(self._stats[name]) for name in self._instances],
+        }
+
+
+registry = ModelRegistry(MODEL_FACTORIES, QUEUE_MODELS)
+
+
+def _is_prefork(pool_cls) -> bool:
+    if isinstance(pool_cls, str):
+        return pool_cls == "prefork"
+    return "prefork" in getattr(pool_cls, "__module__", "")
+
+
+@worker_init.connect
+def preload_worker_models(sender, **kwargs):
+    """
+    prefork 池: 在 fork 子进程之前由主进程加载模型，子进程继承已加载的实例，权重内存以写时复制方式共享。
+    加载后 gc.freeze 把已有对象移出 gc 跟踪，避免子进程的垃圾回收改写这些对象所在的内存页。
+    同时按 fork 时的 RSS 设置子进程的内存回收阈值。
+    """
+    prefork = _is_prefork(sender.pool_cls)
+    if PRELOAD_MODELS and prefork:
+        if DEVICE != "cpu":
+            # CUDA/NPU 上下文不能跨 fork 使用
+            logger.warning(f"DEVICE={DEVICE}，不支持在主进程预加载模型，改为子进程各自加载")
+        else:
+            registry.bind_queues(sender.app.amqp.queues.consume_from.keys())
+            registry.warmup()
+            gc.collect()
+            gc.freeze()
+
+    if prefork and not WORKER_MAX_MEMORY_PER_CHILD_MB and WORKER_MAX_MEMORY_GROWTH_MB:
+        sender.max_memory_per_child = int((get_rss_mb() + WORKER_MAX_MEMORY_GROWTH_MB) * 1024)
+        logger.info(f"子进程内存上限: {sender.max_memory_per_child / 1024:.0f}MB")
+
+
+@celeryd_after_setup.connect
+def bind_worker_queues(sender, instance, **kwargs):
+    """
+    记录 worker 启动时指定的队列（-Q），只预热这些队列需要的模型
+    """
+    registry.bind_queues(instance.app.amqp.queues.consume_from.keys())
+    registry.pool_cls = instance.pool_cls
+
+
+@worker_process_init.connect
+def warmup_child_process(**kwargs):
+    # prefork 子进程启动时预热
+    if MODEL_WARMUP:
+        registry.warmup()
+
+
+@worker_ready.connect
+def warmup_worker(**kwargs):
+    # solo/threads 等非 prefork 池在主进程里执行任务，在这里预热
+    pool_cls = registry.pool_cls
+    if MODEL_WARMUP and pool_cls is not None and "prefork" not in getattr(pool_cls, "__module__", ""):
+        registry.warmup()
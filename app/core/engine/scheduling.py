@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: scheduling
+Time: 2025/7/5 10:30
+"""
+import logging
+import threading
+import time
+
+from app.config.conf import (
+    BULK_MAX_IN_FLIGHT,
+    DEFAULT_TENANT,
+    FAIR_SHARE_BACKEND,
+    FAIR_SHARE_POLL_INTERVAL,
+    FAIR_SHARE_TENANT_TTL,
+    INTERACTIVE_MAX_PAGES,
+    TASK_PRIORITY_BULK,
+    TASK_PRIORITY_INTERACTIVE,
+)
+from app.core.engine.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# 调度通道: 交互请求（单页、少量图片）优先于批量请求（pdf、大量图片）出队
+LANE_INTERACTIVE = "interactive"
+LANE_BULK = "bulk"
+LANE_PRIORITIES = {LANE_INTERACTIVE: TASK_PRIORITY_INTERACTIVE, LANE_BULK: TASK_PRIORITY_BULK}
+
+
+def resolve_lane(lane: str = None, pages: int = 1, is_pdf: bool = False) -> str:
+    """
+    按请求规模选择通道: pdf 和超过 INTERACTIVE_MAX_PAGES 的图片走批量通道。
+    客户端只能把小请求降级到批量通道，大请求指定 interactive 时忽略，避免绕过批量优先级和公平分配
+    """
+    if lane is not None and lane not in LANE_PRIORITIES:
+        raise ValueError(f"unsupported lane: {lane}")
+    if is_pdf or pages > INTERACTIVE_MAX_PAGES:
+        if lane == LANE_INTERACTIVE:
+            logger.info(f"pdf 或超过{INTERACTIVE_MAX_PAGES}页的请求不能使用 interactive 通道，改为 bulk")
+        return LANE_BULK
+    return lane or LANE_INTERACTIVE
+
+
+def lane_priority(lane: str) -> int:
+    return LANE_PRIORITIES[lane]
+
+
+# KEYS[1]: 各租户在队列中的页数 hash; KEYS[2]: 活跃租户 zset（score 为最近一次申请的时间）
+# ARGV: 租户, 当前时间, 活跃租户 ttl, 总容量
+# 租户重新变为活跃时清掉旧计数，投递进程异常退出时没有 release 的页面不会永久占用份额
+_ACQUIRE_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[2] - ARGV[3])
+if redis.call('ZADD', KEYS[2], ARGV[2], ARGV[1]) == 1 then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+end
+local share = math.max(math.floor(ARGV[4] / redis.call('ZCARD', KEYS[2])), 1)
+local used = tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or '0')
+if used < share then
+    redis.call('HINCRBY', KEYS[1], ARGV[1], 1)
+    return 1
+end
+return 0
+"""
+
+_RELEASE_SCRIPT = """
+local used = redis.call('HINCRBY', KEYS[1], ARGV[1], -1)
+if used <= 0 then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+    redis.call('ZREM', KEYS[2], ARGV[1])
+end
+return used
+"""
+
+
+class FairShare:
+    """
+    批量通道的租户公平分配: 所有租户同时在队列中的批量页面数不超过 capacity，由活跃租户平分，
+    单个租户的大批量任务不会占满队列，新加入的租户在已排队的页面完成后即可获得同等份额。
+    持有份额的页面完成后 release，投递方在份额用完时等待自己最早的页面完成
+    """
+
+    def __init__(self, capacity: int = BULK_MAX_IN_FLIGHT, tenant_ttl: int = FAIR_SHARE_TENANT_TTL):
+        self.capacity = max(capacity, 1)
+        self.tenant_ttl = tenant_ttl
+
+    def try_acquire(self, tenant: str) -> bool:
+        raise NotImplementedError
+
+    def release(self, tenant: str):
+        raise NotImplementedError
+
+    def share(self, tenant: str) -> int:
+        """
+        当前每个活跃租户的份额
+        """
+        raise NotImplementedError
+
+    def acquire(self, tenant: str, poll_interval: float = FAIR_SHARE_POLL_INTERVAL):
+        """
+        阻塞直到获得份额，用于投递方没有可等待的页面时
+        """
+        while not self.try_acquire(tenant):
+            time.sleep(poll_interval)
+
+
+class RedisFairShare(FairShare):
+    """
+    计数存储在 REDIS_CACHE_DB 中，多个 api 进程和 pdf_ingest_task 共享
+    """
+    inflight_key = "fairshare:inflight"
+    active_key = "fairshare:active"
+
+    def __init__(self, client=None, capacity: int = BULK_MAX_IN_FLIGHT, tenant_ttl: int = FAIR_SHARE_TENANT_TTL):
+        super().__init__(capacity, tenant_ttl)
+        self.client = client or get_redis_client()
+        self._acquire = self.client.register_script(_ACQUIRE_SCRIPT)
+        self._release = self.client.register_script(_RELEASE_SCRIPT)
+
+    def try_acquire(self, tenant: str) -> bool:
+        keys = [self.inflight_key, self.active_key]
+        return bool(self._acquire(keys=keys, args=[tenant, time.time(), self.tenant_ttl, self.capacity]))
+
+    def release(self, tenant: str):
+        self._release(keys=[self.inflight_key, self.active_key], args=[tenant])
+
+    def share(self, tenant: str) -> int:
+        active = self.client.zcount(self.active_key, time.time() - self.tenant_ttl, "+inf")
+        return max(self.capacity // max(active, 1), 1)
+
+
+class MemoryFairShare(FairShare):
+    """
+    进程内计数，用于单机调试和负载测试
+    """
+
+    def __init__(self, capacity: int = BULK_MAX_IN_FLIGHT, tenant_ttl: int = FAIR_SHARE_TENANT_TTL, clock=time.time):
+        super().__init__(capacity, tenant_ttl)
+        self.clock = clock
+        self.inflight = {}
+        self.active = {}
+        self._lock = threading.Lock()
+
+    def _active_count(self, now: float) -> int:
+        for tenant, last_seen in list(self.active.items()):
+            if last_seen < now - self.tenant_ttl:
+                del self.active[tenant]
+        return len(self.active)
+
+    def try_acquire(self, tenant: str) -> bool:
+        with self._lock:
+            now = self.clock()
+            active = self._active_count(now)
+            if tenant not in self.active:
+                self.inflight.pop(tenant, None)
+                active += 1
+            self.active[tenant] = now
+            share = max(self.capacity // active, 1)
+            if self.inflight.get(tenant, 0) < share:
+                self.inflight[tenant] = self.inflight.get(tenant, 0) + 1
+                return True
+            return False
+
+    def release(self, tenant: str):
+        with self._lock:
+            used = self.inflight.get(tenant, 0) - 1
+            if used <= 0:
+                self.inflight.pop(tenant, None)
+                self.active.pop(tenant, None)
+            else:
+                self.inflight[tenant] = used
+
+    def share(self, tenant: str) -> int:
+        with self._lock:
+            return max(self.capacity // max(self._active_count(self.clock()), 1), 1)
+
+
+class NullFairShare(FairShare):
+    """
+    关闭公平分配时使用，只受单个文档的 max_in_flight 限制
+    """
+
+    def try_acquire(self, tenant: str) -> bool:
+        return True
+
+    def release(self, tenant: str):
+        pass
+
+    def share(self, tenant: str) -> int:
+        return self.capacity
+
+
+def build_fair_share(backend: str = FAIR_SHARE_BACKEND) -> FairShare:
+    """
+    :param backend: redis / memory / none
+    """
+    if backend == "redis":
+        return RedisFairShare()
+    if backend == "memory":
+        return MemoryFairShare()
+    if backend == "none":
+        return NullFairShare()
+    raise ValueError(f"unsupported fair share backend: {backend}")
+
+
+_fair_share = None
+_fair_share_lock = threading.Lock()
+
+
+def get_fair_share() -> FairShare:
+    """
+    :return: 进程内共享的 FairShare，memory 后端的计数在同一进程的各次投递之间生效，redis 后端只注册一次脚本
+    """
+    global _fair_share
+    if _fair_share is None:
+        with _fair_share_lock:
+            if _fair_share is None:
+                _fair_share = build_fair_share()
+    return _fair_share
+
+
+def normalize_tenant(tenant: str = None) -> str:
+    return (tenant or "").strip() or DEFAULT_TENANT
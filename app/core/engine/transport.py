@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: transport
+Time: 2025/6/18 10:12
+"""
+import base64
+import hashlib
+import logging
+import os
+import re
+import time
+from pathlib import Path
+
+from app.config.conf import IMAGE_TRANSPORT, IMAGE_STORE_DIR, IMAGE_STORE_TTL
+from app.core.engine.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# 图片引用格式: "imgref:<scheme>:<sha256>"，base64 字符集中不包含 ":"，可以和 base64 字符串直接区分
+HANDLE_PREFIX = "imgref"
+# 只接受 sha256 的十六进制摘要，避免引用中的路径或任意 redis key 被当作图片读取
+DIGEST_RE = re.compile(r"[0-9a-f]{64}")
+
+
+class ImageStore:
+    """
+    内容寻址的图片存储，相同内容的图片只存储一份
+    """
+    scheme = ""
+
+    def put(self, data: bytes) -> str:
+        raise NotImplementedError
+
+    def get(self, digest: str) -> bytes:
+        raise NotImplementedError
+
+    def delete(self, digest: str):
+        raise NotImplementedError
+
+    def handle(self, digest: str) -> str:
+        return f"{HANDLE_PREFIX}:{self.scheme}:{digest}"
+
+    @staticmethod
+    def digest(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def check_digest(digest: str) -> str:
+        if not isinstance(digest, str) or not DIGEST_RE.fullmatch(digest):
+            raise ValueError(f"invalid image digest: {digest!r}")
+        return digest
+
+
+class RedisImageStore(ImageStore):
+    """
+    图片存储在 REDIS_CACHE_DB 中，适用于跨机器的 worker
+    """
+    scheme = "redis"
+    key_prefix = "image:"
+
+    def __init__(self, client=None, ttl: int = IMAGE_STORE_TTL):
+        self.client = client or get_redis_client()
+        self.ttl = ttl
+
+    def put(self, data: bytes) -> str:
+        digest = self.digest(data)
+        # 已存在时只刷新过期时间
+        if not self.client.set(self._key(digest), data, ex=self.ttl, nx=True):
+            self.client.expire(self._key(digest), self.ttl)
+        return self.handle(digest)
+
+    def _key(self, digest: str) -> str:
+        return self.key_prefix + self.check_digest(digest)
+
+    def get(self, digest: str) -> bytes:
+        data = self.client.get(self._key(digest))
+        if data is None:
+            raise KeyError(f"image {digest} not found in redis, it may have expired")
+        return data
+
+    def delete(self, digest: str):
+        self.client.delete(self._key(digest))
+
+
+class LocalImageStore(ImageStore):
+    """
+    图片存储在本地共享目录中（默认 /dev/shm，即共享内存），适用于同一台机器上的 worker
+    """
+    scheme = "local"
+
+    def __init__(self, root: str = IMAGE_STORE_DIR, ttl: int = IMAGE_STORE_TTL):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+
+    def _path(self, digest: str) -> Path:
+        self.check_digest(digest)
+        return self.root / digest[:2] / digest
+
+    def put(self, data: bytes) -> str:
+        digest = self.digest(data)
+        path = self._path(digest)
+        if path.exists():
+            os.utime(path)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # 先写临时文件再原子替换，避免其他进程读到写了一半的文件
+            tmp_path = path.with_name(f"{digest}.{os.getpid()}.tmp")
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+        return self.handle(digest)
+
+    def get(self, digest: str) -> bytes:
+        try:
+            return self._path(digest).read_bytes()
+        except FileNotFoundError:
+            raise KeyError(f"image {digest} not found in {self.root}, it may have expired")
+
+    def delete(self, digest: str):
+        self._path(digest).unlink(missing_ok=True)
+
+    def cleanup(self):
+        """
+        删除超过 ttl 未被访问的图片
+        """
+        expire_before = time.time() - self.ttl
+        removed = 0
+        for path in self.root.glob("*/*"):
+            if path.stat().st_mtime < expire_before:
+                path.unlink(missing_ok=True)
+                removed += 1
+        logger.info(f"清理了{removed}张过期图片")
+        return removed
+
+
+_image_stores = {}
+
+
+def get_image_store(scheme: str = IMAGE_TRANSPORT) -> ImageStore:
+    if scheme not in _image_stores:
+        if scheme == RedisImageStore.scheme:
+            _image_stores[scheme] = RedisImageStore()
+        elif scheme == LocalImageStore.scheme:
+            _image_stores[scheme] = LocalImageStore()
+        else:
+            raise ValueError(f"unsupported image store: {scheme}")
+    return _image_stores[scheme]
+
+
+def is_image_handle(payload: str) -> bool:
+    return payload.startswith(f"{HANDLE_PREFIX}:")
+
+
+def pack_image(data: bytes, transport: str = IMAGE_TRANSPORT) -> str:
+    """
+    生成任务参数中传递的图片: transport 为 base64 时返回 base64 字符串，否则写入存储并返回引用
+    """
+    if transport == "base64":
+        return base64.b64encode(data).decode("ascii")
+    return get_image_store(transport).put(data)
+
+
+def decode_base64_image(payload: str) -> bytes:
+    """
+    解码客户端上传的 base64 图片。图片引用只能由服务端生成，客户端传入时拒绝
+    """
+    if not isinstance(payload, str) or is_image_handle(payload):
+        raise ValueError("image must be a base64 string")
+    return base64.b64decode(payload)
+
+
+def load_image_bytes(payload: str) -> bytes:
+    """
+    从任务参数中还原图片字节，兼容 base64 字符串和服务端生成的图片引用
+    """
+    if not is_image_handle(payload):
+        return base64.b64decode(payload)
+    _, scheme, digest = payload.split(":", 2)
+    return get_image_store(scheme).get(digest)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: worker_stats
+Time: 2025/7/9 10:30
+"""
+import json
+import logging
+import os
+import time
+
+from app.config.conf import METRICS_FLUSH_INTERVAL, METRICS_SINK, WORKER_STATS_TTL
+from app.core.engine.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+REDIS_WORKER_STATS_KEY = "metrics:worker_stats"
+
+
+class RedisWorkerStats:
+    """
+    prefork 池中缓存、模型和微批都在子进程里，inspect 命令由 worker 主进程执行，看不到子进程的计数。
+    各进程把自己的统计快照写入同一个 redis hash，inspect 命令从中读取并汇总:
+        field: {worker 节点名}|{pid}，value: {"updated": 时间戳, "stats": {类别: 统计}}
+    超过 ttl 秒没有更新的快照视为进程已退出
+    """
+
+    def __init__(self, client=None, key: str = REDIS_WORKER_STATS_KEY, ttl: int = WORKER_STATS_TTL):
+        self.client = client or get_redis_client()
+        self.key = key
+        self.ttl = ttl
+
+    def write(self, hostname: str, stats: dict, pid: int = None):
+        value = json.dumps({"updated": time.time(), "stats": stats}, ensure_ascii=False)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hset(self.key, f"{hostname}|{pid or os.getpid()}", value)
+        pipe.expire(self.key, self.ttl)
+        pipe.execute()
+
+    def read(self, hostname: str = None) -> dict:
+        """
+        :param hostname: 只返回该 worker 节点下各进程的快照，默认返回所有节点
+        :return: {field: 统计}
+        """
+        now = time.time()
+        processes, expired = {}, []
+        for field, value in self.client.hgetall(self.key).items():
+            field = field.decode() if isinstance(field, bytes) else field
+            snapshot = json.loads(value)
+            if now - snapshot["updated"] > self.ttl:
+                expired.append(field)
+            elif hostname is None or field.rsplit("|", 1)[0] == hostname:
+                processes[field] = snapshot["stats"]
+        if expired:
+            self.client.hdel(self.key, *expired)
+        return processes
+
+
+def get_worker_stats_sink():
+    if METRICS_SINK == "redis":
+        return RedisWorkerStats()
+    return None
+
+
+_last_publish = 0.0
+
+
+def publish_worker_stats(hostname: str, collect, sink=None, force: bool = False):
+    """
+    把本进程的统计快照写入 sink，按 METRICS_FLUSH_INTERVAL 节流
+    :param collect: 返回本进程统计的函数，只在需要写出时调用
+    """
+    global _last_publish
+    sink = sink or get_worker_stats_sink()
+    now = time.monotonic()
+    if sink is None or not (force or now - _last_publish >= METRICS_FLUSH_INTERVAL):
+        return
+    _last_publish = now
+    try:
+        sink.write(hostname, collect())
+    except Exception as e:
+        logger.warning(f"写入 worker 统计失败: {e}")
+
+
+def merge_counters(items: list, key: str, rate: str, numerator: tuple, denominator: tuple) -> list:
+    """
+    按 key（如 namespace）合并各进程的计数，比例字段按合并后的计数重新计算
+    :param rate: 比例字段名，值为 sum(numerator) / sum(denominator)
+    """
+    merged = {}
+    for item in items:
+        total = merged.setdefault(item[key], {key: item[key]})
+        for name, value in item.items():
+            if name not in (key, rate) and isinstance(value, (int, float)) and not isinstance(value, bool):
+                total[name] = total.get(name, 0) + value
+    for total in merged.values():
+        count = sum(total.get(name, 0) for name in denominator)
+        total[rate] = sum(total.get(name, 0) for name in numerator) / count if count else 0.0
+    return [merged[name] for name in sorted(merged)]
@@ -10,41 +10,68 @@ import os
 
 import cv2
 import numpy as np
-import torch
-from doclayout_yolo import YOLOv10
 
-from app.common.utils import visualize_bbox
+from app.common.metrics import STAGE_LAYOUT_INFERENCE, timer
+from app.common.tiling import build_tiler
+from app.common.utils import get_bboxes_from_polys, visualize_bbox
+from app.config.conf import RAW_OUTPUT_DIR
+from app.core.backend.onnx_runtime import BACKEND_ONNXRUNTIME, BACKEND_TORCH, get_backend
+
+LAYOUT_CATEGORIES = {
+    0: 'title',
+    1: 'plain text',
+    2: 'abandon',
+    3: 'figure',
+    4: 'figure_caption',
+    5: 'table',
+    6: 'table_caption',
+    7: 'table_footnote',
+    8: 'isolate_formula',
+    9: 'formula_caption'
+}
+
+
+def build_layout_model(config):
+    """
+    按 model_config.backend 创建版面检测模型，torch 与 doclayout_yolo 只在 torch 后端时导入
+    """
+    backend = get_backend(config, BACKEND_TORCH)
+    if backend == BACKEND_ONNXRUNTIME:
+        from app.core.backend.yolo_onnx import YOLOv10Onnx
+        return YOLOv10Onnx(config)
+    if backend != BACKEND_TORCH:
+        raise ValueError(f"unsupported layout backend: {backend}")
+    from doclayout_yolo import YOLOv10
+    return YOLOv10(config["model_path"])
 
 
 class LayoutYOLOv10:
-    def __init__(self, config):
-
-        self.id_to_names = {
-            0: 'title',
-            1: 'plain text',
-            2: 'abandon',
-            3: 'figure',
-            4: 'figure_caption',
-            5: 'table',
-            6: 'table_caption',
-            7: 'table_footnote',
-            8: 'isolate_formula',
-            9: 'formula_caption'
-        }
+    def __init__(self, config, model=None):
+        """
+        :param model: 已构造的模型实例（与 YOLOv10 接口一致，如基准测试中的替身模型），默认按 backend 配置加载
+        """
 
-        self.model = YOLOv10(config["model_path"])
+        self.id_to_names = dict(LAYOUT_CATEGORIES)
+
+        self.model = model if model is not None else build_layout_model(config)
         # Set model parameters
         self.img_size = config.get('img_size', 1280)
         self.conf_thres = config.get('conf_thres', 0.25)
+        # 模型输出的置信度下限，只在保存原始输出时低于 conf_thres，便于离线调低 conf_thres；
+        # 低于 conf_thres 的框由 LayoutPostprocess 过滤，不影响在线结果
+        self.raw_conf_thres = self.conf_thres
+        if RAW_OUTPUT_DIR:
+            self.raw_conf_thres = min(config.get('raw_conf_thres', self.conf_thres), self.conf_thres)
         self.iou_thres = config.get('iou_thres', 0.45)
         self.visualize = config.get('visualize', False)
         self.nc = config.get('nc', 10)
         self.workers = config.get('workers', 8)
         self.device = config.get('device', 'cpu')
-
-        if self.iou_thres > 0:
-            import torchvision
-            self.nms_func = torchvision.ops.nms
+        # 批量推理参数
+        self.batch_size = config.get('batch_size', 8)
+        self.max_batch_mem_mb = config.get('max_batch_mem_mb', 512)
+        # 超大页面切块检测
+        self.tiler = build_tiler(config.get('tiling'))
 
     def predict(self, image: np.ndarray, result_path=None):
         """
@@ -52,16 +79,116 @@ class LayoutYOLOv10:
         :param result_path:
         :return:
         """
-        result = self.model.predict(image, iou=self.iou_thres, verbose=False, device=self.device)[0]
+        if self.tiler is not None and self.tiler.applies(image.shape[1], image.shape[0]):
+            return self.predict_batch([image])[0]
+        with timer(STAGE_LAYOUT_INFERENCE):
+            result = self.model.predict(image, iou=self.iou_thres, conf=self.raw_conf_thres, verbose=False,
+                                        device=self.device)[0]
+
+        # if self.visualize:
+        #     self.result_visualize(image_id, image, boxes, classes, scores, result_path)
+
+        return self._format_result(result, image)
+
+    def predict_batch(self, images: list, batch_size: int = None, max_batch_mem_mb: float = None):
+        """
+        多页批量推理，每个批次只调用一次模型
+        :param images: np.ndarray 页面图片列表
+        :param batch_size: 每批最多的页数，默认取配置中的 batch_size
+        :param max_batch_mem_mb: 每批图片占用内存的上限(MB)，默认取配置中的 max_batch_mem_mb
+        :return: 与 images 一一对应的结果列表，每个结果的格式与 predict 相同
+        """
+        if self.tiler is not None and any(self.tiler.applies(image.shape[1], image.shape[0]) for image in images):
+            return self._predict_tiled(images, batch_size, max_batch_mem_mb)
+        return self._predict_arrays(images, batch_size, max_batch_mem_mb)
+
+    def _predict_arrays(self, images: list, batch_size: int = None, max_batch_mem_mb: float = None):
+        results = []
+        for batch in self.split_batches(images, batch_size, max_batch_mem_mb):
+            with timer(STAGE_LAYOUT_INFERENCE):
+                batch_results = self.model.predict(batch, iou=self.iou_thres, conf=self.raw_conf_thres, verbose=False,
+                                                   device=self.device)
+            results.extend(self._format_result(result, image) for result, image in zip(batch_results, batch))
+        return results
+
+    def _predict_tiled(self, images: list, batch_size: int = None, max_batch_mem_mb: float = None):
+        """
+        超过切块阈值的页面切成有重叠的切块，与其他页面一起按批推理，再把切块的结果合并回整页
+        """
+        inputs, plans = [], []
+        for image in images:
+            height, width = image.shape[:2]
+            plan = self.tiler.plan(width, height) if self.tiler.applies(width, height) else None
+            crops = plan.crops(image) if plan is not None else [image]
+            plans.append((plan, len(crops)))
+            inputs.extend(crops)
+
+        outputs = self._predict_arrays(inputs, batch_size, max_batch_mem_mb)
+        results, offset = [], 0
+        for image, (plan, count) in zip(images, plans):
+            page_results, offset = outputs[offset:offset + count], offset + count
+            if plan is None:
+                results.append(page_results[0])
+            else:
+                results.append(self._merge_tiles(plan, page_results, image))
+        return results
+
+    def _merge_tiles(self, plan, tile_results: list, image: np.ndarray):
+        """
+        切块结果按 conf_thres 分成两组分别合并: 高于 conf_thres 的框合并得到在线结果，与不保存原始输出时相同；
+        低置信度的框（只在 raw_conf_thres 低于 conf_thres 时存在）单独合并后附在后面，由 LayoutPostprocess 过滤
+        """
+        layout_dets = []
+        for confident in (True, False):
+            tile_dets = [[det for det in result["layout_dets"] if (det["score"] > self.conf_thres) == confident]
+                         for result in tile_results]
+            layout_dets.extend(self._merge_tile_dets(plan, tile_dets))
+        return {
+            "layout_dets": layout_dets,
+            "page_info": {
+                "height": image.shape[0],
+                "width": image.shape[1]
+            }
+        }
+
+    def _merge_tile_dets(self, plan, tile_dets: list) -> list:
+        dets = [det for dets in tile_dets for det in dets]
+        bboxes, representative, _ = self.tiler.merge(
+            plan,
+            get_bboxes_from_polys([det["poly"] for det in dets]),
+            plan.tile_ids([len(dets) for dets in tile_dets]),
+            labels=[det["category_id"] for det in dets],
+            scores=[det["score"] for det in dets],
+        )
+        return [
+            {"poly": bbox.tolist(), "category_id": dets[idx]["category_id"], "score": dets[idx]["score"]}
+            for bbox, idx in zip(bboxes, representative)
+        ]
+
+    def split_batches(self, images: list, batch_size: int = None, max_batch_mem_mb: float = None):
+        """
+        按页数和内存上限切分批次，单页超过内存上限时单独成批
+        """
+        batch_size = max(int(batch_size or self.batch_size), 1)
+        max_batch_bytes = (max_batch_mem_mb or self.max_batch_mem_mb) * 1024 * 1024
+
+        batch, batch_bytes = [], 0
+        for image in images:
+            if batch and (len(batch) >= batch_size or batch_bytes + image.nbytes > max_batch_bytes):
+                yield batch
+                batch, batch_bytes = [], 0
+            batch.append(image)
+            batch_bytes += image.nbytes
+        if batch:
+            yield batch
+
+    @staticmethod
+    def _format_result(result, image: np.ndarray):
         boxes = result.boxes.xyxy.tolist()
         classes = result.boxes.cls.tolist()
         scores = result.boxes.conf.tolist()
         keys = ["poly", "category_id", "score"]
         layout_results = [dict(zip(keys, values)) for values in zip(boxes, classes, scores)]
-
-        # if self.visualize:
-        #     self.result_visualize(image_id, image, boxes, classes, scores, result_path)
-
         return {
             "layout_dets": layout_results,
             "page_info": {
@@ -76,8 +203,10 @@ class LayoutYOLOv10:
                 os.makedirs(result_path)
 
         if self.iou_thres > 0:
-            indices = self.nms_func(boxes=torch.Tensor(boxes), scores=torch.Tensor(scores),
-                                    iou_threshold=self.iou_thres)
+            import torch
+            import torchvision
+            indices = torchvision.ops.nms(boxes=torch.Tensor(boxes), scores=torch.Tensor(scores),
+                                            iou_threshold=self.iou_thres)
             boxes, scores, classes = boxes[indices], scores[indices], classes[indices]
             if len(boxes.shape) == 1:
                 boxes = np.expand_dims(boxes, 0)
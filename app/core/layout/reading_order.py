@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: reading_order
+Time: 2025/6/26 10:40
+"""
+import numpy as np
+
+from app.common.utils import get_bboxes_from_polys
+
+# 标题/注释 -> 所属的主体类别
+CAPTION_PARENTS = {
+    "figure_caption": ("figure",),
+    "table_caption": ("table",),
+    "table_footnote": ("table",),
+    "formula_caption": ("isolate_formula",),
+}
+ABANDON_CATEGORY = "abandon"
+
+# 计算切分时每个框向内收缩的像素数，容忍检测框之间的轻微重叠
+SHRINK = 2.0
+
+
+def _shrink(bboxes: np.ndarray, shrink: float) -> np.ndarray:
+    boxes = bboxes.copy()
+    half_w = (boxes[:, 2] - boxes[:, 0]) / 2
+    half_h = (boxes[:, 3] - boxes[:, 1]) / 2
+    dx = np.minimum(shrink, np.maximum(half_w - 0.5, 0))
+    dy = np.minimum(shrink, np.maximum(half_h - 0.5, 0))
+    boxes[:, 0] += dx
+    boxes[:, 2] -= dx
+    boxes[:, 1] += dy
+    boxes[:, 3] -= dy
+    return boxes
+
+
+def _split_axis(starts: np.ndarray, ends: np.ndarray):
+    """
+    投影切分: 按起点排序后，若某个框的起点不小于前面所有框终点的最大值，则在此处有空白可切
+    :return: (排序后的下标, 切分位置列表)
+    """
+    order = np.argsort(starts, kind="stable")
+    running_end = np.maximum.accumulate(ends[order])
+    cuts = np.nonzero(starts[order][1:] >= running_end[:-1])[0] + 1
+    return order, cuts
+
+
+def _gutters(band: np.ndarray, boxes: np.ndarray, band_x0: float, band_x1: float, lo: float, hi: float) -> list:
+    """
+    一组框在 [lo, hi] 范围内没有被任何框覆盖的 x 区间
+    """
+    if len(band) == 1:
+        return [(a, b) for a, b in ((lo, band_x0), (band_x1, hi)) if b > a]
+    x0, x1 = boxes[band, 0], boxes[band, 2]
+    order = np.argsort(x0, kind="stable")
+    running_end = np.maximum.accumulate(x1[order])
+    starts = np.concatenate([[lo], running_end])
+    ends = np.concatenate([x0[order], [hi]])
+    free = ends > starts
+    return list(zip(starts[free].tolist(), ends[free].tolist()))
+
+
+def _intersect(gutters_a: list, gutters_b: list) -> list:
+    result = []
+    i = j = 0
+    while i < len(gutters_a) and j < len(gutters_b):
+        lo = max(gutters_a[i][0], gutters_b[j][0])
+        hi = min(gutters_a[i][1], gutters_b[j][1])
+        if hi > lo:
+            result.append((lo, hi))
+        if gutters_a[i][1] < gutters_b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def _split(sorted_indices: np.ndarray, cuts: np.ndarray) -> list:
+    bounds = [0] + cuts.tolist() + [len(sorted_indices)]
+    return [sorted_indices[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def _merge_bands(boxes: np.ndarray, node: np.ndarray, order: np.ndarray, cuts: np.ndarray, indices: np.ndarray):
+    """
+    合并相邻的、存在共同竖直空白（分栏间隙）的水平条带，避免双栏页面中对齐的段落被按行交错
+    :param order: 节点内按 y0 排序的下标
+    :param cuts: 水平切分位置
+    """
+    lo, hi = float(node[:, 0].min()), float(node[:, 2].max())
+    starts = np.concatenate([[0], cuts])
+    band_x0 = np.minimum.reduceat(node[order, 0], starts).tolist()
+    band_x1 = np.maximum.reduceat(node[order, 2], starts).tolist()
+    bands = _split(indices[order], cuts)
+
+    # 快速路径: 全部是单框条带且相邻条带在 x 方向相交时，不存在共同的分栏间隙，无需合并
+    if len(bands) == len(order):
+        x0, x1 = np.asarray(band_x0), np.asarray(band_x1)
+        if np.all((x0[1:] < x1[:-1]) & (x0[:-1] < x1[1:])):
+            return bands
+
+    groups = []
+    current, current_gutters, current_lo, current_hi = None, None, None, None
+    for band, x0, x1 in zip(bands, band_x0, band_x1):
+        gutters = _gutters(band, boxes, x0, x1, lo, hi)
+        if current is not None:
+            merged_lo, merged_hi = min(current_lo, x0), max(current_hi, x1)
+            # 只有共同空白位于合并后区域内部（两侧都有框）时才是分栏间隙
+            common = [
+                (a, b) for a, b in _intersect(current_gutters, gutters)
+                if a > merged_lo and b < merged_hi
+            ]
+            if common:
+                current.append(band)
+                current_gutters, current_lo, current_hi = common, merged_lo, merged_hi
+                continue
+            groups.append(current)
+        current, current_gutters, current_lo, current_hi = [band], gutters, x0, x1
+    groups.append(current)
+    return [group[0] if len(group) == 1 else np.concatenate(group) for group in groups]
+
+
+def _xy_cut(boxes: np.ndarray, indices: np.ndarray, out: list):
+    node = boxes[indices]
+
+    # 优先竖直切分（分栏），从左到右
+    order, cuts = _split_axis(node[:, 0], node[:, 2])
+    if len(cuts):
+        groups = _split(indices[order], cuts)
+    else:
+        # 水平切分，从上到下，合并属于同一分栏结构的条带
+        order, cuts = _split_axis(node[:, 1], node[:, 3])
+        groups = _merge_bands(boxes, node, order, cuts, indices) if len(cuts) else []
+
+    if len(groups) <= 1:
+        # 无法切分时按 (y0, x0) 排序
+        order = np.lexsort((node[:, 0], node[:, 1]))
+        out.extend(indices[order].tolist())
+        return
+    for group in groups:
+        if len(group) == 1:
+            out.append(int(group[0]))
+        else:
+            _xy_cut(boxes, group, out)
+
+
+def xy_cut_order(bboxes, shrink: float = SHRINK) -> list:
+    """
+    递归 XY-cut 计算阅读顺序
+    :param bboxes: (n, 4) 的 [x1, y1, x2, y2] 数组
+    :param shrink: 切分时每个框向内收缩的像素数
+    :return: 按阅读顺序排列的下标列表
+    """
+    bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+    if len(bboxes) <= 1:
+        return list(range(len(bboxes)))
+    out = []
+    _xy_cut(_shrink(bboxes, shrink), np.arange(len(bboxes)), out)
+    return out
+
+
+def _attach_captions(bboxes: np.ndarray, categories: list, body: list) -> dict:
+    """
+    为每个标题/注释找到距离最近的主体（图、表、公式），找不到主体的标题按普通块排序
+    :return: {主体下标: [(标题下标, 是否在主体上方)]}
+    """
+    if not any(categories[idx] in CAPTION_PARENTS for idx in body):
+        return {}
+    candidates_by_parents = {}
+    for parents in set(CAPTION_PARENTS.values()):
+        candidates_by_parents[parents] = np.array([j for j in body if categories[j] in parents], dtype=np.intp)
+
+    attached = {}
+    for idx in body:
+        parents = CAPTION_PARENTS.get(categories[idx])
+        if parents is None or not len(candidates_by_parents[parents]):
+            continue
+        candidates = candidates_by_parents[parents]
+        caption, others = bboxes[idx], bboxes[candidates]
+        # 框与框之间的间隙距离，相交时为 0
+        dx = np.maximum(np.maximum(others[:, 0] - caption[2], caption[0] - others[:, 2]), 0)
+        dy = np.maximum(np.maximum(others[:, 1] - caption[3], caption[1] - others[:, 3]), 0)
+        parent = int(candidates[np.argmin(np.hypot(dx, dy))])
+        above = (caption[1] + caption[3]) < (bboxes[parent, 1] + bboxes[parent, 3])
+        attached.setdefault(parent, []).append((idx, above))
+    return attached
+
+
+def reading_order(bboxes, categories: list, page_height: float = None, shrink: float = SHRINK) -> list:
+    """
+    计算版面块的阅读顺序:
+        1. abandon 块（页眉页脚）不参与切分，页面上半部分的放在最前，下半部分的放在最后
+        2. 图表公式的标题/注释绑定到最近的主体上，在主体上方的排在主体之前，否则排在主体之后
+        3. 其余块用递归 XY-cut 排序，支持多栏
+    :param bboxes: (n, 4) 的 [x1, y1, x2, y2] 数组
+    :param categories: 每个块的类别名
+    :param page_height: 页面高度，用于区分页眉和页脚，默认使用所有块的范围
+    :return: 按阅读顺序排列的下标列表
+    """
+    bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+    n = len(bboxes)
+    if n == 0:
+        return []
+
+    abandon, body = [], []
+    for idx, category in enumerate(categories):
+        (abandon if category == ABANDON_CATEGORY else body).append(idx)
+
+    attached = _attach_captions(bboxes, categories, body)
+    captions = {caption for items in attached.values() for caption, _ in items}
+    main = np.array([idx for idx in body if idx not in captions] if captions else body, dtype=np.intp)
+
+    main_order = main[xy_cut_order(bboxes[main], shrink)].tolist() if len(main) else []
+    if attached:
+        ordered_body = []
+        for idx in main_order:
+            items = attached.get(idx)
+            if items is None:
+                ordered_body.append(idx)
+                continue
+            items = sorted(items, key=lambda item: bboxes[item[0], 1])
+            ordered_body.extend(caption for caption, above in items if above)
+            ordered_body.append(idx)
+            ordered_body.extend(caption for caption, above in items if not above)
+    else:
+        ordered_body = main_order
+
+    if not abandon:
+        return ordered_body
+    if page_height is None:
+        page_height = bboxes[:, 3].max() + bboxes[:, 1].min()
+    abandon = sorted(abandon, key=lambda idx: (bboxes[idx, 1], bboxes[idx, 0]))
+    headers = [idx for idx in abandon if (bboxes[idx, 1] + bboxes[idx, 3]) / 2 < page_height / 2]
+    footers = [idx for idx in abandon if (bboxes[idx, 1] + bboxes[idx, 3]) / 2 >= page_height / 2]
+    return headers + ordered_body + footers
+
+
+def sort_layout_dets(layout_dets, sort_by="top_left_y_then_x", id_to_names=None, page_height=None):
+    """
+    对 layout_dets 中的元素按照矩形框坐标排序
+
+    参数:
+        layout_dets: 包含 poly 和 category_id 的字典列表
+        sort_by: 排序方式，可选:
+            - 'top_left_x': 按左上角 x 坐标 (x0) 排序
+            - 'top_left_y': 按左上角 y 坐标 (y0) 排序
+            - 'top_left_y_then_x': 先按 y0 排序，再按 x0 排序（默认）
+            - 'reading_order': 多栏阅读顺序，页眉在前页脚在后，标题/注释紧跟所属的图表
+        id_to_names: 类别 id 到类别名的映射，reading_order 需要
+        page_height: 页面高度，reading_order 用于区分页眉和页脚
+
+    返回:
+        排序后的 layout_dets
+    """
+    if sort_by == "top_left_x":
+        # 按左上角 x 坐标 (x0) 排序
+        return sorted(layout_dets, key=lambda item: item["poly"][0])
+    elif sort_by == "top_left_y":
+        # 按左上角 y 坐标 (y0) 排序
+        return sorted(layout_dets, key=lambda item: item["poly"][1])
+    elif sort_by == "top_left_y_then_x":
+        # 先按 y0 排序，再按 x0 排序（类似阅读顺序）
+        return sorted(
+            layout_dets, key=lambda item: (item["poly"][1], item["poly"][0])
+        )
+    elif sort_by == "reading_order":
+        if not layout_dets:
+            return layout_dets
+        bboxes = get_bboxes_from_polys([item["poly"] for item in layout_dets])
+        categories = [id_to_names.get(int(item["category_id"])) for item in layout_dets]
+        return [layout_dets[idx] for idx in reading_order(bboxes, categories, page_height)]
+    else:
+        return layout_dets
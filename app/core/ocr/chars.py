@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: chars
+Time: 2025/6/24 10:10
+"""
+import base64
+import re
+
+import numpy as np
+
+from app.config.conf import OCR_CHAR_FORMAT
+
+# 字符结果格式
+CHAR_FORMAT_DICT = "dict"  # 每个字符一个字典（to_dchars）
+CHAR_FORMAT_COLUMNAR = "columnar"  # 列式紧凑格式（CharColumns.to_payload）
+
+STYLE_TOKEN_RE = "<(?:strike|sup|sub|b|i|overline|underline|\/(?:strike|sup|sub|b|i|overline|underline))>"
+
+
+def to_dchars(text_word, text_word_region) -> list:
+    dchars = []
+    for i, words in enumerate(text_word):
+        word_region = text_word_region[i]
+        for j, word in enumerate(words):
+            dchars.append(
+                {
+                    "height": round(word_region[j][3][1] - word_region[j][0][1], 2),
+                    "width": round(word_region[j][2][0] - word_region[j][0][0], 2),
+                    "str": word,
+                    "y": round(word_region[j][3][1], 2),
+                    "x": round(word_region[j][0][0], 2),
+                    "accumulated_y": round(word_region[j][3][1], 2),
+                }
+            )
+    return dchars
+
+
+def offset_dchars(dchars: list, dx: float, dy: float) -> list:
+    """
+    把 to_dchars 格式的字符坐标整体平移
+    """
+    for dchar in dchars:
+        dchar["x"] = round(dchar["x"] + dx, 2)
+        dchar["y"] = round(dchar["y"] + dy, 2)
+        dchar["accumulated_y"] = round(dchar["accumulated_y"] + dy, 2)
+    return dchars
+
+
+class CharColumns:
+    """
+    列式存储的字符结果: chars 为所有字符拼接的字符串（每个字符对应一个框），
+    boxes 为 (n, 4) 的 [x0, y0, x1, y1] 数组
+    """
+    __slots__ = ("chars", "boxes")
+
+    def __init__(self, chars: str = "", boxes=None):
+        self.chars = chars
+        self.boxes = np.zeros((0, 4), dtype=np.float64) if boxes is None else boxes
+
+    def __len__(self):
+        return len(self.chars)
+
+    @classmethod
+    def from_regions(cls, chars: list, chars_region: list):
+        """
+        从 chars / chars_region（4点坐标）格式转换
+        """
+        if not chars:
+            return cls()
+        points = np.asarray(chars_region, dtype=np.float64).reshape(len(chars_region), 4, 2)
+        boxes = np.stack([points[:, 0, 0], points[:, 0, 1], points[:, 2, 0], points[:, 2, 1]], axis=1)
+        return cls("".join(chars), boxes)
+
+    @classmethod
+    def concat(cls, columns_list: list):
+        columns_list = [columns for columns in columns_list if len(columns)]
+        if not columns_list:
+            return cls()
+        return cls(
+            "".join(columns.chars for columns in columns_list),
+            np.concatenate([columns.boxes for columns in columns_list]),
+        )
+
+    def offset(self, dx: float, dy: float):
+        return CharColumns(self.chars, self.boxes + np.array([dx, dy, dx, dy], dtype=self.boxes.dtype))
+
+    def to_regions(self) -> list:
+        """
+        转换为 chars_region 的4点坐标格式
+        """
+        return [
+            ((x0, y0), (x1, y0), (x1, y1), (x0, y1))
+            for x0, y0, x1, y1 in self.boxes.tolist()
+        ]
+
+    def to_dchars(self) -> list:
+        """
+        字典格式视图，与 to_dchars 的结果一致
+        """
+        if not len(self):
+            return []
+        x = np.round(self.boxes[:, 0], 2).tolist()
+        y = np.round(self.boxes[:, 3], 2).tolist()
+        width = np.round(self.boxes[:, 2] - self.boxes[:, 0], 2).tolist()
+        height = np.round(self.boxes[:, 3] - self.boxes[:, 1], 2).tolist()
+        return [
+            {"height": h, "width": w, "str": c, "y": y_, "x": x_, "accumulated_y": y_}
+            for c, x_, y_, w, h in zip(self.chars, x, y, width, height)
+        ]
+
+    def to_payload(self) -> dict:
+        """
+        可 json 序列化的紧凑格式: x / y / width / height 四列 float32 连续存储后 base64 编码，
+        x、y 为字符框左上角坐标
+        """
+        columns = np.stack([
+            self.boxes[:, 0],
+            self.boxes[:, 1],
+            self.boxes[:, 2] - self.boxes[:, 0],
+            self.boxes[:, 3] - self.boxes[:, 1],
+        ]).astype(np.float32)
+        return {
+            "format": CHAR_FORMAT_COLUMNAR,
+            "count": len(self),
+            "str": self.chars,
+            "columns": ["x", "y", "width", "height"],
+            "data": base64.b64encode(columns.tobytes()).decode("ascii"),
+        }
+
+    @classmethod
+    def from_payload(cls, payload: dict):
+        count = payload["count"]
+        columns = np.frombuffer(base64.b64decode(payload["data"]), dtype=np.float32).reshape(4, count)
+        x, y, width, height = columns.astype(np.float64)
+        return cls(payload["str"], np.stack([x, y, x + width, y + height], axis=1))
+
+
+def build_page_chars(columns: CharColumns, char_format: str = OCR_CHAR_FORMAT):
+    """
+    生成单页结果中的 chars: dict 格式为 to_dchars 列表，columnar 格式为 CharColumns.to_payload
+    """
+    if char_format == CHAR_FORMAT_COLUMNAR:
+        return columns.to_payload()
+    return columns.to_dchars()
+
+
+def is_columnar(chars) -> bool:
+    return isinstance(chars, dict) and chars.get("format") == CHAR_FORMAT_COLUMNAR
+
+
+def offset_page_chars(chars, dx: float, dy: float):
+    """
+    平移单页结果中的 chars，兼容 to_dchars 列表和列式格式
+    """
+    if is_columnar(chars):
+        return CharColumns.from_payload(chars).offset(dx, dy).to_payload()
+    return offset_dchars(chars, dx, dy)
+
+
+def extend_page_chars(chars, other):
+    """
+    合并两段单页结果中的 chars，兼容 to_dchars 列表和列式格式
+    """
+    if is_columnar(chars) or is_columnar(other):
+        return CharColumns.concat([_page_chars_columns(chars), _page_chars_columns(other)]).to_payload()
+    return chars + other
+
+
+def _page_chars_columns(chars) -> CharColumns:
+    if is_columnar(chars):
+        return CharColumns.from_payload(chars)
+    if not chars:
+        return CharColumns()
+    boxes = np.array([
+        [dchar["x"], dchar["y"] - dchar["height"], dchar["x"] + dchar["width"], dchar["y"]]
+        for dchar in chars
+    ], dtype=np.float64)
+    return CharColumns("".join(dchar["str"] for dchar in chars), boxes)
+
+
+def build_text_result(filter_boxes, filter_rec_res, char_format: str = OCR_CHAR_FORMAT) -> dict:
+    """
+    由过滤后的文本行生成 TextOcr 的结果，离线重新后处理时不需要加载模型
+    :param filter_boxes: 文本行的四点坐标
+    :param filter_rec_res: [(文本, 分数, 字符信息)]
+    """
+    ocr_result = {
+        "text": "",
+        "bbox": None,
+        "chars": [],
+        "chars_region": []
+    }
+
+    boxes_list = []
+    for box, ocr_res in zip(filter_boxes, filter_rec_res):
+        text = ocr_res[0]
+        score = ocr_res[1]
+        text = re.sub(STYLE_TOKEN_RE, "", text)
+        if not text:
+            continue
+        char_list, char_boxes = line_char_boxes(text=text, box=box, char_info=ocr_res[2])
+
+        ocr_result["text"] += text
+        ocr_result["chars"].extend(char_list)
+        boxes_list.append(char_boxes)
+
+    columns = CharColumns(boxes=np.concatenate(boxes_list)) if boxes_list else CharColumns()
+    if char_format == CHAR_FORMAT_COLUMNAR:
+        # 列式格式不再生成逐字符的4点坐标
+        columns.chars = "".join(ocr_result["chars"])
+        ocr_result["chars"] = columns.to_payload()
+        del ocr_result["chars_region"]
+    else:
+        ocr_result["chars_region"] = columns.to_regions()
+    return ocr_result
+
+
+def line_char_boxes(text, box, char_info):
+    """
+    根据OCR识别和检测的结果计算每个词的检测框
+    :param text: ocr 识别的文本
+    :param box: ocr 识别的检测区块
+    :param char_info: 识别的每个字符信息
+    :return: 字符列表, (n, 4) 的 [x0, y0, x1, y1] 字符框数组
+    """
+
+    col_num, word_list, word_col_list, state_list = char_info
+
+    box = box.tolist()
+    bbox_x_start = box[0][0]
+    bbox_x_end = box[1][0]
+    bbox_y_start = box[0][1]
+    bbox_y_end = box[2][1]
+
+    word_box_content_list = []
+    for word in word_list:
+        word_box_content_list += word
+
+    counts = np.array([len(word_col) for word_col in word_col_list], dtype=np.int64)
+    if counts.sum() == 0:
+        return word_box_content_list, np.zeros((0, 4), dtype=np.float64)
+
+    cell_width = (bbox_x_end - bbox_x_start) / col_num
+    default_char_width = (bbox_x_end - bbox_x_start) / len(text)
+
+    # 每个词的字符宽度: 多字符词按首尾字符列的跨度均分，单字符词使用平均字符宽度
+    first_col = np.array([word_col[0] for word_col in word_col_list], dtype=np.float64)
+    last_col = np.array([word_col[-1] for word_col in word_col_list], dtype=np.float64)
+    char_width = np.where(
+        counts != 1,
+        (last_col - first_col + 1) * cell_width / np.maximum(counts - 1, 1),
+        default_char_width,
+    )
+    char_width = np.repeat(char_width, counts)
+
+    center_x = (np.concatenate([np.asarray(word_col, dtype=np.float64) for word_col in word_col_list]) + 0.5) \
+        * cell_width
+    cell_x_start = np.maximum(np.trunc(center_x - char_width / 2), 0) + bbox_x_start
+    cell_x_end = np.minimum(np.trunc(center_x + char_width / 2), bbox_x_end - bbox_x_start) + bbox_x_start
+
+    char_boxes = np.empty((len(center_x), 4), dtype=np.float64)
+    char_boxes[:, 0] = cell_x_start
+    char_boxes[:, 1] = bbox_y_start
+    char_boxes[:, 2] = cell_x_end
+    char_boxes[:, 3] = bbox_y_end
+    return word_box_content_list, char_boxes
@@ -6,3 +6,150 @@ Author: youshun xu
 File: latex_ocr
 Time: 2025/6/13 18:38
 """
+import logging
+
+import cv2
+import numpy as np
+
+from app.common.image import dct_hash, ink_bbox
+from app.common.metrics import STAGE_FORMULA_REC, timer
+from app.config.conf import DEVICE
+
+logger = logging.getLogger(__name__)
+
+# 归一化时在墨迹外接框外保留的白边(px)
+FORMULA_PADDING = 4
+# 灰度低于该值的像素视为墨迹，JPEG 压缩在笔画周围产生的浅色振铃不计入
+INK_THRESHOLD = 128
+# 感知哈希: 墨迹按质量分位数对齐后缩放到固定尺寸 (height, width)，取左上角低频系数
+HASH_SIZE = (32, 256)
+HASH_KEEP = (8, 32)
+# 墨迹范围取墨迹质量的分位数，亚像素精度，不受单个像素的抗锯齿和压缩噪声影响
+INK_QUANTILES = (0.01, 0.99)
+# 按宽高比（log2）分桶的步长，只有宽高比相近的公式才比较哈希
+ASPECT_BUCKET_STEP = 0.25
+
+
+def normalize_formula(image: np.ndarray):
+    """
+    公式裁剪图归一化: 转灰度、去掉墨迹外的白边，版面框的大小差异不影响识别和哈希
+    :return: 灰度图，空白图片返回 None
+    """
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    bbox = ink_bbox(gray, INK_THRESHOLD)
+    if bbox is None:
+        return None
+    x0, y0, x1, y1 = bbox
+    crop = gray[y0:y1, x0:x1]
+    return cv2.copyMakeBorder(crop, *[FORMULA_PADDING] * 4, cv2.BORDER_CONSTANT, value=255)
+
+
+def _ink_range(profile: np.ndarray):
+    cumulative = np.cumsum(profile)
+    positions = np.arange(len(profile)) + 0.5
+    return tuple(np.interp(np.array(INK_QUANTILES) * cumulative[-1], cumulative, positions))
+
+
+def formula_signature(gray: np.ndarray):
+    """
+    归一化后公式的感知哈希，用于识别结果的近似去重。
+    墨迹范围按亚像素精度对齐到固定尺寸，同一公式在不同裁剪边距、渲染位置、分辨率、压缩质量下哈希相近
+    :return: (需要查找的宽高比桶列表，第一个为所在的桶, 哈希字节串)
+    """
+    ink = 255 - gray.astype(np.float32)
+    x0, x1 = _ink_range(ink.sum(axis=0))
+    y0, y1 = _ink_range(ink.sum(axis=1))
+    height, width = HASH_SIZE
+    scale_x, scale_y = width / max(x1 - x0, 1), height / max(y1 - y0, 1)
+    # 缩小前先模糊，避免 warpAffine 采样产生的混叠
+    ink = cv2.GaussianBlur(ink, (0, 0), sigmaX=max(0.25 / scale_x, 0.01), sigmaY=max(0.25 / scale_y, 0.01))
+    matrix = np.float32([[scale_x, 0, -x0 * scale_x], [0, scale_y, -y0 * scale_y]])
+    canonical = cv2.warpAffine(ink, matrix, (width, height), flags=cv2.INTER_LINEAR)
+
+    position = np.log2(max(x1 - x0, 1) / max(y1 - y0, 1)) / ASPECT_BUCKET_STEP
+    bucket = int(np.floor(position))
+    # 靠近桶边界的公式同时查找相邻的桶
+    neighbor = bucket + 1 if position - bucket >= 0.5 else bucket - 1
+    return [bucket, neighbor], dct_hash(canonical, HASH_SIZE, HASH_KEEP)
+
+
+class LatexOcr:
+    """
+    公式识别: VisionEncoderDecoder 模型（如 pix2text-mfr、TrOCR 结构的公式模型），一批公式一次 generate。
+    单个公式的解码长度由 max_new_tokens 限制，解码时间由 max_time 限制（同一批公式并行解码，时间预算相同），
+    没有解码到结束符的结果标记为 truncated
+    """
+
+    def __init__(self, config, model=None, processor=None):
+        """
+        :param model / processor: 已构造的模型和预处理器（基准测试替换模型等场景），默认从 model_path 加载
+        """
+        self.config = config
+        self.batch_size = max(int(config.get("batch_size", 16)), 1)
+        self.max_new_tokens = int(config.get("max_new_tokens", 256))
+        self.max_time = float(config.get("max_time", 10))
+        self.num_beams = int(config.get("num_beams", 1))
+        self.device = self._get_device()
+        if model is None:
+            model, processor = self._load_model()
+        self.model = model
+        self.processor = processor
+        self.eos_token_id = self.model.generation_config.eos_token_id
+
+    def _get_device(self):
+        if DEVICE == "cpu":
+            return "cpu"
+        import torch
+
+        return self.config.get("device", "cuda") if torch.cuda.is_available() else "cpu"
+
+    def _load_model(self):
+        from transformers import AutoProcessor, VisionEncoderDecoderModel
+
+        logger.info(f"load formula model: {self.config.model_path}")
+        processor = AutoProcessor.from_pretrained(self.config.model_path)
+        model = VisionEncoderDecoderModel.from_pretrained(self.config.model_path).to(self.device).eval()
+        return model, processor
+
+    def predict(self, image):
+        return self.predict_batch([image])[0]
+
+    def predict_batch(self, images: list):
+        """
+        :param images: normalize_formula 归一化后的灰度图，None 表示空白
+        :return: 与 images 一一对应的 {"latex": str, "truncated": bool}
+        """
+        results = [{"latex": "", "truncated": False} for _ in images]
+        indices = [idx for idx, image in enumerate(images) if image is not None]
+        for start in range(0, len(indices), self.batch_size):
+            batch = indices[start:start + self.batch_size]
+            with timer(STAGE_FORMULA_REC):
+                batch_results = self._generate([images[idx] for idx in batch])
+            for idx, result in zip(batch, batch_results):
+                results[idx] = result
+        return results
+
+    def _generate(self, images: list):
+        import torch
+
+        rgb = [cv2.cvtColor(image, cv2.COLOR_GRAY2RGB) for image in images]
+        pixel_values = self.processor(images=rgb, return_tensors="pt").pixel_values.to(self.device)
+        with torch.inference_mode():
+            sequences = self.model.generate(
+                pixel_values,
+                max_new_tokens=self.max_new_tokens,
+                max_time=self.max_time,
+                num_beams=self.num_beams,
+            )
+        texts = self.processor.batch_decode(sequences, skip_special_tokens=True)
+        eos_token_ids = self.eos_token_id if isinstance(self.eos_token_id, list) else [self.eos_token_id]
+        # 第一个位置是 decoder_start_token_id，TrOCR 结构的模型中常与结束符相同，不参与判断
+        finished = torch.isin(sequences[:, 1:], torch.tensor(eos_token_ids, device=sequences.device)).any(dim=1).tolist()
+        truncated = [not done for done in finished]
+        if any(truncated):
+            logger.warning(f"{sum(truncated)}个公式超过解码长度{self.max_new_tokens}或时间{self.max_time}s，结果被截断")
+        return [
+            {"latex": text.strip(), "truncated": is_truncated}
+            for text, is_truncated in zip(texts, truncated)
+        ]
+
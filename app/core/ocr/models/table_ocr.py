@@ -6,3 +6,293 @@ Author: youshun xu
 File: table_ocr
 Time: 2025/6/13 18:38
 """
+import html
+import logging
+import os
+import time
+
+import numpy as np
+import paddle
+import paddleocr
+from paddleocr.ppocr.data import transform
+from paddleocr.ppstructure.table.predict_structure import TableStructurer
+from paddleocr.ppstructure.utility import init_args
+
+from app.common.metrics import STAGE_TABLE_STRUCTURE, timer
+from app.config.conf import DEVICE
+from app.core.backend.onnx_runtime import (
+    BACKEND_ONNXRUNTIME,
+    BACKEND_PADDLE,
+    build_session_options,
+    get_backend,
+    get_providers,
+    resolve_model_path,
+)
+from app.core.ocr.chars import CharColumns, is_columnar
+
+logger = logging.getLogger(__name__)
+
+TABLE_CHAR_DICT_PATH = os.path.join(
+    os.path.dirname(paddleocr.__file__), "ppocr", "utils", "dict", "table_structure_dict_ch.txt"
+)
+HTML_HEAD = ["<html>", "<body>", "<table>"]
+HTML_TAIL = ["</table>", "</body>", "</html>"]
+
+# 结构识别结果的来源
+STRUCTURE_MODEL = "model"
+STRUCTURE_GRID = "grid"
+
+# 同一单元格内相邻字符的间距超过字符高度的该比例时补空格
+SPACE_GAP_RATIO = 0.3
+# 文本网格中列之间的空白至少为字符高度的该倍数
+COLUMN_GAP_RATIO = 1.2
+
+
+class TableOcr:
+    """
+    表格识别: 结构模型（SLANet）批量预测表格的 html 结构和每个单元格的框，
+    单元格内容复用整张表格一次 OCR 得到的字符和字符框，不再逐个单元格识别。
+    超过时间预算或结构被截断的表格退化为按文本行/列聚类的网格
+    """
+
+    def __init__(self, config, structurer=None):
+        """
+        :param structurer: 已构造的 TableStructurer（或接口一致的替身模型），默认按配置创建
+        """
+        self.config = config
+        self.backend = get_backend(config, BACKEND_PADDLE)
+        self.batch_size = max(int(config.get("batch_size", 8)), 1)
+        self.max_time = float(config.get("max_time", 30))
+        self.model = structurer or TableStructurer(self._get_parser_args())
+
+    def _get_parser_args(self):
+        logger.info("init table structure parser args")
+        parser = init_args()
+        parser_args = [
+            f"--table_model_dir={self.config.table_model_dir}",
+            f"--table_algorithm={self.config.get('table_algorithm', 'SLANet')}",
+            f"--table_max_len={self.config.get('table_max_len', 488)}",
+            f"--table_char_dict_path={self.config.get('table_char_dict_path') or TABLE_CHAR_DICT_PATH}",
+        ]
+        args = parser.parse_args(parser_args)
+        if self.backend == BACKEND_ONNXRUNTIME:
+            ort_config = self.config.get("onnxruntime", {})
+            args.use_onnx = True
+            args.use_gpu = False
+            args.table_model_dir = resolve_model_path(ort_config["table_model_path"], ort_config, "table")
+            args.onnx_sess_options = build_session_options(ort_config)
+            args.onnx_providers = get_providers(ort_config)
+        elif self.backend != BACKEND_PADDLE:
+            raise ValueError(f"unsupported table backend: {self.backend}")
+        elif DEVICE == "cuda" and paddle.device.is_compiled_with_cuda() and paddle.device.cuda.device_count() > 0:
+            args.use_gpu = True
+        else:
+            args.use_gpu = False
+        return args
+
+    def predict(self, image):
+        return self.predict_batch([image])[0]
+
+    def predict_batch(self, images: list):
+        """
+        批量预测表格结构，每次最多 batch_size 张表格调用一次结构模型。
+        每张表格的时间预算为 max_time 秒: 结构模型的一次推理无法中断，推理后按本批耗时 / 表格数计算每张表格的耗时，
+        超过预算的表格丢弃模型结构。第一批只推理一张表格用于估算，单张耗时超过预算时剩余表格不再推理。
+        没有使用模型结构的表格返回 None，由调用方退化为文本网格
+        :param images: BGR 表格图片列表
+        :return: 与 images 一一对应的 {"tokens": html 结构, "cells": (n, 4) 单元格框} 或 None
+        """
+        results = [None] * len(images)
+        start, table_seconds = 0, None
+        while start < len(images):
+            if table_seconds is not None and table_seconds > self.max_time:
+                logger.warning(f"单张表格结构识别耗时{table_seconds:.1f}s超过预算{self.max_time}s，"
+                               f"{len(images) - start}张表格使用文本网格")
+                break
+            count = 1 if table_seconds is None else min(self.batch_size, len(images) - start)
+            batch = images[start:start + count]
+            batch_start = time.perf_counter()
+            with timer(STAGE_TABLE_STRUCTURE):
+                structures = self._predict_structures(batch)
+            table_seconds = (time.perf_counter() - batch_start) / count
+            if table_seconds <= self.max_time:
+                results[start:start + count] = structures
+            else:
+                logger.warning(f"单张表格结构识别耗时{table_seconds:.1f}s超过预算{self.max_time}s，{count}张表格使用文本网格")
+            start += count
+        return results
+
+    def _predict_structures(self, images: list):
+        """
+        TableStructurer 每次只处理一张图片，这里复用它的预处理、模型和后处理，把一批表格合并成一次推理
+        """
+        model = self.model
+        inputs, shapes = [], []
+        for image in images:
+            data = transform({"image": image}, model.preprocess_op)
+            inputs.append(data[0])
+            shapes.append(data[1])
+        inputs = np.stack(inputs)
+        if model.use_onnx:
+            outputs = model.predictor.run(model.output_tensors, {model.input_tensor.name: inputs})
+        else:
+            model.input_tensor.copy_from_cpu(inputs)
+            model.predictor.run()
+            outputs = [output_tensor.copy_to_cpu() for output_tensor in model.output_tensors]
+        # 结构模型固定解码 max_text_length 步（输出的第二维），其中没有结束符说明结构被截断
+        end_idx = model.postprocess_op.dict[model.postprocess_op.end_str]
+        finished = (outputs[1][:, 1:].argmax(axis=2) == end_idx).any(axis=1)
+        post_result = model.postprocess_op(
+            {"structure_probs": outputs[1], "loc_preds": outputs[0]}, [np.stack(shapes)]
+        )
+
+        results = []
+        for (tokens, _), bboxes, is_finished in zip(
+                post_result["structure_batch_list"], post_result["bbox_batch_list"], finished.tolist()
+        ):
+            if not is_finished or not self._is_complete(tokens):
+                results.append(None)
+                continue
+            bboxes = np.asarray(bboxes, dtype=np.float64).reshape(len(bboxes), -1)
+            cells = np.stack([
+                bboxes[:, 0::2].min(axis=1), bboxes[:, 1::2].min(axis=1),
+                bboxes[:, 0::2].max(axis=1), bboxes[:, 1::2].max(axis=1),
+            ], axis=1) if len(bboxes) else np.zeros((0, 4))
+            results.append({"tokens": tokens, "cells": cells})
+        return results
+
+    @staticmethod
+    def _is_complete(tokens: list) -> bool:
+        """
+        行标签不配对时认为结构不可用
+        """
+        if not tokens:
+            return False
+        return tokens.count("<tr>") == tokens.count("</tr>") > 0
+
+    def build_table(self, structure, ocr_result: dict) -> dict:
+        """
+        把整张表格的 OCR 字符填入单元格
+        :param structure: predict_batch 的结果，None 表示使用文本网格
+        :param ocr_result: TextOcr 对整张表格图片的识别结果（dict 或列式字符格式）
+        :return: ocr_result 加上 tabel_html（与 build_ocr_page_result 读取的字段一致）和 table_structure
+        """
+        columns = _ocr_char_columns(ocr_result)
+        if structure is not None:
+            table_html = self._structure_html(structure, columns)
+            source = STRUCTURE_MODEL
+        else:
+            table_html = grid_html(columns)
+            source = STRUCTURE_GRID
+        return {**ocr_result, "tabel_html": table_html, "table_structure": source}
+
+    @staticmethod
+    def _structure_html(structure: dict, columns: CharColumns) -> str:
+        cells = structure["cells"]
+        cell_chars = [[] for _ in range(len(cells))]
+        if len(columns) and len(cells):
+            for char_idx, cell_idx in enumerate(match_chars_to_cells(columns.boxes, cells)):
+                cell_chars[cell_idx].append(char_idx)
+
+        tokens = []
+        td_index = 0
+        for tag in HTML_HEAD + structure["tokens"] + HTML_TAIL:
+            if "</td>" not in tag:
+                tokens.append(tag)
+                continue
+            content = ""
+            if td_index < len(cell_chars) and cell_chars[td_index]:
+                content = html.escape(join_chars(columns, cell_chars[td_index]))
+            if tag == "<td></td>":
+                tokens.append(f"<td>{content}</td>")
+            else:
+                tokens.append(f"{content}{tag}")
+            td_index += 1
+        return "".join(tokens)
+
+
+def _ocr_char_columns(ocr_result: dict) -> CharColumns:
+    if is_columnar(ocr_result["chars"]):
+        return CharColumns.from_payload(ocr_result["chars"])
+    return CharColumns.from_regions(ocr_result["chars"], ocr_result.get("chars_region", []))
+
+
+def match_chars_to_cells(char_boxes: np.ndarray, cells: np.ndarray) -> np.ndarray:
+    """
+    每个字符分配到覆盖它面积比例最大的单元格，比例相同（包括都不覆盖）时取中心距离最近的单元格
+    :return: (n,) 单元格序号
+    """
+    c = char_boxes[:, None, :]
+    g = cells[None, :, :]
+    inter_w = np.clip(np.minimum(c[..., 2], g[..., 2]) - np.maximum(c[..., 0], g[..., 0]), 0, None)
+    inter_h = np.clip(np.minimum(c[..., 3], g[..., 3]) - np.maximum(c[..., 1], g[..., 1]), 0, None)
+    char_area = np.maximum((char_boxes[:, 2] - char_boxes[:, 0]) * (char_boxes[:, 3] - char_boxes[:, 1]), 1e-6)
+    coverage = inter_w * inter_h / char_area[:, None]
+    distance = np.abs((c[..., 0] + c[..., 2]) - (g[..., 0] + g[..., 2])) \
+        + np.abs((c[..., 1] + c[..., 3]) - (g[..., 1] + g[..., 3]))
+    best = coverage >= coverage.max(axis=1, keepdims=True) - 1e-6
+    return np.where(best, distance, np.inf).argmin(axis=1)
+
+
+def join_chars(columns: CharColumns, indices: list) -> str:
+    """
+    按原顺序拼接字符，换行或间距较大时补空格（OCR 字符结果不含空格）
+    """
+    boxes = columns.boxes[indices]
+    chars = [columns.chars[idx] for idx in indices]
+    height = np.maximum(boxes[:, 3] - boxes[:, 1], 1)
+    gap = boxes[1:, 0] - boxes[:-1, 2]
+    new_line = (boxes[1:, 1] >= boxes[:-1, 3] - height[:-1] / 2) | (gap < -height[:-1])
+    space = new_line | (gap > height[:-1] * SPACE_GAP_RATIO)
+    parts = [chars[0]]
+    for char, prev, add_space in zip(chars[1:], chars[:-1], space.tolist()):
+        # 中文之间换行不补空格
+        if add_space and (prev.isascii() or char.isascii()):
+            parts.append(" ")
+        parts.append(char)
+    return "".join(parts)
+
+
+def grid_html(columns: CharColumns) -> str:
+    """
+    没有可用的结构时，按字符框聚类出行和列，生成不含合并单元格的网格
+    """
+    if not len(columns):
+        return "".join(HTML_HEAD + HTML_TAIL)
+    boxes = columns.boxes
+    height = float(np.median(boxes[:, 3] - boxes[:, 1])) or 1.0
+
+    # 行: 按中心 y 排序，中心低于前面所有字符的下边界时开始新的一行
+    center_y = (boxes[:, 1] + boxes[:, 3]) / 2
+    order = np.argsort(center_y, kind="stable")
+    bottom = np.maximum.accumulate(boxes[order, 3])
+    row_start = np.concatenate([[True], center_y[order][1:] > bottom[:-1]])
+    rows = np.empty(len(boxes), dtype=np.int64)
+    rows[order] = np.cumsum(row_start) - 1
+
+    # 列: x 方向投影上宽度不小于 COLUMN_GAP_RATIO 倍字高的空白作为列分隔
+    x0, x1 = np.floor(boxes[:, 0]).astype(np.int64), np.ceil(boxes[:, 2]).astype(np.int64)
+    origin = x0.min()
+    coverage = np.zeros(x1.max() - origin + 2, dtype=np.int64)
+    np.add.at(coverage, x0 - origin, 1)
+    np.add.at(coverage, x1 - origin, -1)
+    empty = np.cumsum(coverage)[:-1] == 0
+    edges = np.flatnonzero(np.diff(empty.astype(np.int8)))
+    gap_starts, gap_ends = edges[0::2] + 1, edges[1::2] + 1
+    separators = [(start + end) / 2 + origin for start, end in zip(gap_starts, gap_ends)
+                  if end - start >= height * COLUMN_GAP_RATIO]
+    cols = np.searchsorted(np.asarray(separators), (boxes[:, 0] + boxes[:, 2]) / 2)
+
+    cell_chars = {}
+    for idx in np.lexsort((boxes[:, 0], rows)):
+        cell_chars.setdefault((rows[idx], cols[idx]), []).append(idx)
+    tokens = list(HTML_HEAD)
+    for row in range(rows.max() + 1):
+        if not any((row, col) in cell_chars for col in range(len(separators) + 1)):
+            continue
+        tokens.append("<tr>")
+        for col in range(len(separators) + 1):
+            indices = cell_chars.get((row, col))
+            tokens.append(f"<td>{html.escape(join_chars(columns, indices)) if indices else ''}</td>")
+        tokens.append("</tr>")
+    return "".join(tokens + HTML_TAIL)
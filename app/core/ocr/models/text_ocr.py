@@ -6,39 +6,78 @@ Author: youshun xu
 File: paddle_ocr
 Time: 2025/6/13 14:21
 """
+import copy
 import logging
-import re
 
-import torch
+import numpy as np
+import paddle
 from paddleocr.ppstructure.utility import init_args
-from paddleocr.tools.infer.predict_system import TextSystem
-
-from app.config.conf import DEVICE
+from paddleocr.tools.infer.predict_system import TextSystem, sorted_boxes
+from paddleocr.tools.infer.utility import get_minarea_rect_crop, get_rotate_crop_image
+
+from app.common.metrics import STAGE_OCR_CLS, STAGE_OCR_DET, STAGE_OCR_REC, observe, timer
+from app.common.tiling import build_tiler
+from app.config.conf import DEVICE, OCR_CHAR_FORMAT, RAW_OUTPUT_DIR
+from app.core.backend.onnx_runtime import (
+    BACKEND_ONNXRUNTIME,
+    BACKEND_PADDLE,
+    build_session_options,
+    get_backend,
+    get_providers,
+    resolve_model_path,
+)
+from app.core.engine.raw_outputs import RAW_KEY, raw_lines
+from app.core.ocr.chars import build_text_result
 
 logger = logging.getLogger(__name__)
 
-STYLE_TOKEN_RE = "<(?:strike|sup|sub|b|i|overline|underline|\/(?:strike|sup|sub|b|i|overline|underline))>"
-
 
 class TextOcr:
 
-    def __init__(self, config):
+    def __init__(self, config, text_system=None):
+        """
+        :param text_system: 已构造的 TextSystem（或接口一致的替身模型），默认按配置创建
+        """
         self.config = config
+        self.char_format = OCR_CHAR_FORMAT
+        # 开启原始输出时结果中附带 drop_score 过滤之前的所有文本行（RAW_KEY），由页面任务取出保存
+        self.keep_raw = bool(RAW_OUTPUT_DIR)
+        self.backend = get_backend(config, BACKEND_PADDLE)
+        # 超大页面切块做文本检测，避免检测模型按边长上限缩小后丢失小字
+        self.tiler = build_tiler(config.get("tiling"))
+        self._text_system = text_system
+        if text_system is None and self.backend != BACKEND_ONNXRUNTIME:
+            self._text_system = self._build_text_system()
+
+    @property
+    def model(self):
+        # onnxruntime 会话创建时即启动线程池，不能跨 fork 继承，延迟到第一次推理时创建
+        if self._text_system is None:
+            self._text_system = self._build_text_system()
+        return self._text_system
+
+    def _build_text_system(self):
         args = self._get_parser_args()
         args.return_word_box = True
-        self.model = TextSystem(args)
+        return TextSystem(args)
 
     def _get_parser_args(self):
         logger.info("init ocr text parser args")
         parser = init_args()
-        args = parser.parse_args([
+        parser_args = [
             f"--det_model_dir={self.config.det_model_dir}",
             f"--rec_model_dir={self.config.rec_model_dir}",
-            f"--rec_char_dict_path={self.config.rec_char_dict_path}",
-            "--max_batch_size=1"
-            "--rec_batch_num=1"
-        ])
-        if DEVICE == "cuda" and torch.cuda.is_available():
+            f"--max_batch_size={self.config.get('max_batch_size', 10)}",
+            f"--rec_batch_num={self.config.get('rec_batch_num', 6)}",
+        ]
+        if self.config.get("rec_char_dict_path"):
+            parser_args.append(f"--rec_char_dict_path={self.config.rec_char_dict_path}")
+        args = parser.parse_args(parser_args)
+        if self.backend == BACKEND_ONNXRUNTIME:
+            self._set_onnx_args(args)
+        elif self.backend != BACKEND_PADDLE:
+            raise ValueError(f"unsupported ocr backend: {self.backend}")
+        elif DEVICE == "cuda" and paddle.device.is_compiled_with_cuda() and paddle.device.cuda.device_count() > 0:
             args.use_gpu = True
         elif DEVICE.startswith("npu"):
             logger.info("use npu")
@@ -48,70 +87,125 @@ class TextOcr:
             args.use_gpu = False
         return args
 
+    def _set_onnx_args(self, args):
+        """
+        PaddleOCR 的 use_onnx 模式: 检测/识别模型换成 paddle2onnx 导出的 onnx 模型，前后处理不变
+        """
+        ort_config = self.config.get("onnxruntime", {})
+        logger.info(f"use onnxruntime, quantized: {ort_config.get('quantized', False)}")
+        args.use_onnx = True
+        args.use_gpu = False
+        args.det_model_dir = resolve_model_path(ort_config["det_model_path"], ort_config, "det")
+        args.rec_model_dir = resolve_model_path(ort_config["rec_model_path"], ort_config, "rec")
+        if ort_config.get("cls_model_path"):
+            args.cls_model_dir = resolve_model_path(ort_config["cls_model_path"], ort_config, "cls")
+        args.onnx_sess_options = build_session_options(ort_config)
+        args.onnx_providers = get_providers(ort_config)
+
     def predict(self, image):
+        # TextSystem 内部按 drop_score 过滤，需要原始文本行时走 predict_batch
+        if self.keep_raw or self.tiler is not None and self.tiler.applies(image.shape[1], image.shape[0]):
+            return self.predict_batch([image])[0]
         filter_boxes, filter_rec_res, time_dict = self.model(image)
-        ocr_result = {
-            "text": "",
-            "bbox": None,
-            "chars": [],
-            "chars_region": []
-        }
-
-        for box, ocr_res in zip(filter_boxes, filter_rec_res):
-            text = ocr_res[0]
-            score = ocr_res[1]
-            text = re.sub(STYLE_TOKEN_RE, "", text)
-            char_list, char_box_list = self._get_each_chars_bbox(text=text, box=box, char_info=ocr_res[2])
-
-            ocr_result["text"] += text
-            ocr_result["chars"].extend(char_list)
-            ocr_result["chars_region"].extend(char_box_list)
-
-        return ocr_result
-
-    @staticmethod
-    def _get_each_chars_bbox(text, box, char_info):
+        observe(STAGE_OCR_DET, time_dict["det"])
+        if self.model.use_angle_cls:
+            observe(STAGE_OCR_CLS, time_dict["cls"])
+        if filter_boxes is not None:
+            observe(STAGE_OCR_REC, time_dict["rec"])
+        return self._build_result(filter_boxes or [], filter_rec_res or [])
+
+    def predict_batch(self, images: list):
         """
-        根据OCR识别和检测的结果计算每个词的检测框
-        :param text: ocr 识别的文本
-        :param box: ocr 识别的检测区块
-        :param char_info: 识别的每个字符信息
-        :return:
+        批量识别多张图片（多页或多个版面区域）
+        先逐张做文本检测，再把所有图片的文本行合并成一次识别调用，
+        识别器内部按宽高比排序后以 rec_batch_num 为批次大小推理，最后按图片拆分回各自的结果
+        :param images: np.ndarray 图片列表
+        :return: 与 images 一一对应的结果列表，每个结果的格式与 predict 相同
         """
+        boxes_per_image = []
+        img_crop_list = []
+        for image in images:
+            with timer(STAGE_OCR_DET):
+                dt_boxes = self._detect(image)
+            boxes_per_image.append(dt_boxes)
+            img_crop_list.extend(self._crop(image, dt_boxes))
+
+        rec_res = []
+        if img_crop_list:
+            if self.model.use_angle_cls:
+                with timer(STAGE_OCR_CLS):
+                    img_crop_list, _, _ = self.model.text_classifier(img_crop_list)
+            with timer(STAGE_OCR_REC):
+                rec_res, _ = self.model.text_recognizer(img_crop_list)
+
+        results = []
+        offset = 0
+        for dt_boxes in boxes_per_image:
+            image_rec_res = rec_res[offset:offset + len(dt_boxes)]
+            offset += len(dt_boxes)
+            filter_boxes, filter_rec_res = [], []
+            for box, rec_result in zip(dt_boxes, image_rec_res):
+                if rec_result[1] >= self.model.drop_score:
+                    filter_boxes.append(box)
+                    filter_rec_res.append(rec_result)
+            result = self._build_result(filter_boxes, filter_rec_res)
+            if self.keep_raw:
+                result[RAW_KEY] = raw_lines(dt_boxes, image_rec_res)
+            results.append(result)
+        return results
+
+    def _detect(self, image):
+        if self.tiler is not None and self.tiler.applies(image.shape[1], image.shape[0]):
+            dt_boxes = self._detect_tiled(image)
+        else:
+            dt_boxes, _ = self.model.text_detector(image)
+        if dt_boxes is None or len(dt_boxes) == 0:
+            return []
+        return sorted_boxes(dt_boxes)
 
-        col_num, word_list, word_col_list, state_list = char_info
-
-        box = box.tolist()
-        bbox_x_start = box[0][0]
-        bbox_x_end = box[1][0]
-        bbox_y_start = box[0][1]
-        bbox_y_end = box[2][1]
+    def _detect_tiled(self, image):
+        """
+        逐个切块检测文本行，坐标映射回原图；接缝处被切开的文本行合并为外接矩形
+        :return: (n, 4, 2) 的四点坐标
+        """
+        plan = self.tiler.plan(image.shape[1], image.shape[0])
+        tile_boxes = []
+        for crop in plan.crops(image):
+            dt_boxes, _ = self.model.text_detector(crop)
+            tile_boxes.append(np.zeros((0, 4, 2)) if dt_boxes is None else np.asarray(dt_boxes).reshape(-1, 4, 2))
+        tile_ids = plan.tile_ids([len(boxes) for boxes in tile_boxes])
+        quads = np.concatenate(tile_boxes).astype(np.float64)
+        if len(quads) == 0:
+            return quads
+        bboxes = np.concatenate([quads.min(axis=1), quads.max(axis=1)], axis=1)
+        merged_boxes, representative, merged = self.tiler.merge(plan, bboxes, tile_ids)
+
+        # 未合并的文本行保留检测出的四点坐标
+        offsets = plan.offset(np.zeros((len(representative), 4)), tile_ids[representative])[:, None, :2]
+        page_quads = (quads[representative] + offsets) / plan.scale
+        x0, y0, x1, y1 = merged_boxes[merged].T
+        page_quads[merged] = np.stack([np.stack([x0, y0], 1), np.stack([x1, y0], 1),
+                                       np.stack([x1, y1], 1), np.stack([x0, y1], 1)], axis=1)
+        return page_quads.astype(np.float32)
+
+    def _crop(self, image, dt_boxes):
+        img_crop_list = []
+        for box in dt_boxes:
+            tmp_box = copy.deepcopy(box)
+            if self.model.args.det_box_type == "quad":
+                img_crop_list.append(get_rotate_crop_image(image, tmp_box))
+            else:
+                img_crop_list.append(get_minarea_rect_crop(image, tmp_box))
+        return img_crop_list
 
-        cell_width = (bbox_x_end - bbox_x_start) / col_num
-        default_char_width = (bbox_x_end - bbox_x_start) / len(text)
+    def empty_result(self):
+        """
+        没有文字的结果，格式与 predict 相同
+        """
+        result = self._build_result([], [])
+        if self.keep_raw:
+            result[RAW_KEY] = raw_lines([], [])
+        return result
 
-        word_box_list = []
-        word_box_content_list = []
-        for word, word_col, state in zip(word_list, word_col_list, state_list):
-            if len(word_col) != 1:
-                char_seq_length = (word_col[-1] - word_col[0] + 1) * cell_width
-                char_width = char_seq_length / (len(word_col) - 1)
-            else:
-                char_width = default_char_width
-            for center_idx in word_col:
-                center_x = (center_idx + 0.5) * cell_width
-                cell_x_start = max(int(center_x - char_width / 2), 0) + bbox_x_start
-                cell_x_end = (
-                        min(int(center_x + char_width / 2), bbox_x_end - bbox_x_start)
-                        + bbox_x_start
-                )
-                cell = (
-                    (cell_x_start, bbox_y_start),
-                    (cell_x_end, bbox_y_start),
-                    (cell_x_end, bbox_y_end),
-                    (cell_x_start, bbox_y_end),
-                )
-                word_box_list.append(cell)
-            word_box_content_list += word
-
-        return word_box_content_list, word_box_list
+    def _build_result(self, filter_boxes, filter_rec_res):
+        return build_text_result(filter_boxes, filter_rec_res, self.char_format)
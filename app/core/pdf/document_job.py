@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: document_job
+Time: 2025/7/6 11:05
+"""
+import logging
+from collections import deque
+
+import pymupdf
+from celery.result import AsyncResult
+
+from app.config.conf import (
+    JOB_PAGE_MAX_ATTEMPTS,
+    JOB_RETRY_BACKOFF,
+    JOB_RETRY_BACKOFF_MAX,
+    PDF_MAX_IN_FLIGHT,
+    PDF_RENDER_DPI,
+    TASK_RESULT_TIMEOUT,
+)
+from app.core.engine.celery_task import celery_app, default_layout_task
+from app.core.engine.checkpoint import build_checkpoint_store
+from app.core.engine.dedup import page_dedup_scope
+from app.core.engine.scheduling import LANE_BULK, NullFairShare, get_fair_share, lane_priority, normalize_tenant
+from app.core.engine.transport import pack_image
+from app.core.pdf.rasterize import open_local_pdf, page_zoom, render_page
+
+logger = logging.getLogger(__name__)
+
+
+class _PageAttempt:
+    """
+    已投递、等待结果的页面。保留渲染后的图片引用，失败时直接重新投递，不需要再次渲染
+    """
+
+    def __init__(self, page_no: int, image_id: str, image: str, attempt: int, countdown: float, async_result):
+        self.page_no = page_no
+        self.image_id = image_id
+        self.image = image
+        self.attempt = attempt
+        self.countdown = countdown
+        self.async_result = async_result
+
+
+class DocumentJob:
+    """
+    文档级任务 DAG: render → 页面任务（layout / ocr；layout_ocr 由页面任务再分出文本、表格、公式区域并合并）→ assemble。
+    每页成功后写入检查点；失败或超时的页面按指数退避重新投递，最多执行 max_attempts 次，
+    其他页面照常投递，不需要整篇文档重跑。同一 job_id 再次运行时跳过已有检查点的页面，只渲染和投递未完成的页面
+    """
+
+    def __init__(self, job_id: str, pdf_path: str, task_name: str = default_layout_task, checkpoints=None,
+                 dpi: int = PDF_RENDER_DPI, max_in_flight: int = PDF_MAX_IN_FLIGHT,
+                 timeout: int = TASK_RESULT_TIMEOUT, max_attempts: int = JOB_PAGE_MAX_ATTEMPTS,
+                 retry_backoff: float = JOB_RETRY_BACKOFF, retry_backoff_max: float = JOB_RETRY_BACKOFF_MAX,
+                 tenant: str = None, lane: str = LANE_BULK, fair_share=None, on_dispatch=None):
+        """
+        :param checkpoints: CheckpointStore，默认按配置创建
+        :param timeout: 等待单页结果的超时时间(秒)，超时按失败处理
+        :param max_attempts: 单页最多执行次数（含第一次）
+        :param retry_backoff: 第 n 次重试延迟 retry_backoff * 2^(n-1) 秒投递，不超过 retry_backoff_max
+        :param tenant / lane / fair_share: 同 dispatch_pdf_pages，重试的页面沿用原来的份额
+        :param on_dispatch: 每次投递后的回调 on_dispatch(page_no, image_id, AsyncResult)，重试也会调用
+        """
+        self.job_id = job_id
+        self.pdf_path = pdf_path
+        self.task_name = task_name
+        self.checkpoints = checkpoints or build_checkpoint_store()
+        self.dpi = dpi
+        self.max_in_flight = max(max_in_flight, 1)
+        self.timeout = timeout
+        self.max_attempts = max(max_attempts, 1)
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max
+        self.tenant = normalize_tenant(tenant)
+        self.priority = lane_priority(lane)
+        self.dedup_scope = page_dedup_scope(self.tenant, job_id)
+        self.fair_share = fair_share or (get_fair_share() if lane == LANE_BULK else NullFairShare())
+        self.on_dispatch = on_dispatch
+        self.stats = {"total": 0, "resumed": 0, "dispatched": 0, "retried": 0, "succeeded": 0, "failed": 0}
+
+    def run(self, previous_pages: list = None) -> dict:
+        """
+        :param previous_pages: 上次运行投递的页面 [{"page", "image_id", "task_id"}]（JobStore.pages），
+            恢复时已经成功但投递进程退出前没有写入检查点的页面直接取结果
+        :return: 本次运行的统计 stats；文档结果在检查点中，由 GET /jobs/{job_id}/result 组装
+        """
+        done = self.checkpoints.done_pages(self.job_id)
+        done |= self._recover(previous_pages or [], done)
+        self.stats["resumed"] = len(done)
+        pending = deque()
+        try:
+            with open_local_pdf(self.pdf_path) as local_path, pymupdf.open(local_path) as doc:
+                self.stats["total"] = doc.page_count
+                for page_no in range(doc.page_count):
+                    if page_no in done:
+                        continue
+                    # 文档窗口已满或租户份额用完时，先处理本文档最早的一页
+                    while len(pending) >= self.max_in_flight or not self.fair_share.try_acquire(self.tenant):
+                        if not pending:
+                            self.fair_share.acquire(self.tenant)
+                            break
+                        self._resolve(pending)
+                    page = doc.load_page(page_no)
+                    image = pack_image(render_page(page, page_zoom(page, self.dpi)))
+                    pending.append(self._send(page_no, image, attempt=1))
+            while pending:
+                self._resolve(pending)
+        finally:
+            # 投递中途出错时归还未完成页面的份额，已完成的页面保留在检查点中，恢复时不再计算
+            for _ in pending:
+                self.fair_share.release(self.tenant)
+        logger.info(f"job {self.job_id}: {self.stats}")
+        return self.stats
+
+    def _recover(self, previous_pages: list, done: set) -> set:
+        """
+        同一页可能投递过多次，以最后一次为准
+        """
+        latest = {int(page["page"]): page for page in previous_pages}
+        recovered = set()
+        for page_no, page in latest.items():
+            if page_no in done:
+                continue
+            async_result = AsyncResult(page["task_id"], app=celery_app)
+            if async_result.successful():
+                self.checkpoints.save_page(self.job_id, page_no, async_result.result[page["image_id"]])
+                recovered.add(page_no)
+        return recovered
+
+    def _send(self, page_no: int, image: str, attempt: int, countdown: float = 0) -> _PageAttempt:
+        image_id = f"{self.job_id}_{page_no}"
+        async_result = celery_app.send_task(self.task_name, args=(image_id, image),
+                                            kwargs={"dedup_scope": self.dedup_scope}, priority=self.priority,
+                                            countdown=countdown or None)
+        self.stats["dispatched"] += 1
+        if self.on_dispatch:
+            self.on_dispatch(page_no, image_id, async_result)
+        return _PageAttempt(page_no, image_id, image, attempt, countdown, async_result)
+
+    def _resolve(self, pending: deque):
+        """
+        等待最早投递的一页: 成功写入检查点并归还份额；失败且未达到次数上限时重新投递到队尾，继续占用份额
+        """
+        item = pending.popleft()
+        try:
+            # 页面任务在其他队列执行，在 pdf_ingest_task 中等待不会出现 worker 自己等待自己的死锁
+            result = item.async_result.get(timeout=self.timeout + item.countdown, disable_sync_subtasks=False)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            self.checkpoints.record_failure(self.job_id, item.page_no, error)
+            if item.attempt < self.max_attempts:
+                countdown = min(self.retry_backoff * 2 ** (item.attempt - 1), self.retry_backoff_max)
+                logger.warning(f"job {self.job_id} 第{item.page_no}页第{item.attempt}次执行失败({error})，"
+                               f"{countdown}s 后重试")
+                self.stats["retried"] += 1
+                pending.append(self._send(item.page_no, item.image, item.attempt + 1, countdown))
+                return
+            logger.error(f"job {self.job_id} 第{item.page_no}页执行{item.attempt}次均失败: {error}")
+            self.stats["failed"] += 1
+        else:
+            self.checkpoints.save_page(self.job_id, item.page_no, result[item.image_id])
+            self.stats["succeeded"] += 1
+        self.fair_share.release(self.tenant)
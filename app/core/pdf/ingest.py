@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: ingest
+Time: 2025/6/19 11:30
+"""
+import logging
+import time
+import uuid
+from collections import deque
+
+import pymupdf
+
+from app.config.conf import PDF_RENDER_DPI, PDF_MAX_IN_FLIGHT, TASK_RESULT_TIMEOUT, OCR_PAGE_COST_MS
+from app.core.engine.celery_task import celery_app, default_layout_task, default_ocr_task
+from app.core.engine.dedup import page_dedup_scope
+from app.core.engine.pipeline import encode_crop
+from app.core.engine.scheduling import LANE_BULK, NullFairShare, get_fair_share, lane_priority, normalize_tenant
+from app.core.engine.transport import pack_image
+from app.core.ocr.chars import CharColumns, build_page_chars, extend_page_chars, offset_page_chars
+from app.core.pdf.rasterize import iter_pdf_pages, open_local_pdf, page_zoom, render_page, render_page_array
+from app.core.pdf.text_layer import TRIAGE_OCR, triage_page
+
+logger = logging.getLogger(__name__)
+
+
+def dispatch_pdf_pages(pdf_path: str, task_name: str = default_layout_task, doc_id: str = None,
+                       dpi: int = PDF_RENDER_DPI, max_in_flight: int = PDF_MAX_IN_FLIGHT,
+                       timeout: int = TASK_RESULT_TIMEOUT, on_dispatch=None,
+                       tenant: str = None, lane: str = LANE_BULK, fair_share=None):
+    """
+    边渲染边投递: 每渲染完一页立即发送到对应的任务队列，队列中未完成的页数达到 max_in_flight 时
+    先等待最早的一页完成再继续渲染，因此内存占用与文档页数无关
+    任务按名称投递，调用方不需要导入模型
+    :param on_dispatch: 每页投递后的回调 on_dispatch(page_no, image_id, AsyncResult)
+    :param tenant: 租户，批量通道按租户平分队列中的页数
+    :param lane: 调度通道，决定页面任务的优先级
+    :param fair_share: FairShare，默认批量通道使用进程内共享的 get_fair_share()，交互通道不限制
+    :return: 生成器，按页码顺序返回 (page_no, image_id, AsyncResult)，返回的任务已结束（成功或失败）
+    """
+    doc_id = doc_id or uuid.uuid4().hex
+    max_in_flight = max(max_in_flight, 1)
+    tenant = normalize_tenant(tenant)
+    priority = lane_priority(lane)
+    dedup_scope = page_dedup_scope(tenant, doc_id)
+    fair_share = fair_share or (get_fair_share() if lane == LANE_BULK else NullFairShare())
+    pending = deque()
+    try:
+        with open_local_pdf(pdf_path) as local_path:
+            for page_no, img_bytes, _ in iter_pdf_pages(local_path, dpi=dpi):
+                # 文档窗口已满或租户份额用完时，先等待本文档最早的一页完成
+                while len(pending) >= max_in_flight or not fair_share.try_acquire(tenant):
+                    if not pending:
+                        fair_share.acquire(tenant)
+                        break
+                    yield _finish(pending.popleft(), timeout, fair_share, tenant)
+                image_id = f"{doc_id}_{page_no}"
+                async_result = celery_app.send_task(task_name, args=(image_id, pack_image(img_bytes)),
+                                                    kwargs={"dedup_scope": dedup_scope}, priority=priority)
+                if on_dispatch:
+                    on_dispatch(page_no, image_id, async_result)
+                pending.append((page_no, image_id, async_result))
+        while pending:
+            yield _finish(pending.popleft(), timeout, fair_share, tenant)
+    finally:
+        # 投递中途出错或调用方提前结束时归还未完成页面的份额
+        for _ in pending:
+            fair_share.release(tenant)
+
+
+def _finish(item, timeout, fair_share, tenant):
+    _wait(item[2], timeout)
+    fair_share.release(tenant)
+    return item
+
+
+def _wait(async_result, timeout):
+    # 这里的等待只用于限流，单页失败不影响后续页面的投递；
+    # 在 pdf_ingest_task 中调用时页面任务在其他队列执行，不会出现 worker 自己等待自己的死锁
+    async_result.get(timeout=timeout, propagate=False, disable_sync_subtasks=False)
+
+
+def stream_pdf_results(pdf_path: str, task_name: str = default_layout_task, doc_id: str = None,
+                       dpi: int = PDF_RENDER_DPI, max_in_flight: int = PDF_MAX_IN_FLIGHT,
+                       timeout: int = TASK_RESULT_TIMEOUT, tenant: str = None, lane: str = LANE_BULK):
+    """
+    :return: 生成器，按页码顺序返回 (page_no, 单页结果)
+    """
+    for page_no, image_id, async_result in dispatch_pdf_pages(
+            pdf_path, task_name, doc_id, dpi, max_in_flight, timeout, tenant=tenant, lane=lane
+    ):
+        result = async_result.get(timeout=timeout)
+        yield page_no, result[image_id]
+
+
+class _PendingPage:
+    """
+    OCR 分流后等待结果的页面: 整页 OCR 页面只有一个任务，混合页面每个图片区域一个任务
+    """
+
+    def __init__(self, page_no: int, triage: dict, base_result: dict = None):
+        self.page_no = page_no
+        self.triage = triage
+        self.base_result = base_result
+        self.tasks = []  # [(image_id, region bbox 或 None, AsyncResult)]
+        self.dispatched_at = time.perf_counter()
+
+    def ready(self) -> bool:
+        return all(async_result.ready() for _, _, async_result in self.tasks)
+
+
+def stream_pdf_ocr(pdf_path: str, doc_id: str = None, dpi: int = PDF_RENDER_DPI,
+                   max_in_flight: int = PDF_MAX_IN_FLIGHT, timeout: int = TASK_RESULT_TIMEOUT,
+                   use_text_layer: bool = True, tenant: str = None, lane: str = LANE_BULK, fair_share=None):
+    """
+    带内嵌文字分流的 pdf OCR: 有可用内嵌文字的页面直接提取文字，不投递 OCR 任务；
+    扫描页整页 OCR；有大面积图片的页面只对图片区域 OCR，结果合并到内嵌文字结果中
+    :param tenant / lane / fair_share: 同 dispatch_pdf_pages，需要 OCR 的页面每页占用一份租户份额
+    :return: 生成器，按页码顺序返回 (page_no, 单页结果)，单页结果的 triage 字段记录分流结果和节省的时间
+    """
+    doc_id = doc_id or uuid.uuid4().hex
+    max_in_flight = max(max_in_flight, 1)
+    tenant = normalize_tenant(tenant)
+    priority = lane_priority(lane)
+    dedup_scope = page_dedup_scope(tenant, doc_id)
+    fair_share = fair_share or (get_fair_share() if lane == LANE_BULK else NullFairShare())
+    ocr_cost = _OcrCost()
+    pending = deque()
+
+    def in_flight():
+        return sum(len(item.tasks) for item in pending)
+
+    def finish(item):
+        try:
+            return _finish_page(item, ocr_cost, timeout)
+        finally:
+            if item.tasks:
+                fair_share.release(tenant)
+
+    try:
+        with open_local_pdf(pdf_path) as local_path, pymupdf.open(local_path) as doc:
+            for page_no in range(doc.page_count):
+                page = doc.load_page(page_no)
+                zoom = page_zoom(page, dpi)
+                if use_text_layer:
+                    triage, text_result = triage_page(page, zoom)
+                else:
+                    triage, text_result = {"mode": TRIAGE_OCR, "reason": "text_layer_disabled", "ocr_regions": []}, None
+
+                if text_result is None or triage["ocr_regions"]:
+                    while not fair_share.try_acquire(tenant):
+                        if not pending:
+                            fair_share.acquire(tenant)
+                            break
+                        yield finish(pending.popleft())
+
+                if text_result is None:
+                    item = _PendingPage(page_no, triage)
+                    image_id = f"{doc_id}_{page_no}"
+                    item.tasks.append((image_id, None, celery_app.send_task(
+                        default_ocr_task, args=(image_id, pack_image(render_page(page, zoom))),
+                        kwargs={"dedup_scope": dedup_scope}, priority=priority,
+                    )))
+                else:
+                    item = _PendingPage(page_no, triage, _text_layer_page_result(text_result))
+                    if triage["ocr_regions"]:
+                        img = render_page_array(page, zoom)
+                        for region_no, (x1, y1, x2, y2) in enumerate(triage["ocr_regions"]):
+                            image_id = f"{doc_id}_{page_no}_region_{region_no}"
+                            item.tasks.append((image_id, [x1, y1, x2, y2], celery_app.send_task(
+                                default_ocr_task, args=(image_id, pack_image(encode_crop(img[y1:y2, x1:x2]))),
+                                priority=priority,
+                            )))
+                        triage["page_area"] = img.shape[0] * img.shape[1]
+                pending.append(item)
+
+                while pending and (in_flight() >= max_in_flight or pending[0].ready()):
+                    yield finish(pending.popleft())
+            while pending:
+                yield finish(pending.popleft())
+    finally:
+        for item in pending:
+            if item.tasks:
+                fair_share.release(tenant)
+
+
+class _OcrCost:
+    """
+    用本文档中整页 OCR 页面的实际耗时估算内嵌文字页面节省的时间
+    """
+
+    def __init__(self):
+        self.total_ms = 0.0
+        self.count = 0
+
+    def add(self, cost_ms: float):
+        self.total_ms += cost_ms
+        self.count += 1
+
+    def estimate(self) -> float:
+        return self.total_ms / self.count if self.count else OCR_PAGE_COST_MS
+
+
+def _text_layer_page_result(text_result: dict) -> dict:
+    return {
+        "text": text_result["text"],
+        "bbox": None,
+        "chars": build_page_chars(CharColumns.from_regions(text_result["chars"], text_result["chars_region"])),
+        "table_markdown": "",
+    }
+
+
+def _finish_page(item: _PendingPage, ocr_cost: _OcrCost, timeout: int):
+    region_results = []
+    for image_id, region, async_result in item.tasks:
+        region_results.append((region, async_result.get(timeout=timeout)[image_id]))
+
+    triage = item.triage
+    if item.base_result is None:
+        cost_ms = (time.perf_counter() - item.dispatched_at) * 1000
+        ocr_cost.add(cost_ms)
+        page_result = region_results[0][1]
+        triage["ocr_ms"] = round(cost_ms, 3)
+        triage["saved_ms"] = 0.0
+    else:
+        page_result = item.base_result
+        region_area = 0
+        for (x1, y1, x2, y2), region_result in region_results:
+            page_result["text"] += region_result["text"]
+            page_result["chars"] = extend_page_chars(
+                page_result["chars"], offset_page_chars(region_result["chars"], x1, y1)
+            )
+            region_area += (x2 - x1) * (y2 - y1)
+        ocr_ratio = region_area / triage.pop("page_area") if region_area else 0.0
+        triage["saved_ms"] = round(max(ocr_cost.estimate() * (1 - ocr_ratio) - triage["extract_ms"], 0.0), 3)
+
+    page_result["triage"] = triage
+    logger.info(f"第{item.page_no}页: {triage['mode']}({triage['reason']}), 节省约{triage['saved_ms']}ms")
+    return item.page_no, page_result
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: rasterize
+Time: 2025/6/19 10:05
+"""
+import logging
+import os
+import shutil
+import tempfile
+import urllib.parse
+import urllib.request
+from contextlib import contextmanager
+
+import numpy as np
+import pymupdf
+
+from app.config.conf import (
+    PDF_RENDER_DPI,
+    PDF_MAX_PAGE_PIXELS,
+    PDF_DOWNLOAD_TIMEOUT,
+    PDF_UPLOAD_DIR,
+    PDF_URL_ALLOWED_HOSTS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def check_pdf_path(pdf_path: str) -> str:
+    """
+    pdf_path 由客户端提交，只接受 PDF_UPLOAD_DIR 下的文件和 PDF_URL_ALLOWED_HOSTS 中主机的 http(s) 地址，
+    不能借此读取服务器上的任意文件或访问内网地址
+    :return: 本地路径返回解析符号链接后的绝对路径，url 原样返回
+    :raise ValueError: 不允许的路径或 url
+    """
+    if pdf_path.startswith(("http://", "https://")):
+        host = (urllib.parse.urlsplit(pdf_path).hostname or "").lower()
+        if host not in PDF_URL_ALLOWED_HOSTS:
+            raise ValueError(f"pdf url host is not allowed: {host}")
+        return pdf_path
+    if "://" in pdf_path:
+        raise ValueError("pdf_path must be a file in the upload directory or an http(s) url")
+    if not PDF_UPLOAD_DIR:
+        raise ValueError("local pdf paths are not allowed")
+    upload_dir = os.path.realpath(PDF_UPLOAD_DIR)
+    local_path = os.path.realpath(os.path.join(upload_dir, pdf_path))
+    if os.path.commonpath([upload_dir, local_path]) != upload_dir:
+        raise ValueError("pdf_path must be a file in the upload directory")
+    return local_path
+
+
+class _AllowedHostRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """
+    重定向的目标地址同样要在允许的主机中
+    """
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        check_pdf_path(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+_url_opener = urllib.request.build_opener(_AllowedHostRedirectHandler)
+
+
+@contextmanager
+def open_local_pdf(pdf_path: str):
+    """
+    pdf_path 为 http(s) 地址时先下载到临时目录，退出时删除；路径和 url 先经 check_pdf_path 检查
+    """
+    pdf_path = check_pdf_path(pdf_path)
+    if not pdf_path.startswith(("http://", "https://")):
+        yield pdf_path
+        return
+
+    tmp_dir = tempfile.mkdtemp(prefix="pdf_")
+    local_path = os.path.join(tmp_dir, "document.pdf")
+    try:
+        with _url_opener.open(pdf_path, timeout=PDF_DOWNLOAD_TIMEOUT) as response, \
+                open(local_path, "wb") as f:
+            shutil.copyfileobj(response, f)
+        yield local_path
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def get_page_count(pdf_path: str) -> int:
+    with pymupdf.open(pdf_path) as doc:
+        return doc.page_count
+
+
+def page_zoom(page, dpi: int = PDF_RENDER_DPI, max_pixels: int = PDF_MAX_PAGE_PIXELS) -> float:
+    """
+    计算渲染缩放比例，页面过大（如工程图纸）时降低缩放比例使像素数不超过 max_pixels
+    """
+    zoom = dpi / 72
+    width, height = page.rect.width * zoom, page.rect.height * zoom
+    if max_pixels and width * height > max_pixels:
+        zoom *= (max_pixels / (width * height)) ** 0.5
+    return zoom
+
+
+def iter_pdf_pages(pdf_path: str, dpi: int = PDF_RENDER_DPI, image_format: str = "png",
+                   start: int = 0, end: int = None, max_pixels: int = PDF_MAX_PAGE_PIXELS):
+    """
+    逐页渲染 pdf，每次只在内存中保留一页
+    :param pdf_path: 本地 pdf 路径
+    :param dpi: 渲染 DPI
+    :param image_format: 输出图片格式 png / jpg
+    :param start: 起始页（从0开始）
+    :param end: 结束页（不包含），默认到最后一页
+    :param max_pixels: 单页最大像素数
+    :return: 生成器，依次返回 (page_no, 编码后的图片字节, zoom)
+    """
+    with pymupdf.open(pdf_path) as doc:
+        end = doc.page_count if end is None else min(end, doc.page_count)
+        for page_no in range(start, end):
+            page = doc.load_page(page_no)
+            zoom = page_zoom(page, dpi, max_pixels)
+            yield page_no, render_page(page, zoom, image_format), zoom
+
+
+def render_page(page, zoom: float, image_format: str = "png") -> bytes:
+    pix = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), alpha=False)
+    return pix.tobytes(image_format)
+
+
+def render_page_array(page, zoom: float):
+    """
+    渲染为 BGR 格式的 np.ndarray
+    """
+    pix = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), alpha=False, colorspace=pymupdf.csRGB)
+    img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+    return np.ascontiguousarray(img[:, :, ::-1])
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: text_layer
+Time: 2025/6/24 10:30
+"""
+import time
+
+import pymupdf
+
+from app.config.conf import (
+    TEXT_LAYER_MIN_CHARS,
+    TEXT_LAYER_MAX_INVALID_RATIO,
+    TEXT_LAYER_MIN_IMAGE_AREA_RATIO,
+)
+
+# 页面分流结果
+TRIAGE_TEXT_LAYER = "text_layer"  # 直接使用 pdf 内嵌文字
+TRIAGE_HYBRID = "hybrid"  # 使用内嵌文字，图片区域单独 OCR
+TRIAGE_OCR = "ocr"  # 整页 OCR（扫描件、字体编码损坏等）
+
+# 字体缺少 ToUnicode 映射时提取出的字符
+INVALID_CHARS = {"�", "\x00"}
+
+
+def _page_rect(bbox, page, zoom: float):
+    """
+    pdf 坐标（未旋转页面）转换为渲染后图片的像素坐标
+    """
+    return pymupdf.Rect(bbox) * page.rotation_matrix * zoom
+
+
+def extract_text_layer(page, zoom: float) -> dict:
+    """
+    提取 pdf 内嵌文字，返回与 TextOcr.predict 相同的结构，坐标为按 zoom 渲染后的像素坐标
+    """
+    result = {
+        "text": "",
+        "bbox": None,
+        "chars": [],
+        "chars_region": [],
+    }
+    raw = page.get_text("rawdict", flags=pymupdf.TEXT_PRESERVE_WHITESPACE | pymupdf.TEXT_MEDIABOX_CLIP)
+    for block in raw["blocks"]:
+        if block["type"] != 0:
+            continue
+        for line in block["lines"]:
+            for span in line["spans"]:
+                for char in span["chars"]:
+                    c = char["c"]
+                    if not c.strip():
+                        result["text"] += c
+                        continue
+                    rect = _page_rect(char["bbox"], page, zoom)
+                    result["text"] += c
+                    result["chars"].append(c)
+                    result["chars_region"].append((
+                        (rect.x0, rect.y0),
+                        (rect.x1, rect.y0),
+                        (rect.x1, rect.y1),
+                        (rect.x0, rect.y1),
+                    ))
+    return result
+
+
+def find_image_regions(page, zoom: float, text_result: dict, min_area_ratio: float = TEXT_LAYER_MIN_IMAGE_AREA_RATIO):
+    """
+    找出面积较大且内部没有内嵌文字的图片区域（扫描插图、图片形式的表格等），这些区域需要 OCR
+    :return: 像素坐标 [x1, y1, x2, y2] 列表
+    """
+    page_area = page.rect.width * page.rect.height * zoom * zoom
+    char_centers = [
+        ((region[0][0] + region[2][0]) / 2, (region[0][1] + region[2][1]) / 2)
+        for region in text_result["chars_region"]
+    ]
+    clip = page.rect * zoom
+    regions = []
+    for image in page.get_image_info():
+        rect = _page_rect(image["bbox"], page, zoom) & clip
+        if rect.is_empty or rect.width * rect.height < page_area * min_area_ratio:
+            continue
+        if any(rect.contains(center) for center in char_centers):
+            continue
+        regions.append([int(rect.x0), int(rect.y0), int(rect.x1 + 0.5), int(rect.y1 + 0.5)])
+    return regions
+
+
+def triage_page(page, zoom: float, min_chars: int = TEXT_LAYER_MIN_CHARS,
+                max_invalid_ratio: float = TEXT_LAYER_MAX_INVALID_RATIO):
+    """
+    判断页面是否可以直接使用内嵌文字
+    :return: (triage 信息, 内嵌文字结果)，整页 OCR 时内嵌文字结果为 None
+    """
+    start = time.perf_counter()
+    text_result = extract_text_layer(page, zoom)
+    char_count = len(text_result["chars"])
+    invalid_count = sum(1 for char in text_result["chars"] if char in INVALID_CHARS)
+
+    ocr_regions = []
+    if char_count < min_chars:
+        mode, reason = TRIAGE_OCR, "no_text_layer"
+    elif invalid_count / char_count > max_invalid_ratio:
+        mode, reason = TRIAGE_OCR, "invalid_text_layer"
+    else:
+        ocr_regions = find_image_regions(page, zoom, text_result)
+        mode, reason = (TRIAGE_HYBRID, "image_regions") if ocr_regions else (TRIAGE_TEXT_LAYER, "text_layer")
+
+    triage = {
+        "mode": mode,
+        "reason": reason,
+        "char_count": char_count,
+        "invalid_char_count": invalid_count,
+        "ocr_regions": ocr_regions,
+        "extract_ms": round((time.perf_counter() - start) * 1000, 3),
+    }
+    return triage, None if mode == TRIAGE_OCR else text_result
@@ -6,3 +6,12 @@ Author: youshun xu
 File: gunicorn.conf.py
 Time: 2025/6/13 14:17
 """
+import multiprocessing
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count() // 2 or 1))
+# 异步任务接口的 SSE 推送是长连接，需要使用 uvicorn 的异步 worker
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+keepalive = 5
@@ -8,6 +8,8 @@ Time: 2025/6/13 14:11
 """
 from fastapi import FastAPI
 
+from app.api import base_router
+
 app = FastAPI()
 
-app.include_router()
+app.include_router(base_router)
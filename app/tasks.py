@@ -6,56 +6,369 @@ Author: youshun xu
 File: tasks
 Time: 2025/6/13 14:11
 """
-from app.common.utils import remove_small_blocks_from_overlaps
+import os
+import time
+
+from celery import chord
+from celery.signals import task_postrun, task_prerun
+from celery.worker.control import inspect_command
+
+from app.common.metrics import TASK_METRIC, attach_timings, collect_timings, flush_metrics, observe
+from app.config.conf import REGION_FORMULA_BATCH_SIZE, REGION_OCR_BATCH_SIZE, REGION_TABLE_BATCH_SIZE
 from app.core.engine.celery_task import (
     celery_app,
+    batch_latex_ocr_task,
+    batch_layout_task,
+    batch_ocr_task,
+    batch_table_ocr_task,
     default_layout_task,
     default_ocr_task,
     latex_ocr_task,
+    layout_guided_ocr_task,
+    merge_regions_task,
+    pdf_ingest_task,
+    region_ocr_task,
     table_ocr_task)
-from app.tasks.layout_task import layout_task
-from app.tasks.ocr_task import ocr_task
+from app.core.engine.jobs import JobStore
+from app.core.engine.pipeline import (
+    REGION_FORMULA,
+    REGION_TABLE,
+    REGION_TEXT,
+    build_ocr_page_result,
+    crop_regions,
+    encode_crop,
+    merge_region_results,
+    offset_ocr_result,
+    split_batches,
+)
+from app.core.engine.raw_outputs import RAW_KEY, get_raw_writer
+from app.core.engine.registry import FORMULA_MODEL, LAYOUT_MODEL, OCR_MODEL, TABLE_MODEL, registry
+from app.core.engine.scheduling import LANE_BULK
+from app.core.engine.transport import pack_image
+from app.core.engine.worker_stats import get_worker_stats_sink, merge_counters, publish_worker_stats
+from app.core.pdf.document_job import DocumentJob
 
 
 @celery_app.task(name=default_layout_task, ignore_result=False)
-def default_layout_task(image_id: str, img_base64: str):
-    layout_results = layout_task.predict_page_image(img_base64)
-    layout_results = remove_small_blocks_from_overlaps(layout_results)
-    layout_results["layout_dets"] = layout_task.sort_layout_dets(
-        layout_results["layout_dets"]
-    )
-    result = {f"{image_id}": layout_results}
+def default_layout_task(image_id: str, img_base64: str, dedup_scope: str = None):
+    """
+    :param img_base64: base64 字符串，或由 app.core.engine.transport.pack_image 生成的图片引用
+    :param dedup_scope: 整页的去重作用域，由投递方按租户或文档计算（page_dedup_scope），为空时不做页面分流
+    """
+    with collect_timings() as timings:
+        layout_results = registry.get(LAYOUT_MODEL).predict_page_image(img_base64, dedup_scope)
+        layout_results = postprocess_layout(layout_results, image_id)
+    result = {f"{image_id}": attach_timings(layout_results, timings)}
+    return result
+
+
+@celery_app.task(name=batch_layout_task, ignore_result=False)
+def batch_layout_task(pages: list):
+    """
+    :param pages: [(image_id, img_base64), ...]，同一文档的多页图片按批次送入模型
+    """
+    image_ids = [image_id for image_id, _ in pages]
+    with collect_timings() as timings:
+        batch_results = registry.get(LAYOUT_MODEL).predict_page_images([img_base64 for _, img_base64 in pages])
+        batch_results = [
+            postprocess_layout(layout_results, image_id) for image_id, layout_results in zip(image_ids, batch_results)
+        ]
+
+    # 批量任务中每页记录的是整个批次的耗时
+    result = {}
+    for image_id, layout_results in zip(image_ids, batch_results):
+        result[f"{image_id}"] = attach_timings(layout_results, timings)
     return result
 
 
+def postprocess_layout(layout_results, image_id: str = None):
+    """
+    :param image_id: 开启原始输出（RAW_OUTPUT_DIR）时，后处理之前的模型输出按 image_id 保存
+    """
+    raw_writer = get_raw_writer()
+    if raw_writer is not None and image_id is not None:
+        raw_writer.save_layout(image_id, layout_results)
+    return registry.get(LAYOUT_MODEL).postprocess(layout_results)
+
+
+def save_raw_ocr(image_id: str, ocr_results: dict) -> dict:
+    """
+    取出 TextOcr 结果中的原始文本行（RAW_KEY），开启原始输出时按 image_id 保存
+    """
+    raw = ocr_results.pop(RAW_KEY, None)
+    raw_writer = get_raw_writer()
+    if raw is not None and raw_writer is not None:
+        raw_writer.save_ocr(image_id, raw)
+    return ocr_results
+
+
 @celery_app.task(name=default_ocr_task, ignore_result=False)
-def default_ocr_parse_task(image_id: str, img_base64: str):
-    ocr_results = ocr_task.predict_images(image_id, img_base64)
-    text = ocr_results["text"]
-    text_word = ocr_results["text_word"]
-    text_word_region = ocr_results["text_word_region"]
-    bbox = ocr_results.get("text_region", []) or ocr_results.get("cell_bbox", []) or None
-    # 解析每个字符
-    dchars = ocr_task.to_dchars(text_word, text_word_region)
-    # 表格转换成html形式
-    table_markdown = ocr_task.html_to_markdown(ocr_results.get("tabel_html", ""))
-
-    result = {
-        f"{image_id}": {
-            "text": text,
-            "bbox": bbox,
-            "chars": dchars,
-            "table_markdown": table_markdown,
-        }
-    }
+def default_ocr_parse_task(image_id: str, img_base64: str, dedup_scope: str = None):
+    with collect_timings() as timings:
+        ocr_results = save_raw_ocr(image_id, registry.get(OCR_MODEL).predict_images(img_base64, dedup_scope))
+        page_result = build_ocr_page_result(ocr_results)
+    result = {f"{image_id}": attach_timings(page_result, timings)}
     return result
 
 
+@celery_app.task(name=batch_ocr_task, ignore_result=False)
+def batch_ocr_task(pages: list):
+    """
+    :param pages: [(image_id, img_base64), ...]，多页（或多个版面区域）的文本行合并到同一批次识别
+    """
+    image_ids = [image_id for image_id, _ in pages]
+    with collect_timings() as timings:
+        batch_results = registry.get(OCR_MODEL).predict_images_batch(
+            [img_base64 for _, img_base64 in pages], keep_raw=get_raw_writer() is not None
+        )
+        page_results = [
+            build_ocr_page_result(save_raw_ocr(image_id, ocr_results))
+            for image_id, ocr_results in zip(image_ids, batch_results)
+        ]
+    return {
+        f"{image_id}": attach_timings(page_result, timings)
+        for image_id, page_result in zip(image_ids, page_results)
+    }
+
+
 @celery_app.task(name=latex_ocr_task, ignore_result=False)
 def latex_ocr_task(image_id: str, img_base64: str):
-    pass
+    return batch_latex_ocr_task([(image_id, img_base64)])
+
+
+@celery_app.task(name=batch_latex_ocr_task, ignore_result=False)
+def batch_latex_ocr_task(formulas: list):
+    """
+    :param formulas: [(image_id, img_base64), ...]，所有公式合并到同一批次识别，重复的公式只识别一次
+    """
+    image_ids = [image_id for image_id, _ in formulas]
+    with collect_timings() as timings:
+        results = registry.get(FORMULA_MODEL).predict_formulas([img_base64 for _, img_base64 in formulas])
+    return {
+        f"{image_id}": attach_timings(result, timings)
+        for image_id, result in zip(image_ids, results)
+    }
 
 
 @celery_app.task(name=table_ocr_task, ignore_result=False)
 def table_ocr_task(image_id: str, img_base64: str):
-    pass
+    return batch_table_ocr_task([(image_id, img_base64)])
+
+
+@celery_app.task(name=batch_table_ocr_task, ignore_result=False)
+def batch_table_ocr_task(tables: list):
+    """
+    :param tables: [(image_id, img_base64), ...]，所有表格的文本行合并到同一批次识别，
+        表格结构批量预测后直接把识别出的字符填入单元格，不再逐个单元格识别
+    """
+    image_ids = [image_id for image_id, _ in tables]
+    images = [img_base64 for _, img_base64 in tables]
+    with collect_timings() as timings:
+        ocr_results = registry.get(OCR_MODEL).predict_images_batch(images)
+        table_results = registry.get(TABLE_MODEL).predict_tables(images, ocr_results)
+        page_results = [build_table_page_result(table_result) for table_result in table_results]
+    return {
+        f"{image_id}": attach_timings(page_result, timings)
+        for image_id, page_result in zip(image_ids, page_results)
+    }
+
+
+def build_table_page_result(table_results):
+    page_result = build_ocr_page_result(table_results)
+    page_result["table_html"] = table_results["tabel_html"]
+    page_result["table_structure"] = table_results["table_structure"]
+    return page_result
+
+
+@celery_app.task(name=layout_guided_ocr_task, bind=True, ignore_result=False)
+def layout_guided_ocr_task(self, image_id: str, img_base64: str, dedup_scope: str = None):
+    """
+    版面引导的 OCR: 先做版面检测，只裁剪文本类区域分批送去文本识别，表格和公式区域分别送到各自的队列，
+    figure 和 abandon 区域跳过，所有区域结束后由 merge_regions_task 合并回页面坐标
+    :param dedup_scope: 版面检测的页面分流作用域，空白页没有区域，直接返回空结果
+    """
+    layout_task = registry.get(LAYOUT_MODEL)
+    layout_results = postprocess_layout(layout_task.predict_page_image(img_base64, dedup_scope), image_id)
+    regions = crop_regions(
+        layout_task.decode_image(img_base64), layout_results["layout_dets"], layout_task.model.id_to_names
+    )
+
+    header = []
+    text_regions = []
+    table_regions = []
+    formula_regions = []
+    for region in regions:
+        region["image"] = pack_image(encode_crop(region.pop("crop")))
+        region_image_id = f"{image_id}_region_{region['region_id']}"
+        if region["kind"] == REGION_TEXT:
+            text_regions.append(region)
+        elif region["kind"] == REGION_TABLE:
+            table_regions.append((region_image_id, region["image"]))
+        elif region["kind"] == REGION_FORMULA:
+            formula_regions.append((region_image_id, region["image"]))
+    for batch in split_batches(text_regions, REGION_OCR_BATCH_SIZE):
+        header.append(region_ocr_task.s(image_id, batch))
+    for batch in split_batches(table_regions, REGION_TABLE_BATCH_SIZE):
+        header.append(batch_table_ocr_task.s(batch))
+    for batch in split_batches(formula_regions, REGION_FORMULA_BATCH_SIZE):
+        header.append(batch_latex_ocr_task.s(batch))
+
+    regions = [{key: value for key, value in region.items() if key != "image"} for region in regions]
+    if not header:
+        return merge_regions_task([], image_id, layout_results, regions)
+    raise self.replace(chord(header, merge_regions_task.s(image_id, layout_results, regions)))
+
+
+@celery_app.task(name=region_ocr_task, ignore_result=False)
+def region_ocr_task(image_id: str, regions: list):
+    """
+    :param regions: 同一页的多个文本区域，所有区域的文本行合并到同一批次识别
+    :return: 页面坐标下的区域识别结果列表
+    """
+    ocr_results = registry.get(OCR_MODEL).predict_images_batch([region["image"] for region in regions])
+    return [
+        {
+            "region_id": region["region_id"],
+            "category": region["category"],
+            "bbox": region["bbox"],
+            "ocr": offset_ocr_result(ocr_result, region["bbox"][0], region["bbox"][1]),
+        }
+        for region, ocr_result in zip(regions, ocr_results)
+    ]
+
+
+@celery_app.task(name=merge_regions_task, ignore_result=False)
+def merge_regions_task(results: list, image_id: str, layout_results: dict, regions: list):
+    """
+    :param results: chord 中各个区域任务的结果，文本区域为列表，表格和公式为 {region_image_id: 结果}
+    :param regions: 区域元数据（不含图片）
+    """
+    regions_by_image_id = {f"{image_id}_region_{region['region_id']}": region for region in regions}
+    text_results = []
+    tables = []
+    formulas = []
+    for result in results:
+        if isinstance(result, list):
+            text_results.extend(result)
+            continue
+        for region_image_id, region_result in (result or {}).items():
+            region = regions_by_image_id[region_image_id]
+            item = {"region_id": region["region_id"], "bbox": region["bbox"], "result": region_result}
+            if region["kind"] == REGION_TABLE:
+                tables.append(item)
+            else:
+                formulas.append(item)
+
+    merged = merge_region_results(text_results)
+    page_result = build_ocr_page_result(merged)
+    page_result["regions"] = merged["regions"]
+    page_result["tables"] = sorted(tables, key=lambda item: item["region_id"])
+    page_result["formulas"] = sorted(formulas, key=lambda item: item["region_id"])
+    page_result["layout"] = layout_results
+    return {f"{image_id}": page_result}
+
+
+@celery_app.task(name=pdf_ingest_task, ignore_result=False)
+def pdf_ingest_task(job_id: str, pdf_path: str, task_name: str, dpi: int, max_in_flight: int,
+                    tenant: str = None, lane: str = LANE_BULK):
+    """
+    异步任务接口的 pdf 任务: 边渲染边投递页面任务，并把每页的 celery 任务 id 记录到 JobStore，
+    每页结果写入检查点，失败的页面按退避重试。同一 job_id 再次执行时（恢复任务）跳过已完成的页面
+    :param tenant / lane: 提交请求的租户和调度通道，批量通道按租户平分队列中的页数
+    """
+    store = JobStore()
+    job = DocumentJob(
+        job_id, pdf_path, task_name, dpi=dpi, max_in_flight=max_in_flight, tenant=tenant, lane=lane,
+        on_dispatch=lambda page_no, image_id, async_result: store.add_page(
+            job_id, str(page_no), image_id, async_result.id
+        ),
+    )
+    try:
+        stats = job.run(store.pages(job_id))
+    except Exception as e:
+        store.fail_dispatch(job_id, str(e))
+        raise
+    store.finish_dispatch(job_id, stats["total"])
+    return {"job_id": job_id, **stats}
+
+
+_task_started = {}
+
+
+@task_prerun.connect
+def record_task_start(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def record_task_time(task_id=None, task=None, **kwargs):
+    start = _task_started.pop(task_id, None)
+    if start is not None:
+        observe(task.name, time.perf_counter() - start, metric=TASK_METRIC)
+    flush_metrics()
+    publish_worker_stats(task.request.hostname, process_stats)
+
+
+def process_stats() -> dict:
+    """
+    本进程中已加载任务的缓存、页面分流、微批和模型统计
+    """
+    tasks = registry.loaded().values()
+    return {
+        "cache": [task.cache.stats() for task in tasks],
+        "dedup": [task.dedup.stats() for task in tasks if task.dedup is not None],
+        "batch": [task.batcher.stats() for task in tasks if task.batcher is not None],
+        "models": registry.stats(),
+    }
+
+
+def worker_stats(state, kind: str) -> dict:
+    """
+    prefork 池中缓存和模型在子进程里，inspect 命令由主进程执行: METRICS_SINK=redis 时读取本节点各进程写入 redis 的快照；
+    否则只能返回主进程自己的统计，只适用于 threads / solo 池
+    :return: {进程: 统计}
+    """
+    sink = get_worker_stats_sink()
+    if sink is None:
+        return {f"{state.consumer.hostname}|{os.getpid()}": process_stats()[kind]}
+    return {process: stats[kind] for process, stats in sink.read(state.consumer.hostname).items() if kind in stats}
+
+
+@inspect_command()
+def cache_stats(state):
+    """
+    查看 worker 的结果缓存命中情况: celery -A app.tasks inspect cache_stats
+    :return: 各进程的统计和按命名空间合并后的命中率
+    """
+    processes = worker_stats(state, "cache")
+    total = merge_counters([item for items in processes.values() for item in items], "namespace", "hit_rate",
+                           ("hits",), ("hits", "misses"))
+    return {"processes": processes, "total": total}
+
+
+@inspect_command()
+def dedup_stats(state):
+    """
+    查看页面分流跳过的空白页和近似重复页: celery -A app.tasks inspect dedup_stats
+    :return: 各进程的统计和按命名空间合并后的跳过比例
+    """
+    processes = worker_stats(state, "dedup")
+    total = merge_counters([item for items in processes.values() for item in items], "namespace", "skip_rate",
+                           ("blank", "duplicate"), ("pages",))
+    return {"processes": processes, "total": total}
+
+
+@inspect_command()
+def batch_stats(state):
+    """
+    查看微批的批大小分布: celery -A app.tasks inspect batch_stats
+    """
+    return worker_stats(state, "batch")
+
+
+@inspect_command()
+def model_stats(state):
+    """
+    查看 worker 各进程已加载的模型、加载耗时和内存: celery -A app.tasks inspect model_stats
+    """
+    return worker_stats(state, "models")
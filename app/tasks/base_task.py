@@ -6,8 +6,106 @@ Author: youshun xu
 File: base_task
 Time: 2025/6/13 14:28
 """
+import threading
+
+from app.common.image import decode_image
+from app.common.metrics import STAGE_DECODE, timer
+from app.core.engine.cache import NullResultCache
+from app.core.engine.transport import load_image_bytes
 
 
 class BaseTask:
-    def __init__(self, model):
+    def __init__(self, model, cache=None, batcher=None, dedup=None):
+        """
+        :param batcher: MicroBatcher，开启微批时并发任务的图片合并成一次推理
+        :param dedup: PageDedup，整页图片推理前跳过空白页和近似重复页
+        """
         self.model = model
+        self.cache = cache or NullResultCache()
+        self.batcher = batcher
+        self.dedup = dedup
+        # threads 池中同一个模型实例不能并发推理
+        self._model_lock = threading.Lock()
+
+    def run_model(self, img_arrays: list):
+        """
+        模型推理，开启微批时交给 batcher 与其他线程中的任务合并推理
+        """
+        if self.batcher is not None:
+            return self.batcher.predict(img_arrays)
+        with self._model_lock:
+            if len(img_arrays) == 1:
+                return [self.model.predict(img_arrays[0])]
+            return self.model.predict_batch(img_arrays)
+
+    def cached_predict(self, images: list, predict_batch, dedup_scope: str = None):
+        """
+        先查结果缓存，只对未命中的图片调用模型
+        :param images: base64 字符串或图片引用列表
+        :param predict_batch: 接收 np.ndarray 列表、返回结果列表的模型调用
+        :param dedup_scope: 整页图片的去重作用域（见 page_dedup_scope），不为 None 时先经过页面分流，
+            空白页和作用域内的近似重复页不调用模型；版面区域等局部图片不传
+        :return: 与 images 一一对应的结果列表
+        """
+        images_bytes = [load_image_bytes(img) for img in images]
+        results = [self.cache.get(img_bytes) for img_bytes in images_bytes]
+        missing = [idx for idx, result in enumerate(results) if result is None]
+        if missing:
+            with timer(STAGE_DECODE):
+                decoded = {idx: self.decode_for_model(images_bytes[idx]) for idx in missing}
+            fingerprints = {}
+            if self.dedup is not None and dedup_scope is not None:
+                for idx in missing:
+                    img, size = decoded[idx]
+                    fingerprints[idx], results[idx] = self.dedup.triage(
+                        dedup_scope, img, size, self.empty_result, self.shift_result
+                    )
+                missing = [idx for idx in missing if results[idx] is None]
+            computed = predict_batch([decoded[idx][0] for idx in missing]) if missing else []
+            for idx, result in zip(missing, computed):
+                img, size = decoded[idx]
+                result = self.restore_result(result, img, size)
+                self.cache.set(images_bytes[idx], result)
+                if idx in fingerprints:
+                    self.dedup.add(dedup_scope, fingerprints[idx], result)
+                results[idx] = result
+        return results
+
+    @classmethod
+    def decode_image(cls, img_base64: str):
+        """
+        :param img_base64: base64 字符串或图片存储中的图片引用
+        :return: BGR 格式的 np.ndarray
+        """
+        return cls.decode_image_bytes(load_image_bytes(img_base64))
+
+    @staticmethod
+    def decode_image_bytes(img_data: bytes):
+        return decode_image(img_data)
+
+    def decode_for_model(self, img_data: bytes):
+        """
+        解码送入模型的图片，子类可以在解码时缩小图片
+        :return: (BGR 图片, 原图尺寸 (width, height))
+        """
+        img = self.decode_image_bytes(img_data)
+        return img, (img.shape[1], img.shape[0])
+
+    def restore_result(self, result, img, size):
+        """
+        把基于缩小后图片的结果还原到原图坐标
+        """
+        return result
+
+    def empty_result(self, size):
+        """
+        空白页的结果，返回 None 时空白页仍然调用模型
+        :param size: 原图尺寸 (width, height)
+        """
+        return None
+
+    def shift_result(self, result, dx: float, dy: float):
+        """
+        把近似重复页的结果平移 (dx, dy) 后用于当前页，返回 None 时不复用近似重复页
+        """
+        return None
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: formula_task
+Time: 2025/7/4 15:10
+"""
+import numpy as np
+
+from app.common.metrics import STAGE_DECODE, timer
+from app.common.utils import load_config
+from app.core.engine.batching import build_micro_batcher
+from app.core.engine.cache import HammingMemo, build_result_cache
+from app.core.ocr.models.latex_ocr import LatexOcr, formula_signature, normalize_formula
+from app.tasks.base_task import BaseTask
+
+TASK_NAME = "formula_recognition"
+
+
+class FormulaTask(BaseTask):
+    def __init__(self, model: LatexOcr = None):
+        config = load_config(TASK_NAME)
+        model_config = config[TASK_NAME].model_config
+        model = model or LatexOcr(model_config)
+        memo = HammingMemo(
+            build_result_cache(TASK_NAME, model_config),
+            model_config.get("memo_max_distance", 0),
+            model_config.get("memo_bucket_size", 256),
+        )
+        super().__init__(model, memo, build_micro_batcher(model.predict_batch, TASK_NAME))
+
+    def predict_formulas(self, images_base64: list):
+        """
+        批量识别公式。结果按归一化后公式的感知哈希缓存，默认只复用哈希完全相同的公式（memo_max_distance），
+        同一文档或不同文档中重复出现的公式只识别一次；同一批中重复的公式只送入模型一次
+        :return: 与 images_base64 一一对应的 {"latex": str, "truncated": bool}
+        """
+        with timer(STAGE_DECODE):
+            normalized = [normalize_formula(self.decode_image(img)) for img in images_base64]
+        results = [{"latex": "", "truncated": False} if gray is None else None for gray in normalized]
+        signatures = [formula_signature(gray) if gray is not None else None for gray in normalized]
+        for idx, signature in enumerate(signatures):
+            if signature is not None:
+                results[idx] = self.cache.lookup(*signature)
+
+        groups = self._group_duplicates([idx for idx, result in enumerate(results) if result is None], signatures)
+        if groups:
+            computed = self.run_model([normalized[indices[0]] for indices in groups])
+            for indices, result in zip(groups, computed):
+                # 被截断的结果与时间预算有关，不缓存
+                if not result["truncated"]:
+                    buckets, phash = signatures[indices[0]]
+                    self.cache.add(buckets[0], phash, result)
+                for idx in indices:
+                    results[idx] = dict(result)
+        return results
+
+    def _group_duplicates(self, indices: list, signatures: list):
+        """
+        未命中缓存的公式按哈希距离分组，每组只识别第一个
+        """
+        groups = []
+        representatives = []
+        for idx in indices:
+            buckets, phash = signatures[idx]
+            bits = np.unpackbits(np.frombuffer(phash, dtype=np.uint8))
+            for group, (group_buckets, group_bits) in zip(groups, representatives):
+                if group_buckets[0] in buckets and (group_bits != bits).sum() <= self.cache.max_distance:
+                    group.append(idx)
+                    break
+            else:
+                groups.append([idx])
+                representatives.append((buckets, bits))
+        return groups
@@ -6,16 +6,16 @@ Author: youshun xu
 File: layout_task
 Time: 2025/6/13 15:04
 """
-import base64
 import logging
-from io import BytesIO
-
-import cv2
-import numpy as np
-from PIL import Image
 
+from app.common.image import decode_image_reduced, image_size
 from app.common.utils import load_config
+from app.core.engine.batching import build_micro_batcher
+from app.core.engine.cache import build_result_cache
+from app.core.engine.dedup import build_page_dedup
+from app.core.engine.postprocess import LayoutPostprocess
 from app.core.layout.models.yolo import LayoutYOLOv10
+from app.core.layout.reading_order import sort_layout_dets
 from app.tasks.base_task import BaseTask
 
 TASK_NAME = "layout_detection"
@@ -24,47 +24,71 @@ logger = logging.getLogger(__name__)
 
 
 class LayoutTask(BaseTask):
-    def __init__(self):
+    def __init__(self, model: LayoutYOLOv10 = None):
         config = load_config(TASK_NAME)
-        model = LayoutYOLOv10(config)
-        super().__init__(model)
+        model_config = config[TASK_NAME].model_config
+        model = model or LayoutYOLOv10(model_config)
+        # 原图远大于模型输入尺寸时在解码阶段缩小（JPEG），结果坐标还原到原图
+        self.reduced_decode = model_config.get("reduced_decode", True)
+        super().__init__(
+            model, build_result_cache(TASK_NAME, model_config), build_micro_batcher(model.predict_batch, TASK_NAME),
+            build_page_dedup(TASK_NAME, model_config),
+        )
+        # 置信度过滤、重叠块删除和排序，页面任务和离线重新后处理共用
+        self.postprocess = LayoutPostprocess.from_config(model_config, model.id_to_names)
 
-    def predict_page_image(self, img_base64: str):
-        img_data = base64.b64decode(img_base64)
-        img = Image.open(BytesIO(img_data))
-        img = img.convert("RGB")
-        img_array = cv2.cvtColor(np.asarray(img), cv2.COLOR_RGB2BGR)
-        layout_result = self.model.predict(img_array)
+    def predict_page_image(self, img_base64: str, dedup_scope: str = None):
+        """
+        :param dedup_scope: 去重作用域，见 BaseTask.cached_predict
+        """
+        layout_result = self.cached_predict([img_base64], self.run_model, dedup_scope)[0]
         return layout_result
 
-    @staticmethod
-    def sort_layout_dets(layout_dets, sort_by="top_left_y_then_x"):
+    def predict_page_images(self, images_base64: list):
+        """
+        批量预测多页图片，返回与输入顺序一致的结果列表
         """
-        对 layout_dets 中的元素按照矩形框坐标排序
+        return self.cached_predict(images_base64, self.run_model)
 
-        参数:
-            layout_dets: 包含 poly 和 category_id 的字典列表
-            sort_by: 排序方式，可选:
-                - 'top_left_x': 按左上角 x 坐标 (x0) 排序
-                - 'top_left_y': 按左上角 y 坐标 (y0) 排序
-                - 'top_left_y_then_x': 先按 y0 排序，再按 x0 排序（默认）
+    def decode_for_model(self, img_data: bytes):
+        if not self.reduced_decode:
+            return super().decode_for_model(img_data)
+        tiler = self.model.tiler
+        if tiler is not None:
+            size = image_size(img_data)
+            # 需要切块的页面保留原图分辨率
+            if size and tiler.applies(*size):
+                return super().decode_for_model(img_data)
+        return decode_image_reduced(img_data, self.model.img_size)
 
-        返回:
-            排序后的 layout_dets
-        """
-        if sort_by == "top_left_x":
-            # 按左上角 x 坐标 (x0) 排序
-            return sorted(layout_dets, key=lambda item: item["poly"][0])
-        elif sort_by == "top_left_y":
-            # 按左上角 y 坐标 (y0) 排序
-            return sorted(layout_dets, key=lambda item: item["poly"][1])
-        elif sort_by == "top_left_y_then_x":
-            # 先按 y0 排序，再按 x0 排序（类似阅读顺序）
-            return sorted(
-                layout_dets, key=lambda item: (item["poly"][1], item["poly"][0])
-            )
-        else:
-            return layout_dets
+    def restore_result(self, result, img, size):
+        width, height = size
+        if (img.shape[1], img.shape[0]) == (width, height):
+            return result
+        scale_x, scale_y = width / img.shape[1], height / img.shape[0]
+        for det in result["layout_dets"]:
+            det["poly"] = [
+                value * (scale_x if i % 2 == 0 else scale_y) for i, value in enumerate(det["poly"])
+            ]
+        result["page_info"] = {"height": height, "width": width}
+        return result
+
+    def empty_result(self, size):
+        width, height = size
+        return {"layout_dets": [], "page_info": {"height": height, "width": width}}
 
+    def shift_result(self, result, dx: float, dy: float):
+        width, height = result["page_info"]["width"], result["page_info"]["height"]
+        for det in result["layout_dets"]:
+            det["poly"] = [
+                min(max(value + dx, 0), width) if i % 2 == 0 else min(max(value + dy, 0), height)
+                for i, value in enumerate(det["poly"])
+            ]
+        return result
 
-layout_task = LayoutTask()
+    @staticmethod
+    def sort_layout_dets(layout_dets, sort_by="top_left_y_then_x", id_to_names=None, page_height=None):
+        """
+        对 layout_dets 中的元素按照矩形框坐标排序，见 app.core.layout.reading_order.sort_layout_dets
+        """
+        return sort_layout_dets(layout_dets, sort_by, id_to_names, page_height)
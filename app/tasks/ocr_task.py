@@ -6,15 +6,14 @@ Author: youshun xu
 File: ocr_task
 Time: 2025/6/13 15:04
 """
-import base64
-from io import BytesIO
+from omegaconf import OmegaConf
 
-import cv2
-import html2text
-import numpy as np
-from PIL import Image
-
-from app.common.utils import load_config
+from app.common.utils import html_to_markdown, load_config
+from app.core.engine.batching import build_micro_batcher
+from app.core.engine.cache import build_result_cache
+from app.core.engine.dedup import build_page_dedup
+from app.core.engine.raw_outputs import RAW_KEY
+from app.core.ocr.chars import to_dchars
 from app.core.ocr.models.text_ocr import TextOcr
 from app.tasks.base_task import BaseTask
 
@@ -22,44 +21,54 @@ TASK_NAME = "ocr"
 
 
 class OcrTask(BaseTask):
-    def __init__(self):
+    def __init__(self, model: TextOcr = None):
         config = load_config(TASK_NAME)
-        model = TextOcr(config)
-        super().__init__(model)
+        model_config = config[TASK_NAME].model_config
+        model = model or TextOcr(model_config)
+        # 字符结果格式不同、是否附带原始文本行不同时缓存的结果不能复用
+        cache_config = OmegaConf.merge(
+            model_config, {"char_format": model.char_format}, {"keep_raw": True} if model.keep_raw else {}
+        )
+        super().__init__(
+            model, build_result_cache(TASK_NAME, cache_config), build_micro_batcher(model.predict_batch, TASK_NAME),
+            build_page_dedup(TASK_NAME, cache_config, near_duplicates=False),
+        )
 
-    def predict_images(self, img_base64: str):
-        img_data = base64.b64decode(img_base64)
-        img = Image.open(BytesIO(img_data))
-        img = img.convert("RGB")
-        img_array = cv2.cvtColor(np.asarray(img), cv2.COLOR_RGB2BGR)
-        ocr_result = self.model.predict(img_array)
+    def predict_images(self, img_base64: str, dedup_scope: str = None):
+        """
+        :param dedup_scope: 整页 OCR 的去重作用域，见 BaseTask.cached_predict
+        :return: TextOcr 的结果，开启原始输出时附带 RAW_KEY，由页面任务取出
+        """
+        ocr_result = self.cached_predict([img_base64], self.run_model, dedup_scope)[0]
         return ocr_result
 
+    def predict_images_batch(self, images_base64: list, keep_raw: bool = False):
+        """
+        多张图片的文本行合并到同一批次识别，返回与输入顺序一致的结果列表
+        :param keep_raw: 整页图片（batch_ocr_task）为 True，结果中附带 RAW_KEY 由页面任务取出保存；
+            版面区域和表格为 False，原始文本行不写入缓存
+        """
+        if keep_raw:
+            return self.cached_predict(images_base64, self.run_model)
+        results = self.cached_predict(images_base64, self._run_model_without_raw)
+        # 旧的缓存结果中可能附带原始文本行
+        for result in results:
+            result.pop(RAW_KEY, None)
+        return results
+
+    def _run_model_without_raw(self, img_arrays: list):
+        results = self.run_model(img_arrays)
+        for result in results:
+            result.pop(RAW_KEY, None)
+        return results
+
+    def empty_result(self, size):
+        return self.model.empty_result()
+
     @staticmethod
     def html_to_markdown(html_content: str):
-        if not html_content:
-            return ""
-        converter = html2text.HTML2Text()
-        converter.ignore_links = True
-        return converter.handle(html_content)
+        return html_to_markdown(html_content)
 
     @staticmethod
     def to_dchars(text_word, text_word_region) -> list:
-        dchars = []
-        for i, words in enumerate(text_word):
-            word_region = text_word_region[i]
-            for j, word in enumerate(words):
-                dchars.append(
-                    {
-                        "height": round(word_region[j][3][1] - word_region[j][0][1], 2),
-                        "width": round(word_region[j][2][0] - word_region[j][0][0], 2),
-                        "str": word,
-                        "y": round(word_region[j][3][1], 2),
-                        "x": round(word_region[j][0][0], 2),
-                        "accumulated_y": round(word_region[j][3][1], 2),
-                    }
-                )
-        return dchars
-
-
-ocr_task = OcrTask()
+        return to_dchars(text_word, text_word_region)
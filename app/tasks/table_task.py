@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: table_task
+Time: 2025/7/4 10:20
+"""
+from app.common.utils import load_config
+from app.core.engine.batching import build_micro_batcher
+from app.core.ocr.models.table_ocr import TableOcr
+from app.tasks.base_task import BaseTask
+
+TASK_NAME = "table_parsing"
+
+
+class TableTask(BaseTask):
+    def __init__(self, model: TableOcr = None):
+        config = load_config(TASK_NAME)
+        model_config = config[TASK_NAME].model_config
+        model = model or TableOcr(model_config)
+        # 超过时间预算的表格退化为文本网格，结构结果不做缓存
+        super().__init__(model, batcher=build_micro_batcher(model.predict_batch, TASK_NAME))
+
+    def predict_tables(self, images_base64: list, ocr_results: list):
+        """
+        批量识别表格结构，单元格内容取自整张表格图片的 OCR 结果
+        :param ocr_results: 与 images_base64 一一对应的 TextOcr 结果
+        :return: ocr_results 加上 tabel_html 和 table_structure（model 或 grid）
+        """
+        structures = self.cached_predict(images_base64, self.run_model)
+        return [self.model.build_table(structure, ocr_result) for structure, ocr_result in zip(structures, ocr_results)]
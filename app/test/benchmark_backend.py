@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: benchmark_backend
+Time: 2025/7/2 14:30
+"""
+import argparse
+import difflib
+import json
+import time
+
+import cv2
+import numpy as np
+from omegaconf import OmegaConf
+
+from app.common.utils import load_config
+from app.core.backend.onnx_runtime import BACKEND_ONNXRUNTIME, BACKEND_PADDLE, BACKEND_TORCH
+from app.test.benchmark_image_decode import make_scan
+
+INT8 = "onnxruntime-int8"
+NATIVE_BACKENDS = {"layout": BACKEND_TORCH, "ocr": BACKEND_PADDLE}
+TASK_NAMES = {"layout": "layout_detection", "ocr": "ocr"}
+
+
+def build_model(task: str, backend: str, threads: int):
+    """
+    :param backend: torch/paddle、onnxruntime 或 onnxruntime-int8
+    """
+    model_config = load_config(TASK_NAMES[task])[TASK_NAMES[task]].model_config
+    override = {"backend": BACKEND_ONNXRUNTIME if backend == INT8 else backend}
+    if backend != NATIVE_BACKENDS[task]:
+        override["onnxruntime"] = {"quantized": backend == INT8, "intra_op_num_threads": threads}
+    model_config = OmegaConf.merge(model_config, override)
+    if task == "layout":
+        from app.core.layout.models.yolo import LayoutYOLOv10
+        return LayoutYOLOv10(model_config)
+    from app.core.ocr.models.text_ocr import TextOcr
+    return TextOcr(model_config)
+
+
+def box_iou(a, b) -> float:
+    x0, y0 = max(a[0], b[0]), max(a[1], b[1])
+    x1, y1 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(x1 - x0, 0) * max(y1 - y0, 0)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def compare_layout(reference: dict, result: dict, min_iou: float) -> dict:
+    """
+    参考结果中的每个框与同类别 IoU 最大的框匹配
+    """
+    ious, score_diffs = [], []
+    for det in reference["layout_dets"]:
+        candidates = [item for item in result["layout_dets"] if item["category_id"] == det["category_id"]]
+        best = max(candidates, key=lambda item: box_iou(det["poly"], item["poly"]), default=None)
+        iou = box_iou(det["poly"], best["poly"]) if best else 0.0
+        ious.append(iou)
+        if iou >= min_iou:
+            score_diffs.append(abs(det["score"] - best["score"]))
+    return {
+        "boxes": len(result["layout_dets"]),
+        "reference_boxes": len(reference["layout_dets"]),
+        "matched_ratio": round(sum(iou >= min_iou for iou in ious) / len(ious), 4) if ious else 1.0,
+        "mean_iou": round(float(np.mean(ious)), 4) if ious else 1.0,
+        "max_score_diff": round(max(score_diffs), 4) if score_diffs else 0.0,
+    }
+
+
+def compare_ocr(reference: dict, result: dict) -> dict:
+    return {
+        "chars": len(result["text"]),
+        "reference_chars": len(reference["text"]),
+        "text_similarity": round(difflib.SequenceMatcher(None, reference["text"], result["text"]).ratio(), 4),
+    }
+
+
+def run_backend(model, image, repeat: int, warmup: int):
+    for _ in range(warmup):
+        model.predict(image)
+    latencies = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = model.predict(image)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return result, {
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "mean_ms": round(float(np.mean(latencies)), 2),
+        "min_ms": round(min(latencies), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="cpu inference backend benchmark")
+    parser.add_argument("--task", choices=["layout", "ocr"], default="layout")
+    parser.add_argument("--backends", nargs="+", default=None,
+                        help="默认: 原生后端 onnxruntime onnxruntime-int8，第一个作为对比基准")
+    parser.add_argument("--image", default=None, help="页面图片，默认生成模拟扫描页")
+    parser.add_argument("--width", type=int, default=1654)
+    parser.add_argument("--height", type=int, default=2339)
+    parser.add_argument("--threads", type=int, default=0, help="onnxruntime intra_op 线程数，0 为默认")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--min-iou", type=float, default=0.9, help="版面框视为一致的最小 IoU")
+    args = parser.parse_args()
+
+    image = cv2.imread(args.image) if args.image else make_scan(args.width, args.height)
+    backends = args.backends or [NATIVE_BACKENDS[args.task], BACKEND_ONNXRUNTIME, INT8]
+    reference = None
+    for backend in backends:
+        model = build_model(args.task, backend, args.threads)
+        result, latency = run_backend(model, image, args.repeat, args.warmup)
+        report = {"task": args.task, "backend": backend, "threads": args.threads, **latency}
+        if reference is None:
+            reference = result
+        elif args.task == "layout":
+            report.update(compare_layout(reference, result, args.min_iou))
+        else:
+            report.update(compare_ocr(reference, result))
+        print(json.dumps(report, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: benchmark_chars
+Time: 2025/6/25 14:10
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+import numpy as np
+
+from app.core.engine.pipeline import build_ocr_page_result
+from app.core.ocr.chars import build_text_result
+
+
+def make_rec_output(n_chars, chars_per_line=40, seed=0):
+    """
+    生成一页模拟的 PaddleOCR 输出: 文本行检测框和识别结果（文本, 分数, (列数, 词, 词的列位置, 词类型)）
+    """
+    rng = np.random.default_rng(seed)
+    dt_boxes, rec_res = [], []
+    line = 0
+    while n_chars > 0:
+        count = min(chars_per_line, n_chars)
+        n_chars -= count
+        y0, y1 = 100.0 + line * 30, 124.0 + line * 30
+        width = float(count * rng.uniform(12, 20))
+        dt_boxes.append(np.array([[80, y0], [80 + width, y0], [80 + width, y1], [80, y1]], dtype=np.float32))
+        text = "".join(chr(0x4e00 + int(rng.integers(0, 2000))) for _ in range(count))
+        # 中文按单字成词，列位置间隔 2
+        rec_res.append((text, float(rng.uniform(0.6, 1.0)),
+                        (count * 2 + 1, [[char] for char in text], [[idx * 2] for idx in range(count)],
+                         ["cn"] * count)))
+        line += 1
+    return dt_boxes, rec_res
+
+
+def measure(func, repeat: int):
+    """
+    耗时取 repeat 次的最小值，内存峰值单独跑一次统计（tracemalloc 会拖慢计时）
+    """
+    elapsed = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = func()
+        elapsed = min(elapsed, time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return output, elapsed, peak
+
+
+def page_json(dt_boxes, rec_res, char_format: str) -> str:
+    """
+    从识别输出到单页结果的 json，两种格式走相同的完整路径
+    """
+    page_result = build_ocr_page_result(build_text_result(dt_boxes, rec_res, char_format))
+    return json.dumps(page_result, ensure_ascii=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="char result format benchmark")
+    parser.add_argument("--chars", type=int, nargs="+", default=[1000, 3000, 5000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'chars':>6} {'format':>9} {'rec->json(ms)':>14} {'peak(KiB)':>10} {'size(KiB)':>10}")
+    for n_chars in args.chars:
+        dt_boxes, rec_res = make_rec_output(n_chars, seed=n_chars)
+        for char_format in ("dict", "columnar"):
+            output, elapsed, peak = measure(lambda: page_json(dt_boxes, rec_res, char_format), args.repeat)
+            print(f"{n_chars:>6} {char_format:>9} {elapsed * 1000:>14.3f} {peak / 1024:>10.1f} "
+                  f"{len(output.encode('utf-8')) / 1024:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
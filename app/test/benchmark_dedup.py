@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: benchmark_dedup
+Time: 2025/7/6 18:20
+"""
+import argparse
+import json
+import os
+import time
+from types import SimpleNamespace
+
+# 基准测试不使用精确结果缓存，只看页面分流的效果；需要在导入 app 模块之前设置
+os.environ.setdefault("RESULT_CACHE_BACKEND", "none")
+os.environ.setdefault("IMAGE_TRANSPORT", "base64")
+os.environ.setdefault("PAGE_DEDUP_BACKEND", "none")
+
+import cv2  # noqa: E402
+import numpy as np  # noqa: E402
+import pymupdf  # noqa: E402
+
+from app.common.utils import load_config  # noqa: E402
+from app.config.conf import PAGE_DEDUP_MAX_INK_DIFF  # noqa: E402
+from app.core.engine.dedup import BLANK_ONLY_SCOPE, MemoryPageIndex, PageDedup, page_dedup_scope  # noqa: E402
+from app.core.engine.transport import pack_image  # noqa: E402
+from app.core.layout.models.yolo import LayoutYOLOv10  # noqa: E402
+from app.tasks.layout_task import LayoutTask, TASK_NAME  # noqa: E402
+
+
+class BlockStub:
+    """
+    替身版面模型: 按行投影把相邻的文字行合并成版面块，结果只取决于页面上文字的位置，
+    复用近似重复页的结果时可以与当前页直接检测的结果比较
+    """
+    # 行间距超过该值(px)时分成不同的块，明细行、条款等行距较小的文字合并成一个块
+    GAP = 40
+
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, images, **kwargs):
+        images = images if isinstance(images, list) else [images]
+        self.calls += len(images)
+        return [self.detect(image) for image in images]
+
+    def detect(self, image: np.ndarray):
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        # 去掉面积很小的扫描污点
+        _, labels, stats, _ = cv2.connectedComponentsWithStats((gray < 128).astype(np.uint8), connectivity=8)
+        ink = (stats[:, cv2.CC_STAT_AREA] >= 12)[labels] & (labels > 0)
+        rows = np.flatnonzero(ink.sum(axis=1) >= 2)
+        boxes = []
+        if len(rows):
+            splits = np.flatnonzero(np.diff(rows) > self.GAP) + 1
+            for band in np.split(rows, splits):
+                y0, y1 = band[0], band[-1] + 1
+                cols = np.flatnonzero(ink[y0:y1].any(axis=0))
+                if len(cols):
+                    boxes.append([cols[0], y0, cols[-1] + 1, y1])
+        boxes = np.array(boxes, dtype=np.float64).reshape(-1, 4)
+        return SimpleNamespace(boxes=SimpleNamespace(
+            xyxy=boxes, cls=np.ones(len(boxes), dtype=np.float64), conf=np.full(len(boxes), 0.9),
+        ))
+
+
+def same_layout(result: dict, expected: dict, tolerance: float = 0.01) -> bool:
+    """
+    两个结果的版面块一一对应（按顺序），每个坐标相差不超过页面宽度的 tolerance 倍
+    """
+    a = np.array([det["poly"][:4] for det in result["layout_dets"]], dtype=np.float64).reshape(-1, 4)
+    b = np.array([det["poly"][:4] for det in expected["layout_dets"]], dtype=np.float64).reshape(-1, 4)
+    if a.shape != b.shape:
+        return False
+    return bool(np.all(np.abs(a - b) <= expected["page_info"]["width"] * tolerance))
+
+
+def render(draw, dpi: int) -> np.ndarray:
+    with pymupdf.open() as doc:
+        page = doc.new_page(width=595, height=842)
+        draw(page)
+        pix = page.get_pixmap(matrix=pymupdf.Matrix(dpi / 72, dpi / 72), alpha=False, colorspace=pymupdf.csGRAY)
+        return np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width).copy()
+
+
+def letterhead(page):
+    page.insert_text((60, 70), "ACME Logistics GmbH", fontsize=22)
+    page.insert_text((60, 95), "Hafenstrasse 12, 20457 Hamburg  |  www.acme-logistics.example", fontsize=9)
+    page.draw_line((60, 105), (535, 105))
+
+
+def terms(part: int):
+    def draw(page):
+        page.insert_text((60, 60), f"General Terms and Conditions ({part}/2)", fontsize=14)
+        for i in range(45):
+            page.insert_text((60, 90 + i * 16), f"{part}.{i + 1} The carrier shall not be liable for any loss "
+                                                f"or damage arising from clause {i} unless agreed.", fontsize=8)
+    return draw
+
+
+def invoice(doc_no: int, page_no: int):
+    def draw(page):
+        letterhead(page)
+        page.insert_text((60, 140), f"Invoice 2025-{doc_no:05d}  page {page_no + 1}", fontsize=12)
+        # 不同文档的明细行数不同，版面块的高度不同
+        for i in range(24 + doc_no % 5):
+            qty = (doc_no * 7 + page_no * 3 + i) % 40 + 1
+            page.insert_text((60, 170 + i * 20), f"Item {i + 1:02d}  pallet freight zone {i % 5}  qty {qty}  "
+                                                 f"amount {qty * 12.5:.2f} EUR", fontsize=10)
+    return draw
+
+
+def scan(gray: np.ndarray, rng, quality: int) -> bytes:
+    """
+    模拟扫描: 平移、亮度变化、噪点、污点和 JPEG 压缩
+    """
+    height, width = gray.shape
+    dx, dy = rng.integers(-8, 9, 2)
+    img = cv2.warpAffine(gray, np.float32([[1, 0, dx], [0, 1, dy]]), (width, height), borderValue=255)
+    img = img.astype(np.float32) * rng.uniform(0.9, 1.0) + rng.normal(0, 4, img.shape)
+    for _ in range(rng.integers(0, 30)):
+        y, x = rng.integers(0, height - 3), rng.integers(0, width - 3)
+        img[y:y + 2, x:x + 2] = 60
+    ok, buf = cv2.imencode(".jpg", np.clip(img, 0, 255).astype(np.uint8), [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buf.tobytes()
+
+
+def build_corpus(args):
+    """
+    :return: [(document id, 扫描后的页面, 内容编号或 None(空白页))]，
+        每份文档: 空白分隔页、公司信头封面、两页通用条款（所有文档相同）、若干页数字不同的发票明细
+    """
+    rng = np.random.default_rng(args.seed)
+    cache = {}
+
+    def page(key, draw):
+        if key not in cache:
+            cache[key] = (len(cache), render(draw, args.dpi))
+        return cache[key]
+
+    corpus = []
+    for doc_no in range(args.documents):
+        items = [(None, lambda p: None),
+                 ("letterhead", letterhead), ("terms1", terms(1)), ("terms2", terms(2))]
+        items += [(f"invoice{doc_no}_{page_no}", invoice(doc_no, page_no)) for page_no in range(args.invoice_pages)]
+        for key, draw in items:
+            label, gray = page(key or "blank", draw)
+            if args.rendered:
+                img_bytes = cv2.imencode(".png", gray)[1].tobytes()
+            else:
+                img_bytes = scan(gray, rng, int(rng.integers(60, 95)))
+            corpus.append((doc_no, img_bytes, None if key is None else label))
+    return corpus
+
+
+def run(mode: str, corpus: list, args) -> dict:
+    config = load_config(TASK_NAME)[TASK_NAME].model_config
+    stub = BlockStub()
+    task = LayoutTask(model=LayoutYOLOv10(config, model=stub))
+    task.dedup = None if mode == "off" else PageDedup(MemoryPageIndex(TASK_NAME, config), args.max_ink_diff)
+    triage_seconds = [0.0]
+    if task.dedup is not None:
+        triage = task.dedup.triage
+
+        def timed_triage(*triage_args):
+            triage_start = time.perf_counter()
+            try:
+                return triage(*triage_args)
+            finally:
+                triage_seconds[0] += time.perf_counter() - triage_start
+
+        task.dedup.triage = timed_triage
+    wrong, elapsed = 0, 0.0
+    start = time.perf_counter()
+    for doc_no, img_bytes, _ in corpus:
+        scope = {"off": None, "blank": BLANK_ONLY_SCOPE,
+                 "document": page_dedup_scope(doc_id=str(doc_no), mode="document"),
+                 "tenant": page_dedup_scope("bench", mode="tenant")}[mode]
+        result = task.predict_page_image(pack_image(img_bytes), scope)
+        elapsed += time.perf_counter() - start
+        # 与直接检测当前页的结果比较，不计入耗时
+        img, size = task.decode_for_model(img_bytes)
+        expected = task.restore_result(LayoutYOLOv10._format_result(stub.detect(img), img), img, size)
+        if not same_layout(result, expected):
+            wrong += 1
+        start = time.perf_counter()
+    report = {
+        "mode": mode,
+        "pages": len(corpus),
+        "model_calls": stub.calls,
+        "wrong_results": wrong,
+        "ms_per_page": round(elapsed / len(corpus) * 1000, 2),
+    }
+    if task.dedup is not None:
+        stats = task.dedup.stats()
+        report.update({key: stats[key] for key in ("blank", "duplicate", "skip_rate")})
+        report["skip_rate"] = round(report["skip_rate"], 3)
+        report["triage_ms_per_page"] = round(triage_seconds[0] / len(corpus) * 1000, 2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="blank and near-duplicate page triage on a synthetic scanned intake")
+    parser.add_argument("--documents", type=int, default=12)
+    parser.add_argument("--invoice-pages", type=int, default=3, help="每份文档中数字不同的发票页数")
+    parser.add_argument("--dpi", type=int, default=150)
+    parser.add_argument("--rendered", action="store_true", help="不模拟扫描，内容相同的页面逐像素一致（电子版 pdf 渲染）")
+    parser.add_argument("--modes", nargs="+", default=["off", "blank", "document", "tenant"])
+    parser.add_argument("--max-ink-diff", type=int, default=PAGE_DEDUP_MAX_INK_DIFF)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    corpus = build_corpus(args)
+    for mode in args.modes:
+        print(json.dumps(run(mode, corpus, args)))
+
+
+if __name__ == "__main__":
+    main()
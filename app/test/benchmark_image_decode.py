@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: benchmark_image_decode
+Time: 2025/6/28 11:05
+"""
+import argparse
+import base64
+import time
+from io import BytesIO
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from app.common.image import decode_image, decode_image_reduced
+from app.core.engine.transport import load_image_bytes
+
+
+def decode_legacy(img_base64: str):
+    """
+    原来的解码路径: base64 -> PIL -> RGB -> ndarray -> BGR
+    """
+    img = Image.open(BytesIO(base64.b64decode(img_base64)))
+    img = img.convert("RGB")
+    return cv2.cvtColor(np.asarray(img), cv2.COLOR_RGB2BGR)
+
+
+def make_scan(width: int, height: int, seed: int = 0):
+    """
+    模拟扫描页: 浅灰背景 + 噪声 + 文本行
+    """
+    rng = np.random.default_rng(seed)
+    img = np.full((height, width, 3), 235, dtype=np.uint8)
+    img += rng.integers(0, 12, size=(height, width, 1), dtype=np.uint8)
+    for y in range(150, height - 150, 60):
+        cv2.putText(img, "The quick brown fox jumps over the lazy dog 0123456789", (120, y),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1.2, (30, 30, 30), 2)
+    return img
+
+
+def encode(img, fmt: str, mode: str) -> bytes:
+    pil = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+    if mode == "L":
+        pil = pil.convert("L")
+    elif mode == "CMYK":
+        pil = pil.convert("CMYK")
+    elif mode == "RGBA":
+        pil = pil.convert("RGBA")
+    buf = BytesIO()
+    pil.save(buf, format=fmt, quality=90) if fmt == "JPEG" else pil.save(buf, format=fmt)
+    return buf.getvalue()
+
+
+def best_ms(func, repeat: int):
+    best = float("inf")
+    output = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, output
+
+
+def main():
+    parser = argparse.ArgumentParser(description="image decode benchmark")
+    parser.add_argument("--width", type=int, default=2480, help="默认为 300 DPI A4")
+    parser.add_argument("--height", type=int, default=3508)
+    parser.add_argument("--img-size", type=int, default=1024, help="版面模型输入尺寸")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    scan = make_scan(args.width, args.height)
+    cases = [("JPEG", "RGB"), ("JPEG", "L"), ("JPEG", "CMYK"), ("PNG", "RGB"), ("PNG", "L"), ("PNG", "RGBA")]
+    print(f"{'format':>10} {'legacy(ms)':>11} {'imdecode(ms)':>13} {'reduced(ms)':>12} {'reduced shape':>16} {'max diff':>9}")
+    for fmt, mode in cases:
+        img_base64 = base64.b64encode(encode(scan, fmt, mode)).decode()
+        legacy_ms, legacy = best_ms(lambda: decode_legacy(img_base64), args.repeat)
+        new_ms, new = best_ms(lambda: decode_image(load_image_bytes(img_base64)), args.repeat)
+        reduced_ms, (reduced, _) = best_ms(
+            lambda: decode_image_reduced(load_image_bytes(img_base64), args.img_size), args.repeat
+        )
+        max_diff = int(np.abs(legacy.astype(np.int16) - new.astype(np.int16)).max())
+        print(
+            f"{fmt + '/' + mode:>10} {legacy_ms:>11.1f} {new_ms:>13.1f} {reduced_ms:>12.1f} "
+            f"{str(reduced.shape[:2]):>16} {max_diff:>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: benchmark_micro_batch
+Time: 2025/6/27 17:30
+"""
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from celery import Celery
+from celery.result import ResultSet
+from celery.contrib.testing.worker import start_worker
+
+from app.core.engine.batching import MicroBatcher
+from app.tasks.base_task import BaseTask
+
+
+class StubModel:
+    """
+    模拟推理耗时: 每次调用固定开销 + 每张图片的边际开销，批量推理摊薄固定开销。
+    同一个模型实例同时只能执行一次推理（与 paddle predictor / 单个设备一致）
+    """
+
+    def __init__(self, call_ms: float, item_ms: float):
+        self.call_ms = call_ms
+        self.item_ms = item_ms
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def predict(self, image):
+        return self.predict_batch([image])[0]
+
+    def predict_batch(self, images: list):
+        with self._lock:
+            self.calls += 1
+            time.sleep((self.call_ms + self.item_ms * len(images)) / 1000)
+        return [{"page_info": {"height": image.shape[0], "width": image.shape[1]}} for image in images]
+
+
+def run_threads(stub_task, pages: int, concurrency: int):
+    """
+    直接用线程池模拟 celery threads 池中并发执行的任务
+    """
+    def page_task(page: int):
+        image = np.zeros((64, 48, 3), dtype=np.uint8)
+        return stub_task.run_model([image])[0]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(page_task, range(pages)))
+    elapsed = time.perf_counter() - start
+    assert all(result == {"page_info": {"height": 64, "width": 48}} for result in results)
+    return elapsed
+
+
+def run_celery(stub_task, pages: int, concurrency: int, queue: str):
+    """
+    内存 broker + threads 池的真实 celery worker
+    """
+    app = Celery("micro_batch_benchmark", broker="memory://", backend="cache+memory://")
+    app.conf.task_default_queue = queue
+    # 内存 broker 的 worker 使用同步事件循环，预取数达到上限后 drain_events 阻塞到 2s 超时才继续取消息，
+    # 每取完一轮预取就停顿 2s，吞吐由停顿决定而不是推理；不限制预取，任务在 threads 池中排队
+    app.conf.worker_prefetch_multiplier = 0
+    # 内存 broker 默认 1s 轮询一次，会掩盖推理耗时
+    app.conf.broker_transport_options = {"polling_interval": 0.005}
+
+    @app.task(name="stub_page_task", shared=False)
+    def stub_page_task(image_id: str, height: int, width: int):
+        image = np.zeros((height, width, 3), dtype=np.uint8)
+        return {image_id: stub_task.run_model([image])[0]}
+
+    with start_worker(app, pool="threads", concurrency=concurrency, perform_ping_check=False, loglevel="WARNING"):
+        # 只统计投递到取回结果的时间，不含 worker 的启动和关闭
+        start = time.perf_counter()
+        async_results = ResultSet([stub_page_task.delay(str(page), 64, 48) for page in range(pages)])
+        # 一次等待全部结果，不按投递顺序逐个轮询
+        results = async_results.join(timeout=600, interval=0.005)
+        elapsed = time.perf_counter() - start
+        for page, result in enumerate(results):
+            assert result == {str(page): {"page_info": {"height": 64, "width": 48}}}
+    return elapsed
+
+
+def run(mode: str, pages: int, concurrency: int, max_batch_size: int, max_wait_ms: float,
+        call_ms: float, item_ms: float):
+    model = StubModel(call_ms, item_ms)
+    batcher = MicroBatcher(model.predict_batch, max_batch_size, max_wait_ms, name="stub") \
+        if max_batch_size > 1 else None
+    stub_task = BaseTask(model, batcher=batcher)
+
+    if mode == "celery":
+        elapsed = run_celery(stub_task, pages, concurrency, queue=f"micro_batch_{max_batch_size}")
+    else:
+        elapsed = run_threads(stub_task, pages, concurrency)
+
+    report = {
+        "mode": mode,
+        "max_batch_size": max_batch_size,
+        "pages": pages,
+        "seconds": round(elapsed, 3),
+        "pages_per_second": round(pages / elapsed, 1),
+        "model_calls": model.calls,
+    }
+    if batcher is not None:
+        report["batch"] = batcher.stats()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="micro batching benchmark (memory broker, stub model)")
+    parser.add_argument("--mode", choices=["threads", "celery"], default="threads")
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--max-batch-size", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--max-wait-ms", type=float, default=20)
+    parser.add_argument("--call-ms", type=float, default=30, help="每次模型调用的固定耗时")
+    parser.add_argument("--item-ms", type=float, default=5, help="每张图片的边际耗时")
+    args = parser.parse_args()
+
+    for max_batch_size in args.max_batch_size:
+        report = run(args.mode, args.pages, args.concurrency, max_batch_size, args.max_wait_ms, args.call_ms, args.item_ms)
+        print(json.dumps(report, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
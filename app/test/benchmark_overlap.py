@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: benchmark_overlap
+Time: 2025/6/17 10:12
+"""
+import argparse
+import copy
+import time
+
+import numpy as np
+
+from app.common.utils import (
+    calculate_area_overlap,
+    get_bbox_from_points,
+    remove_small_blocks_from_overlaps,
+)
+
+
+def remove_small_blocks_from_overlaps_loop(result, overlap_ratio_threshold=0.8):
+    """
+    原来的逐对比较实现，作为基准和结果校验使用
+    """
+    blocks = result["layout_dets"]
+    blocks_to_remove = []
+    for i in range(len(blocks)):
+        for j in range(i + 1, len(blocks)):
+            bbox1 = get_bbox_from_points(blocks[i]["poly"])
+            bbox2 = get_bbox_from_points(blocks[j]["poly"])
+            if calculate_area_overlap(bbox1, bbox2, overlap_ratio_threshold):
+                height1 = max(bbox1[3], bbox1[1]) - min(bbox1[3], bbox1[1])
+                height2 = max(bbox2[3], bbox2[1]) - min(bbox2[3], bbox2[1])
+                if height1 < height2:
+                    blocks_to_remove.append(i)
+                else:
+                    blocks_to_remove.append(j)
+    blocks_to_remove = set(blocks_to_remove)
+    result["layout_dets"] = [block for idx, block in enumerate(blocks) if idx not in blocks_to_remove]
+    return result
+
+
+def make_page(n, seed=0, width=1654, height=2339):
+    """
+    生成一个包含 n 个块的模拟页面，其中约 1/5 的块是对已有块的轻微抖动（模拟重复检测）
+    """
+    rng = np.random.default_rng(seed)
+    blocks = []
+    for _ in range(n):
+        if blocks and rng.random() < 0.2:
+            base = blocks[rng.integers(len(blocks))]["poly"]
+            jitter = rng.normal(0, 4, size=4)
+            poly = [float(v) for v in np.asarray(base) + jitter]
+        else:
+            w = float(rng.uniform(30, width / 2))
+            h = float(rng.uniform(12, 120))
+            x = float(rng.uniform(0, width - w))
+            y = float(rng.uniform(0, height - h))
+            poly = [x, y, x + w, y + h]
+        blocks.append({"poly": poly, "category_id": int(rng.integers(10)), "score": float(rng.random())})
+    return {"layout_dets": blocks, "page_info": {"height": height, "width": width}}
+
+
+def timeit(func, page, repeat):
+    best = float("inf")
+    output = None
+    for _ in range(repeat):
+        data = copy.deepcopy(page)
+        start = time.perf_counter()
+        output = func(data)
+        best = min(best, time.perf_counter() - start)
+    return best, output
+
+
+def main():
+    parser = argparse.ArgumentParser(description="overlap suppression benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 100, 200, 400, 800, 1600])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip-loop-above", type=int, default=1600, help="块数超过该值时不再运行原始实现")
+    args = parser.parse_args()
+
+    print(f"{'n':>6} {'loop(ms)':>12} {'vectorized(ms)':>16} {'speedup':>9} {'removed':>8}")
+    for n in args.sizes:
+        page = make_page(n, seed=n)
+        vec_time, vec_result = timeit(remove_small_blocks_from_overlaps, page, args.repeat)
+        removed = n - len(vec_result["layout_dets"])
+        if n > args.skip_loop_above:
+            print(f"{n:>6} {'-':>12} {vec_time * 1000:>16.3f} {'-':>9} {removed:>8}")
+            continue
+        loop_time, loop_result = timeit(remove_small_blocks_from_overlaps_loop, page, 1)
+        assert loop_result["layout_dets"] == vec_result["layout_dets"], f"结果不一致: n={n}"
+        print(
+            f"{n:>6} {loop_time * 1000:>12.3f} {vec_time * 1000:>16.3f} "
+            f"{loop_time / vec_time:>8.1f}x {removed:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: benchmark_pipeline
+Time: 2025/7/1 10:10
+"""
+import argparse
+import base64
+import importlib.util
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+# 基准测试不使用结果缓存，开启阶段计时；需要在导入 app 模块之前设置
+os.environ.setdefault("RESULT_CACHE_BACKEND", "none")
+os.environ.setdefault("IMAGE_TRANSPORT", "base64")
+os.environ["METRICS_ENABLED"] = "true"
+
+import cv2  # noqa: E402
+import numpy as np  # noqa: E402
+
+from app.common.utils import load_config  # noqa: E402
+from app.core.engine.celery_task import celery_app  # noqa: E402
+from app.core.engine.registry import LAYOUT_MODEL, OCR_MODEL, registry  # noqa: E402
+
+APP_DIR = Path(__file__).resolve().parent.parent
+
+# 每页的版面块数、文本行数、每行字符数
+DENSITIES = {
+    "sparse": {"blocks": 12, "lines": 20, "chars_per_line": 30},
+    "normal": {"blocks": 40, "lines": 60, "chars_per_line": 50},
+    "dense": {"blocks": 120, "lines": 150, "chars_per_line": 80},
+    "extreme": {"blocks": 400, "lines": 300, "chars_per_line": 120},
+}
+
+WORDS = ("the", "layout", "of", "page", "extract", "text", "table", "formula", "model", "数据", "文档", "识别")
+
+
+class StubYOLOv10:
+    """
+    替身版面模型: 按页面尺寸生成确定的双栏版面（标题、段落、图表及其标题、页眉页脚），
+    其中约 15% 的块是轻微抖动的重复检测，用于覆盖重叠块删除
+    """
+
+    def __init__(self, blocks: int, latency_ms: float = 0):
+        self.blocks = blocks
+        self.latency_ms = latency_ms
+
+    def predict(self, images, **kwargs):
+        images = images if isinstance(images, list) else [images]
+        if self.latency_ms:
+            time.sleep(self.latency_ms * len(images) / 1000)
+        return [self._result(image) for image in images]
+
+    def _result(self, image):
+        height, width = image.shape[:2]
+        rng = np.random.default_rng(height * 31 + width)
+        boxes, classes = [[width * 0.1, height * 0.01, width * 0.5, height * 0.03]], [2]
+        boxes.append([width * 0.1, height * 0.05, width * 0.9, height * 0.08])
+        classes.append(0)
+        body = max(self.blocks - 3, 1)
+        per_column = (body + 1) // 2
+        step = height * 0.85 / per_column
+        for i in range(body):
+            column, row = divmod(i, per_column)
+            x1 = width * (0.1 + column * 0.42)
+            y1 = height * 0.1 + row * step
+            category = 1
+            if row % 9 == 4:
+                category = 3 if column == 0 else 5
+            elif row % 9 == 5:
+                category = 4 if column == 0 else 6
+            boxes.append([x1, y1, x1 + width * 0.38, y1 + step * 0.8])
+            classes.append(category)
+        boxes.append([width * 0.45, height * 0.97, width * 0.55, height * 0.99])
+        classes.append(2)
+
+        boxes = np.asarray(boxes, dtype=np.float64)
+        classes = np.asarray(classes, dtype=np.float64)
+        duplicates = rng.random(len(boxes)) < 0.15
+        boxes = np.concatenate([boxes, boxes[duplicates] + rng.normal(0, 2, (int(duplicates.sum()), 4))])
+        classes = np.concatenate([classes, classes[duplicates]])
+        scores = rng.uniform(0.3, 0.99, len(boxes))
+        return SimpleNamespace(boxes=SimpleNamespace(xyxy=boxes, cls=classes, conf=scores))
+
+
+class StubTextDetector:
+    def __init__(self, lines: int, chars_per_line: int, latency_ms: float = 0):
+        self.lines = lines
+        self.chars_per_line = chars_per_line
+        self.latency_ms = latency_ms
+
+    def __call__(self, image):
+        start = time.perf_counter()
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        height, width = image.shape[:2]
+        line_height = height / (self.lines + 1)
+        line_width = min(width * 0.8, self.chars_per_line * line_height * 0.6)
+        dt_boxes = []
+        for i in range(self.lines):
+            y1 = (i + 0.5) * line_height
+            y2 = y1 + line_height * 0.7
+            x1 = width * 0.1
+            dt_boxes.append(np.array([[x1, y1], [x1 + line_width, y1], [x1 + line_width, y2], [x1, y2]],
+                                     dtype=np.float32))
+        return np.array(dt_boxes), time.perf_counter() - start
+
+
+class StubTextRecognizer:
+    def __init__(self, chars_per_line: int, latency_ms: float = 0):
+        self.chars_per_line = chars_per_line
+        self.latency_ms = latency_ms
+
+    def __call__(self, img_crop_list):
+        start = time.perf_counter()
+        if self.latency_ms:
+            time.sleep(self.latency_ms * len(img_crop_list) / 1000)
+        return [self.recognize(i) for i in range(len(img_crop_list))], time.perf_counter() - start
+
+    def recognize(self, seed: int):
+        """
+        return_word_box 格式: (text, score, (col_num, word_list, word_col_list, state_list))
+        """
+        word_list, word_col_list, state_list = [], [], []
+        col, text = 0, ""
+        while len(text) < self.chars_per_line:
+            word = WORDS[(seed + len(word_list)) % len(WORDS)]
+            word_list.append(list(word))
+            word_col_list.append([col + 2 * i for i in range(len(word))])
+            state_list.append("cn" if word[0] > "~" else "en")
+            col += 2 * len(word) + 1
+            text += word
+        return text, 0.95, (col, word_list, word_col_list, state_list)
+
+
+class StubTextSystem:
+    """
+    替身 TextSystem，接口与 paddleocr.tools.infer.predict_system.TextSystem 一致
+    """
+
+    def __init__(self, lines: int, chars_per_line: int, latency_ms: float = 0):
+        self.text_detector = StubTextDetector(lines, chars_per_line, latency_ms / 2)
+        self.text_recognizer = StubTextRecognizer(chars_per_line, latency_ms / 2 / max(lines, 1))
+        self.text_classifier = None
+        self.use_angle_cls = False
+        self.drop_score = 0.5
+        self.args = SimpleNamespace(det_box_type="quad")
+
+    def __call__(self, img, cls=True):
+        start = time.perf_counter()
+        dt_boxes, det_elapse = self.text_detector(img)
+        rec_res, rec_elapse = self.text_recognizer([None] * len(dt_boxes))
+        time_dict = {"det": det_elapse, "rec": rec_elapse, "cls": 0, "all": time.perf_counter() - start}
+        return list(dt_boxes), rec_res, time_dict
+
+
+def load_pipeline():
+    """
+    app/tasks.py 与 app/tasks/ 包同名，import app.tasks 得到的是包，这里按文件路径加载任务模块
+    """
+    spec = importlib.util.spec_from_file_location("app_tasks_pipeline", APP_DIR / "tasks.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def install_stub_models(density: dict, layout_ms: float, ocr_ms: float, char_format: str):
+    from app.core.layout.models.yolo import LayoutYOLOv10
+    from app.core.ocr.models.text_ocr import TextOcr
+    from app.tasks.layout_task import LayoutTask, TASK_NAME as LAYOUT_TASK_NAME
+    from app.tasks.ocr_task import OcrTask, TASK_NAME as OCR_TASK_NAME
+
+    layout_config = load_config(LAYOUT_TASK_NAME)[LAYOUT_TASK_NAME].model_config
+    layout_model = LayoutYOLOv10(layout_config, model=StubYOLOv10(density["blocks"], layout_ms))
+    registry.register(LAYOUT_MODEL, LayoutTask(model=layout_model))
+
+    ocr_config = load_config(OCR_TASK_NAME)[OCR_TASK_NAME].model_config
+    text_ocr = TextOcr(ocr_config, text_system=StubTextSystem(density["lines"], density["chars_per_line"], ocr_ms))
+    text_ocr.char_format = char_format
+    registry.register(OCR_MODEL, OcrTask(model=text_ocr))
+
+
+def make_page(width: int, height: int, seed: int, image_format: str) -> str:
+    rng = np.random.default_rng(seed)
+    img = np.full((height, width, 3), 240, dtype=np.uint8)
+    img += rng.integers(0, 10, size=(height, width, 1), dtype=np.uint8)
+    for y in range(120, height - 120, 48):
+        cv2.putText(img, f"page {seed} line {y} lorem ipsum dolor sit amet", (100, y),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1.0, (20, 20, 20), 2)
+    ok, buf = cv2.imencode(f".{image_format}", img)
+    return base64.b64encode(buf.tobytes()).decode()
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {}
+    values = np.asarray(values, dtype=np.float64)
+    return {
+        "p50": round(float(np.percentile(values, 50)), 3),
+        "p99": round(float(np.percentile(values, 99)), 3),
+        "mean": round(float(values.mean()), 3),
+    }
+
+
+def run_pages(pipeline, pages: list, mode: str):
+    """
+    :return: [(page_id, 版面结果, ocr 结果, 端到端耗时 ms)]
+    """
+    outputs = []
+    if mode == "eager":
+        for page_id, img_base64 in pages:
+            start = time.perf_counter()
+            layout = pipeline.default_layout_task.delay(page_id, img_base64).get()
+            ocr = pipeline.default_ocr_parse_task.delay(page_id, img_base64).get()
+            outputs.append((page_id, layout[page_id], ocr[page_id], (time.perf_counter() - start) * 1000))
+        return outputs
+
+    submitted = {}
+    for page_id, img_base64 in pages:
+        submitted[page_id] = (
+            time.perf_counter(),
+            pipeline.default_layout_task.delay(page_id, img_base64),
+            pipeline.default_ocr_parse_task.delay(page_id, img_base64),
+        )
+    while submitted:
+        for page_id, (start, layout, ocr) in list(submitted.items()):
+            if layout.ready() and ocr.ready():
+                elapsed = (time.perf_counter() - start) * 1000
+                outputs.append((page_id, layout.get()[page_id], ocr.get()[page_id], elapsed))
+                del submitted[page_id]
+        time.sleep(0.001)
+    return outputs
+
+
+def summarize(name: str, outputs: list, seconds: float) -> dict:
+    stages = {}
+    for _, layout, ocr, _ in outputs:
+        for stage_name, value in list(layout.get("timings", {}).items()) + list(ocr.get("timings", {}).items()):
+            stages.setdefault(stage_name, []).append(value)
+        # celery 结果序列化（json）的耗时
+        start = time.perf_counter()
+        json.dumps({"layout": layout, "ocr": ocr}, ensure_ascii=False)
+        stages.setdefault("result_json", []).append((time.perf_counter() - start) * 1000)
+    return {
+        "density": name,
+        "pages": len(outputs),
+        "pages_per_second": round(len(outputs) / seconds, 2),
+        "latency_ms": percentiles([output[3] for output in outputs]),
+        "stages_ms": {stage: percentiles(values) for stage, values in sorted(stages.items())},
+        "blocks_per_page": percentiles([len(output[1]["layout_dets"]) for output in outputs])["mean"],
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="end-to-end pipeline benchmark with stub models")
+    parser.add_argument("--mode", choices=["eager", "memory"], default="eager",
+                        help="eager: 任务在当前进程同步执行; memory: 内存 broker + threads 池 worker")
+    parser.add_argument("--concurrency", type=int, default=4, help="memory 模式下 worker 的线程数")
+    parser.add_argument("--densities", nargs="+", choices=list(DENSITIES), default=["sparse", "normal", "dense"])
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--width", type=int, default=1654, help="默认为 200 DPI A4")
+    parser.add_argument("--height", type=int, default=2339)
+    parser.add_argument("--image-format", choices=["png", "jpg"], default="jpg")
+    parser.add_argument("--char-format", choices=["dict", "columnar"], default="dict")
+    parser.add_argument("--layout-ms", type=float, default=0, help="替身版面模型每页的模拟推理耗时")
+    parser.add_argument("--ocr-ms", type=float, default=0, help="替身 OCR 模型每页的模拟推理耗时")
+    parser.add_argument("--output", help="结果 json 写入的文件，默认只打印")
+    args = parser.parse_args()
+
+    pipeline = load_pipeline()
+    if args.mode == "eager":
+        celery_app.conf.update(task_always_eager=True, task_eager_propagates=True)
+    else:
+        celery_app.conf.update(
+            broker_url="memory://",
+            result_backend="cache+memory://",
+            broker_transport_options={"polling_interval": 0.005},
+            worker_prefetch_multiplier=4,
+        )
+
+    pages = [(f"page_{i}", make_page(args.width, args.height, i, args.image_format)) for i in range(args.pages)]
+    report = {
+        "commit": git_commit(),
+        "mode": args.mode,
+        "python": sys.version.split()[0],
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": [],
+    }
+    for name in args.densities:
+        install_stub_models(DENSITIES[name], args.layout_ms, args.ocr_ms, args.char_format)
+        start = time.perf_counter()
+        if args.mode == "eager":
+            outputs = run_pages(pipeline, pages, args.mode)
+        else:
+            from celery.contrib.testing.worker import start_worker
+            with start_worker(celery_app, pool="threads", concurrency=args.concurrency,
+                              perform_ping_check=False, loglevel="WARNING"):
+                outputs = run_pages(pipeline, pages, args.mode)
+        report["results"].append(summarize(name, outputs, time.perf_counter() - start))
+
+    report["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    content = json.dumps(report, ensure_ascii=False, indent=2)
+    print(content)
+    if args.output:
+        Path(args.output).write_text(content, encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
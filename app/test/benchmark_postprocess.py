@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: benchmark_postprocess
+Time: 2025/7/7 15:40
+"""
+import argparse
+import copy
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from app.common.utils import remove_small_blocks_from_overlaps
+from app.core.engine.pipeline import build_ocr_page_result
+from app.core.engine.postprocess import LayoutPostprocess, OcrPostprocess, process_shard
+from app.core.engine.raw_outputs import (
+    RAW_LAYOUT,
+    RawOutputWriter,
+    decode_record,
+    encode_record,
+    iter_records,
+    layout_record,
+    list_shards,
+    ocr_record,
+    raw_lines,
+)
+from app.core.layout.models.yolo import LAYOUT_CATEGORIES
+from app.core.layout.reading_order import sort_layout_dets
+from app.core.ocr.chars import build_text_result
+
+
+def make_layout_output(rng, width=1654, height=2339) -> dict:
+    """
+    模拟 raw_conf_thres=0.05 时的模型输出: 版面块、重复检测和大量低置信度的框
+    """
+    dets = []
+    for _ in range(int(rng.integers(20, 120))):
+        if dets and rng.random() < 0.2:
+            base = np.asarray(dets[int(rng.integers(len(dets)))]["poly"])
+            poly = (base + rng.normal(0, 4, size=4)).tolist()
+        else:
+            w, h = rng.uniform(30, width / 2), rng.uniform(12, 160)
+            x, y = rng.uniform(0, width - w), rng.uniform(0, height - h)
+            poly = [x, y, x + w, y + h]
+        score = float(np.float32(rng.uniform(0.05, 1.0)))
+        dets.append({"poly": poly, "category_id": float(rng.integers(0, 10)), "score": score})
+    return {"layout_dets": dets, "page_info": {"height": height, "width": width}}
+
+
+def previous_postprocess(layout_results: dict, conf_thres: float) -> dict:
+    """
+    原来的页面任务后处理（模型按 conf_thres 过滤后删除重叠块、按阅读顺序排序），用于校验结果一致
+    """
+    result = copy.deepcopy(layout_results)
+    result["layout_dets"] = [det for det in result["layout_dets"] if det["score"] > conf_thres]
+    result = remove_small_blocks_from_overlaps(result)
+    result["layout_dets"] = sort_layout_dets(result["layout_dets"], "reading_order", LAYOUT_CATEGORIES,
+                                             result["page_info"]["height"])
+    return result
+
+
+def make_ocr_lines(rng):
+    """
+    模拟 PaddleOCR 的检测框和识别结果（文本, 分数, (列数, 词, 词的列位置, 词类型)）
+    """
+    dt_boxes, rec_res = [], []
+    for i in range(int(rng.integers(5, 40))):
+        x, y = float(rng.uniform(0, 1200)), float(40 + i * 36)
+        width = float(rng.uniform(80, 400))
+        dt_boxes.append(np.array([[x, y], [x + width, y], [x + width, y + 24], [x, y + 24]], dtype=np.float32))
+        words = ["".join(rng.choice(list("abcdef0123"), int(rng.integers(1, 6)))) for _ in range(rng.integers(1, 5))]
+        cols, col = [], 0
+        for word in words:
+            cols.append(list(range(col, col + len(word))))
+            col += len(word) + 1
+        rec_res.append((" ".join(words), float(rng.uniform(0.2, 1.0)),
+                        (col + 2, [list(word) for word in words], cols, ["en&num"] * len(words))))
+    return dt_boxes, rec_res
+
+
+def check_layout(args) -> dict:
+    rng = np.random.default_rng(args.seed)
+    postprocess = LayoutPostprocess(LAYOUT_CATEGORIES)
+    mismatches = 0
+    for _ in range(args.check_pages):
+        output = make_layout_output(rng)
+        live = postprocess(output)
+        header, arrays = decode_record(encode_record(*layout_record("page", output)))
+        offline = postprocess.from_raw(header, arrays)
+        if not (live == offline == previous_postprocess(output, postprocess.conf_thres)):
+            mismatches += 1
+    return {"check": "layout", "pages": args.check_pages, "mismatches": mismatches}
+
+
+def check_ocr(args) -> dict:
+    rng = np.random.default_rng(args.seed)
+    mismatches = 0
+    for char_format in ("dict", "columnar"):
+        postprocess = OcrPostprocess(drop_score=0.5, char_format=char_format)
+        for _ in range(args.check_pages):
+            dt_boxes, rec_res = make_ocr_lines(rng)
+            keep = [idx for idx, rec_result in enumerate(rec_res) if rec_result[1] >= 0.5]
+            live = build_ocr_page_result(
+                build_text_result([dt_boxes[idx] for idx in keep], [rec_res[idx] for idx in keep], char_format)
+            )
+            # 原始文本行随结果经过 json（缓存和 celery 结果）后再保存
+            raw = json.loads(json.dumps(raw_lines(dt_boxes, rec_res)))
+            offline = postprocess.from_raw(*decode_record(encode_record(*ocr_record("page", raw))))
+            if json.dumps(live) != json.dumps(offline):
+                mismatches += 1
+    return {"check": "ocr", "pages": args.check_pages * 2, "mismatches": mismatches}
+
+
+def run_layout(args, root: str) -> list:
+    rng = np.random.default_rng(args.seed + 1)
+    writer = RawOutputWriter(root, shard_bytes=args.shard_mb * 1024 * 1024)
+    start = time.perf_counter()
+    for page_no in range(args.pages):
+        writer.save_layout(f"doc{page_no // 50}_{page_no % 50}", make_layout_output(rng))
+    writer.close()
+    write_seconds = time.perf_counter() - start
+    shards = list_shards(root, RAW_LAYOUT)
+    stored = sum(os.path.getsize(shard) for shard in shards)
+
+    reports = []
+    for conf_thres in args.conf_thres:
+        output_dir = os.path.join(root, f"out_{conf_thres}")
+        os.makedirs(output_dir)
+        params = {"conf_thres": conf_thres, "overlap_ratio_threshold": 0.8, "sort_by": "reading_order"}
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            count = len(shards)
+            results = list(executor.map(process_shard, [RAW_LAYOUT] * count, [params] * count, shards,
+                                        [output_dir] * count))
+        elapsed = time.perf_counter() - start
+        pages = sum(result["pages"] for result in results)
+        reports.append({
+            "conf_thres": conf_thres,
+            "pages": pages,
+            "shards": len(shards),
+            "bytes_per_page": round(stored / pages),
+            "write_ms_per_page": round(write_seconds / pages * 1000, 3),
+            "pages_per_second": round(pages / elapsed),
+        })
+    assert sum(1 for shard in shards for _ in iter_records(shard)) == args.pages
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="offline re-post-processing from stored raw outputs")
+    parser.add_argument("--pages", type=int, default=20000)
+    parser.add_argument("--check-pages", type=int, default=300)
+    parser.add_argument("--conf-thres", type=float, nargs="+", default=[0.25, 0.4])
+    parser.add_argument("--shard-mb", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(json.dumps(check_layout(args)))
+    print(json.dumps(check_ocr(args)))
+    with tempfile.TemporaryDirectory() as root:
+        for report in run_layout(args, root):
+            print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: benchmark_reading_order
+Time: 2025/6/26 15:20
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.core.layout.reading_order import reading_order
+
+
+def make_page(n, columns=2, seed=0, width=1654, height=2339):
+    """
+    生成一个 n 个块的多栏页面，顶部一个页眉、底部一个页脚，返回的块已按真实阅读顺序排列
+    """
+    rng = np.random.default_rng(seed)
+    margin, gutter = 100, 40
+    column_width = (width - 2 * margin - (columns - 1) * gutter) / columns
+    per_column = max((n - 2) // columns, 1)
+    bboxes = [[margin, 20, width / 2, 60]]
+    categories = ["abandon"]
+    for col in range(columns):
+        x1 = margin + col * (column_width + gutter)
+        y = 100.0
+        step = (height - 300) / per_column
+        for _ in range(per_column):
+            h = float(rng.uniform(0.4, 0.9) * step)
+            bboxes.append([x1, y, x1 + column_width, y + h])
+            categories.append("plain text")
+            y += step
+    bboxes.append([width / 2 - 50, height - 60, width / 2 + 50, height - 30])
+    categories.append("abandon")
+    return np.asarray(bboxes), categories
+
+
+def main():
+    parser = argparse.ArgumentParser(description="reading order benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20, 50, 100, 200, 500, 1000])
+    parser.add_argument("--columns", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'n':>6} {'y_then_x(ms)':>14} {'reading_order(ms)':>18} {'correct':>8}")
+    for n in args.sizes:
+        bboxes, categories = make_page(n, args.columns, seed=n)
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            sorted(range(len(bboxes)), key=lambda idx: (bboxes[idx, 1], bboxes[idx, 0]))
+        naive_time = (time.perf_counter() - start) / args.repeat
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            order = reading_order(bboxes, categories, page_height=2339)
+        order_time = (time.perf_counter() - start) / args.repeat
+        correct = order == list(range(len(bboxes)))
+        print(f"{len(bboxes):>6} {naive_time * 1000:>14.3f} {order_time * 1000:>18.3f} {str(correct):>8}")
+
+
+if __name__ == "__main__":
+    main()
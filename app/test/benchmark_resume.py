@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: benchmark_resume
+Time: 2025/7/6 14:30
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+
+os.environ.setdefault("IMAGE_TRANSPORT", "base64")
+# 测试 pdf 写在系统临时目录下
+os.environ.setdefault("PDF_UPLOAD_DIR", tempfile.gettempdir())
+
+import pymupdf  # noqa: E402
+from celery.contrib.testing.worker import start_worker  # noqa: E402
+from celery.result import AsyncResult  # noqa: E402
+
+from app.core.engine.celery_task import celery_app  # noqa: E402
+from app.core.engine.checkpoint import MemoryCheckpointStore  # noqa: E402
+from app.core.engine.scheduling import NullFairShare  # noqa: E402
+from app.core.pdf.document_job import DocumentJob  # noqa: E402
+
+STUB_PAGE_TASK = "stub_page_task"
+FLAKY_PAGES = {3: 1, 17: 2, 30: 1}  # 页码: 前几次执行失败
+BROKEN_PAGE = 25  # 第二次运行时一直失败，第三次运行前修复
+
+
+class FlakyModel:
+    """
+    替身页面模型: 记录每页的执行次数，flaky 中的页面前几次执行抛出异常，broken 中的页面一直失败
+    """
+
+    def __init__(self, latency_ms: float, flaky: dict, broken: set):
+        self.latency_ms = latency_ms
+        self.flaky = flaky
+        self.broken = broken
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def predict(self, page_no: int) -> dict:
+        with self._lock:
+            self.calls[page_no] += 1
+            calls = self.calls[page_no]
+        time.sleep(self.latency_ms / 1000)
+        if page_no in self.broken or calls <= self.flaky.get(page_no, 0):
+            raise RuntimeError(f"stub model failed on page {page_no} (call {calls})")
+        return {"page_no": page_no, "text": f"page {page_no}"}
+
+
+MODEL = FlakyModel(0, {}, set())
+
+
+@celery_app.task(name=STUB_PAGE_TASK, ignore_result=False)
+def stub_page_task(image_id: str, img_base64: str, dedup_scope: str = None):
+    return {image_id: MODEL.predict(int(image_id.rsplit("_", 1)[1]))}
+
+
+class CrashingCheckpoints(MemoryCheckpointStore):
+    """
+    保存 crash_after 页后抛出异常，模拟投递进程在任务中途退出（其他页面仍在队列中执行）
+    """
+
+    def __init__(self, crash_after: int = None):
+        super().__init__()
+        self.crash_after = crash_after
+
+    def save_page(self, job_id: str, page_no: int, result: dict):
+        super().save_page(job_id, page_no, result)
+        if self.crash_after is not None and len(self.done_pages(job_id)) >= self.crash_after:
+            self.crash_after = None
+            raise SystemError("dispatcher crashed")
+
+
+def make_pdf(pages: int) -> str:
+    path = os.path.join(tempfile.mkdtemp(prefix="resume_"), "document.pdf")
+    with pymupdf.open() as doc:
+        for page_no in range(pages):
+            doc.new_page(width=200, height=280).insert_text((20, 40), f"page {page_no}")
+        doc.save(path)
+    return path
+
+
+def run_job(job_id: str, pdf_path: str, checkpoints, dispatched: list, args) -> dict:
+    job = DocumentJob(
+        job_id, pdf_path, STUB_PAGE_TASK, checkpoints, dpi=36, max_in_flight=args.max_in_flight,
+        timeout=args.timeout, max_attempts=args.max_attempts, retry_backoff=args.retry_backoff,
+        fair_share=NullFairShare(),
+        on_dispatch=lambda page_no, image_id, async_result: dispatched.append(
+            {"page": str(page_no), "image_id": image_id, "task_id": async_result.id}
+        ),
+    )
+    start = time.perf_counter()
+    try:
+        stats = job.run(list(dispatched))
+        # 与 GET /jobs/{job_id}/result 相同，由检查点组装文档结果
+        document, error = checkpoints.assemble(job_id, stats["total"]), None
+    except SystemError as e:
+        document, error = None, str(e)
+    # 投递进程退出时已投递的页面仍在 worker 中执行，等它们结束后再恢复
+    for page in dispatched:
+        AsyncResult(page["task_id"], app=celery_app).get(propagate=False)
+    return {"seconds": round(time.perf_counter() - start, 3), "error": error, "stats": dict(job.stats),
+            "document": document}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="page checkpoint, retry and resume check with stub models")
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=20, help="替身模型每页耗时")
+    parser.add_argument("--max-in-flight", type=int, default=8)
+    parser.add_argument("--max-attempts", type=int, default=3)
+    parser.add_argument("--retry-backoff", type=float, default=0.05)
+    parser.add_argument("--timeout", type=int, default=30)
+    parser.add_argument("--crash-after", type=int, default=15, help="第一次运行保存多少页检查点后退出")
+    args = parser.parse_args()
+
+    MODEL.latency_ms = args.latency_ms
+    MODEL.flaky = FLAKY_PAGES
+    MODEL.broken = {BROKEN_PAGE}
+    celery_app.conf.update(
+        broker_url="memory://",
+        result_backend="cache+memory://",
+        broker_transport_options={"polling_interval": 0.005},
+        task_default_queue="layout_task_queue",
+    )
+    pdf_path = make_pdf(args.pages)
+    checkpoints = CrashingCheckpoints(args.crash_after)
+    dispatched = []
+    report = {"config": vars(args), "runs": []}
+    with start_worker(celery_app, pool="threads", concurrency=args.concurrency,
+                      perform_ping_check=False, loglevel="WARNING"):
+        # 1. 中途退出; 2. 恢复，坏页重试后仍失败; 3. 坏页修复后再次恢复，只执行坏页
+        for run_no in range(3):
+            calls_before = sum(MODEL.calls.values())
+            run = run_job("job", pdf_path, checkpoints, dispatched, args)
+            run["model_calls"] = sum(MODEL.calls.values()) - calls_before
+            document = run.pop("document")
+            if document is not None:
+                run["pages"] = len(document["pages"])
+                run["missing"] = document["missing"]
+            report["runs"].append(run)
+            if run_no == 1:
+                MODEL.broken = set()
+
+    # 页面只在失败时重新执行: 总执行次数 = 页数 + flaky 页的失败次数 + 坏页第二次运行的 max_attempts 次失败
+    expected_calls = args.pages + sum(MODEL.flaky.values()) + args.max_attempts
+    report["model_calls"] = sum(MODEL.calls.values())
+    report["expected_model_calls"] = expected_calls
+    report["recomputed_pages"] = sorted(
+        page_no for page_no, calls in MODEL.calls.items()
+        if calls > 1 + MODEL.flaky.get(page_no, 0) and page_no != BROKEN_PAGE
+    )
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    assert report["runs"][-1]["missing"] == [], "document incomplete after resume"
+    assert not report["recomputed_pages"], "finished pages were recomputed"
+    assert report["model_calls"] == expected_calls
+
+
+if __name__ == "__main__":
+    main()
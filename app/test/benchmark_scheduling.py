@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: benchmark_scheduling
+Time: 2025/7/5 16:40
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+
+# 基准测试不使用结果缓存和页面去重，图片直接放在任务参数里；需要在导入 app 模块之前设置
+os.environ.setdefault("RESULT_CACHE_BACKEND", "none")
+os.environ.setdefault("IMAGE_TRANSPORT", "base64")
+os.environ.setdefault("PAGE_DEDUP_BACKEND", "none")
+# 去重作用域按租户计算，用于区分各租户的页面
+os.environ.setdefault("PAGE_DEDUP_SCOPE", "tenant")
+os.environ.setdefault("FAIR_SHARE_POLL_INTERVAL", "0.005")
+# 测试 pdf 写在系统临时目录下
+os.environ.setdefault("PDF_UPLOAD_DIR", tempfile.gettempdir())
+
+import numpy as np  # noqa: E402
+import pymupdf  # noqa: E402
+from kombu.transport import redis as redis_transport  # noqa: E402
+from kombu.transport.virtual import base as virtual_transport  # noqa: E402
+
+from app.api.routes.layout import LayoutRequestModel, default_layout  # noqa: E402
+from app.core.engine.celery_task import celery_app  # noqa: E402
+
+QUEUE = "layout_task_queue"
+
+# 每种模式对应的配置: fifo 为原来的单一队列（所有页面同一优先级、不限制租户），scheduled 为优先级通道 + 租户公平分配
+MODE_ENV = {
+    "fifo": {"FAIR_SHARE_BACKEND": "none", "TASK_PRIORITY_BULK": "0", "TASK_PRIORITY_INTERACTIVE": "0"},
+    "scheduled": {"FAIR_SHARE_BACKEND": "memory"},
+}
+
+
+class RedisPriorityQueues:
+    """
+    使用 kombu redis transport 自身的优先级换算: 投递时按消息优先级落到 priority_steps 中的档位（_put），
+    worker 按档位从小到大依次 BRPOP（_brpop_start），同档位先进先出
+    """
+    priority_steps = redis_transport.Channel.priority_steps
+    sep = redis_transport.Channel.sep
+    min_priority = virtual_transport.Channel.min_priority
+    max_priority = virtual_transport.Channel.max_priority
+    default_priority = virtual_transport.Channel.default_priority
+    priority = redis_transport.Channel.priority
+    _q_for_pri = redis_transport.Channel._q_for_pri
+    _get_message_priority = virtual_transport.Channel._get_message_priority
+
+    def __init__(self):
+        self.lists = {}
+        self.cond = threading.Condition()
+
+    def put(self, queue: str, message: dict):
+        key = self._q_for_pri(queue, self._get_message_priority(message, reverse=False))
+        with self.cond:
+            self.lists.setdefault(key, deque()).appendleft(message)
+            self.cond.notify()
+
+    def get(self, queue: str, stop: threading.Event):
+        keys = [self._q_for_pri(queue, pri) for pri in self.priority_steps]
+        with self.cond:
+            while True:
+                for key in keys:
+                    if self.lists.get(key):
+                        return self.lists[key].pop()
+                if stop.is_set():
+                    return None
+                self.cond.wait(0.05)
+
+
+class StubAsyncResult:
+    def __init__(self, task_id: str):
+        self.id = task_id
+        self.result = None
+        self.submitted_at = time.perf_counter()
+        self.finished_at = None
+        self._done = threading.Event()
+
+    def finish(self, result):
+        self.result = result
+        self.finished_at = time.perf_counter()
+        self._done.set()
+
+    def ready(self) -> bool:
+        return self._done.is_set()
+
+    def get(self, timeout=None, propagate=True, disable_sync_subtasks=True):
+        if not self._done.wait(timeout):
+            raise TimeoutError(self.id)
+        return self.result
+
+
+class StubCelery:
+    """
+    替换 celery_app.send_task: 消息按 celery 的 priority 参数进入 RedisPriorityQueues，由 stub worker 消费
+    """
+
+    def __init__(self):
+        self.queues = RedisPriorityQueues()
+        self.sent = []
+        self._lock = threading.Lock()
+        self._seq = 0
+
+    def send_task(self, name, args=None, kwargs=None, priority=None, **options):
+        with self._lock:
+            self._seq += 1
+            async_result = StubAsyncResult(f"task-{self._seq}")
+            self.sent.append((kwargs["dedup_scope"], priority, async_result))
+        self.queues.put(QUEUE, {"properties": {"priority": priority}, "image_id": args[0], "result": async_result})
+        return async_result
+
+
+def worker(broker: StubCelery, service_ms: float, stop: threading.Event):
+    """
+    stub 模型: 每页固定耗时，prefetch=1，每次只取一个任务
+    """
+    while True:
+        message = broker.queues.get(QUEUE, stop)
+        if message is None:
+            return
+        time.sleep(service_ms / 1000)
+        message["result"].finish({message["image_id"]: {"layout_dets": [], "page_info": {}}})
+
+
+def make_pdf(path: str, pages: int):
+    doc = pymupdf.open()
+    for page_no in range(pages):
+        page = doc.new_page(width=200, height=280)
+        page.insert_text((20, 40), f"page {page_no}")
+    doc.save(path)
+    doc.close()
+
+
+def submit_pdf(pdf_path: str, tenant: str, lane: str, args, finished: dict):
+    """
+    与客户端调用 POST /layout 相同: 通道由请求模型决定，页面经 stream_pdf_results / dispatch_pdf_pages 投递
+    """
+    lane = {"lane": lane} if lane else {}
+    body = LayoutRequestModel(pdf_path=pdf_path, dpi=args.dpi, max_in_flight=args.max_in_flight, **lane)
+    default_layout(body, tenant=tenant)
+    finished[pdf_path] = time.perf_counter()
+
+
+def interactive_client(image_base64: str, rate: float, stop: threading.Event, latencies: list, seed: int):
+    """
+    泊松到达的单图请求，每个请求一个线程，经过 POST /layout 的 images 路径
+    """
+    rng = random.Random(seed)
+    threads = []
+
+    def request(request_no: int):
+        start = time.perf_counter()
+        default_layout(LayoutRequestModel(images={f"interactive_{request_no}": image_base64}), tenant="interactive")
+        latencies.append(time.perf_counter() - start)
+
+    request_no = 0
+    while not stop.is_set():
+        time.sleep(rng.expovariate(rate))
+        thread = threading.Thread(target=request, args=(request_no,))
+        thread.start()
+        threads.append(thread)
+        request_no += 1
+    for thread in threads:
+        thread.join()
+
+
+def percentile_ms(values: list, q: float) -> float:
+    return round(float(np.percentile(values, q)) * 1000, 1) if values else 0.0
+
+
+def run(mode: str, args) -> dict:
+    broker = StubCelery()
+    celery_app.send_task = broker.send_task
+    stop_workers, stop_clients = threading.Event(), threading.Event()
+    workers = [threading.Thread(target=worker, args=(broker, args.service_ms, stop_workers), daemon=True)
+               for _ in range(args.workers)]
+    for thread in workers:
+        thread.start()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # 租户 a: 一次上传的多份 pdf 并行投递（可以指定 interactive 通道，检查是否被忽略）; 租户 b: 稍后提交的一份小文档
+        a_paths = [os.path.join(tmp_dir, f"a_{idx}.pdf") for idx in range(args.documents)]
+        for path in a_paths:
+            make_pdf(path, args.pages // args.documents)
+        b_path = os.path.join(tmp_dir, "b.pdf")
+        make_pdf(b_path, args.tenant_b_pages)
+        with pymupdf.open(a_paths[0]) as doc:
+            image_base64 = base64.b64encode(doc[0].get_pixmap(dpi=args.dpi).tobytes("png")).decode("ascii")
+
+        start = time.perf_counter()
+        finished = {}
+        documents = [threading.Thread(target=submit_pdf, args=(path, "a", args.tenant_a_lane, args, finished))
+                     for path in a_paths]
+        latencies = []
+        client = threading.Thread(target=interactive_client,
+                                  args=(image_base64, args.interactive_rate, stop_clients, latencies, args.seed))
+        for thread in documents:
+            thread.start()
+        client.start()
+        time.sleep(args.tenant_b_delay)
+        b_start = time.perf_counter()
+        submit_pdf(b_path, "b", None, args, finished)
+        for thread in documents:
+            thread.join()
+        stop_clients.set()
+        client.join()
+    stop_workers.set()
+    for thread in workers:
+        thread.join()
+
+    b_finished = finished[b_path]
+    a_during_b = sum(1 for scope, _, result in broker.sent
+                     if scope == "tenant:a" and b_start <= result.finished_at <= b_finished)
+    # 各租户的页面实际落到的 kombu 优先级档位
+    steps = {}
+    for scope, priority, _ in broker.sent:
+        steps.setdefault(scope.split(":", 1)[1], set()).add(broker.queues.priority(priority or 0))
+    return {
+        "mode": mode,
+        "tenant_a_lane": args.tenant_a_lane,
+        "priority_steps": {tenant: sorted(values) for tenant, values in sorted(steps.items())},
+        "interactive_requests": len(latencies),
+        "interactive_p50_ms": percentile_ms(latencies, 50),
+        "interactive_p99_ms": percentile_ms(latencies, 99),
+        "interactive_max_ms": percentile_ms(latencies, 100),
+        "tenant_b_seconds": round(b_finished - b_start, 2),
+        "tenant_b_share": round(args.tenant_b_pages / (args.tenant_b_pages + a_during_b), 3),
+        "total_seconds": round(time.perf_counter() - start, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="priority lanes and tenant fair-share load test with stub workers")
+    parser.add_argument("--mode", choices=sorted(MODE_ENV), help="只运行一种模式，默认两种模式各起一个子进程")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--service-ms", type=float, default=10, help="stub 模型每页耗时")
+    parser.add_argument("--pages", type=int, default=2000, help="租户 a 的批量页数")
+    parser.add_argument("--documents", type=int, default=20, help="租户 a 的页数分成多少份 pdf 并行投递")
+    parser.add_argument("--tenant-a-lane", default="interactive", help="租户 a 请求的通道，pdf 应被忽略")
+    parser.add_argument("--max-in-flight", type=int, default=16, help="单个文档同时在队列中的页数")
+    parser.add_argument("--bulk-capacity", type=int, default=64, help="BULK_MAX_IN_FLIGHT")
+    parser.add_argument("--tenant-b-pages", type=int, default=100)
+    parser.add_argument("--tenant-b-delay", type=float, default=1.0)
+    parser.add_argument("--interactive-rate", type=float, default=20, help="交互请求每秒到达数（泊松）")
+    parser.add_argument("--dpi", type=int, default=18, help="pdf 渲染 DPI，只影响投递方的渲染耗时")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run(args.mode, args)), flush=True)
+        return
+    # 通道优先级和公平分配的配置在导入时读取，每种模式在单独的进程中运行
+    for mode, env in MODE_ENV.items():
+        env = {**os.environ, **env, "BULK_MAX_IN_FLIGHT": str(args.bulk_capacity)}
+        subprocess.run([sys.executable, "-m", "app.test.benchmark_scheduling", "--mode", mode, *sys.argv[1:]],
+                       env=env, check=True)
+
+
+if __name__ == "__main__":
+    main()
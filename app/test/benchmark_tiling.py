@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: benchmark_tiling
+Time: 2025/7/3 15:20
+"""
+import argparse
+import json
+import time
+
+import cv2
+import numpy as np
+from omegaconf import OmegaConf
+
+from app.core.backend.yolo_onnx import OnnxBoxes, OnnxResult
+from app.core.layout.models.yolo import LayoutYOLOv10
+from app.test.benchmark_backend import box_iou
+
+
+class ResizingDetector:
+    """
+    模拟检测模型的输入尺寸限制: 图片先缩小到 img_size，再用连通域检测黑色矩形，坐标还原到输入图片。
+    缩小后不足 min_pixels 像素高的目标检测不到
+    """
+
+    def __init__(self, img_size: int, min_pixels: int = 3):
+        self.img_size = img_size
+        self.min_pixels = min_pixels
+
+    def detect(self, image: np.ndarray) -> np.ndarray:
+        ratio = min(self.img_size / max(image.shape[:2]), 1.0)
+        small = cv2.resize(image[..., 0], None, fx=ratio, fy=ratio, interpolation=cv2.INTER_AREA)
+        _, _, stats, _ = cv2.connectedComponentsWithStats((small < 128).astype(np.uint8))
+        stats = stats[1:]
+        stats = stats[stats[:, 3] >= self.min_pixels]
+        return np.stack(
+            [stats[:, 0], stats[:, 1], stats[:, 0] + stats[:, 2], stats[:, 1] + stats[:, 3]], axis=1
+        ).astype(np.float32) / ratio
+
+    def predict(self, source, iou=None, verbose=False, device=None, conf=None):
+        results = []
+        for image in (source if isinstance(source, list) else [source]):
+            boxes = self.detect(image)
+            results.append(OnnxResult(OnnxBoxes(boxes, np.ones(len(boxes)), np.full(len(boxes), 0.9))))
+        return results
+
+
+def make_drawing(width: int, height: int, seed: int = 0):
+    """
+    模拟图纸: 大量小号文字块 + 跨越切块的长文字行 + 一个大图框
+    """
+    rng = np.random.default_rng(seed)
+    page = np.full((height, width, 3), 255, dtype=np.uint8)
+    boxes = [[width // 10, height // 10, width // 2, height // 2]]
+    cv2.rectangle(page, tuple(boxes[0][:2]), (boxes[0][2] - 1, boxes[0][3] - 1), (0, 0, 0), 4)
+    y = 60
+    while y < height - 60:
+        x = 60
+        line_height = int(rng.integers(14, 40))
+        while True:
+            w = int(rng.uniform(40, width / 3))
+            if x + w > width - 60:
+                break
+            box = [x, y, x + w, y + line_height]
+            if box[2] < boxes[0][0] or box[0] > boxes[0][2] or box[3] < boxes[0][1] or box[1] > boxes[0][3]:
+                cv2.rectangle(page, (box[0], box[1]), (box[2] - 1, box[3] - 1), (0, 0, 0), -1)
+                boxes.append(box)
+            x += w + int(rng.integers(20, 120))
+        y += line_height + int(rng.integers(30, 90))
+    return page, np.asarray(boxes, dtype=np.float64)
+
+
+def recall(gt: np.ndarray, layout_dets: list, min_iou: float) -> float:
+    if not layout_dets:
+        return 0.0
+    dets = [det["poly"] for det in layout_dets]
+    return float(np.mean([max(box_iou(box, det) for det in dets) >= min_iou for box in gt]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="tiled layout detection benchmark")
+    parser.add_argument("--width", type=int, default=9933, help="默认为 300 DPI A1")
+    parser.add_argument("--height", type=int, default=7016)
+    parser.add_argument("--img-size", type=int, default=1024)
+    parser.add_argument("--tile-size", type=int, default=2048)
+    parser.add_argument("--overlap", type=int, default=384)
+    parser.add_argument("--max-tiles", type=int, default=36)
+    parser.add_argument("--min-iou", type=float, default=0.8)
+    args = parser.parse_args()
+
+    page, gt = make_drawing(args.width, args.height)
+    base_config = {"img_size": args.img_size, "model_path": "", "iou_thres": 0, "max_batch_mem_mb": 512}
+    tiling = {
+        "enabled": True, "min_pixels": 0, "tile_size": args.tile_size, "overlap": args.overlap,
+        "max_tiles": args.max_tiles, "full_page": True,
+    }
+    for name, config in (("whole_page", base_config), ("tiled", {**base_config, "tiling": tiling})):
+        model = LayoutYOLOv10(OmegaConf.create(config), model=ResizingDetector(args.img_size))
+        start = time.perf_counter()
+        result = model.predict(page)
+        seconds = time.perf_counter() - start
+        report = {
+            "mode": name,
+            "objects": len(gt),
+            "detected": len(result["layout_dets"]),
+            "recall": round(recall(gt, result["layout_dets"], args.min_iou), 4),
+            "latency_ms": round(seconds * 1000, 1),
+        }
+        if model.tiler is not None:
+            plan = model.tiler.plan(args.width, args.height)
+            report.update({"tiles": len(plan.tiles), "scale": round(plan.scale, 3),
+                           "tile_mb": round(args.tile_size ** 2 * 3 / 1024 / 1024, 1)})
+        print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
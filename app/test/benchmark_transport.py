@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: benchmark_transport
+Time: 2025/6/18 11:20
+"""
+import argparse
+import tempfile
+import time
+
+import cv2
+import numpy as np
+from kombu.serialization import dumps, loads
+
+from app.core.engine.transport import (
+    LocalImageStore,
+    RedisImageStore,
+    load_image_bytes,
+    pack_image,
+    _image_stores,
+)
+
+
+def make_page_bytes(width=2480, height=3508, ext=".png", seed=0):
+    """
+    生成一张模拟 300 DPI A4 页面（白底黑色文字行）的编码图片
+    """
+    rng = np.random.default_rng(seed)
+    img = np.full((height, width, 3), 255, dtype=np.uint8)
+    y = 200
+    while y < height - 200:
+        x = 200
+        while x < width - 400:
+            w = int(rng.integers(40, 300))
+            cv2.rectangle(img, (x, y), (x + w, y + 28), (0, 0, 0), -1)
+            x += w + int(rng.integers(20, 60))
+        y += int(rng.integers(50, 90))
+    ok, buf = cv2.imencode(ext, img)
+    return buf.tobytes()
+
+
+def task_message_size(image_id, payload):
+    """
+    celery 协议 v2 的消息体: (args, kwargs, embed)，使用与 Config.task_serializer 相同的 json 序列化
+    """
+    body = ((image_id, payload), {}, {"callbacks": None, "errbacks": None, "chain": None, "chord": None})
+    _, _, data = dumps(body, serializer="json")
+    return len(data), data
+
+
+def bench(transport, pages, repeat):
+    message_bytes = 0
+    send_time = 0.0
+    receive_time = 0.0
+    for _ in range(repeat):
+        for idx, page in enumerate(pages):
+            start = time.perf_counter()
+            size, data = task_message_size(f"page_{idx}", pack_image(page, transport))
+            send_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            args, _, _ = loads(data, "application/json", "utf-8")
+            load_image_bytes(args[1])
+            receive_time += time.perf_counter() - start
+            message_bytes += size
+    n = len(pages) * repeat
+    return message_bytes / n, send_time / n * 1000, receive_time / n * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="image transport benchmark")
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--ext", default=".png", choices=[".png", ".jpg"])
+    parser.add_argument("--redis", action="store_true", help="同时测试 redis 存储（需要可用的 REDIS_HOST）")
+    args = parser.parse_args()
+
+    pages = [make_page_bytes(ext=args.ext, seed=i) for i in range(args.pages)]
+    raw_size = sum(len(page) for page in pages) / len(pages)
+
+    transports = ["base64", "local"]
+    _image_stores["local"] = LocalImageStore(root=tempfile.mkdtemp(prefix="image_store_"))
+    if args.redis:
+        _image_stores["redis"] = RedisImageStore()
+        transports.append("redis")
+
+    print(f"encoded page size: {raw_size / 1024:.1f} KiB")
+    print(f"{'transport':>10} {'message(B)':>12} {'vs raw':>8} {'send(ms)':>10} {'receive(ms)':>12}")
+    for transport in transports:
+        size, send_ms, receive_ms = bench(transport, pages, args.repeat)
+        print(f"{transport:>10} {size:>12.0f} {size / raw_size:>8.4f} {send_ms:>10.3f} {receive_ms:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
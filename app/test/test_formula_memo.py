@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: test_formula_memo
+Time: 2025/7/8 10:20
+"""
+import base64
+
+import cv2
+import numpy as np
+import pytest
+
+from app.core.engine.cache import HammingMemo, build_result_cache
+from app.tasks.formula_task import TASK_NAME, FormulaTask
+
+# 只差一个字符或一个下标的公式
+NEAR_IDENTICAL = [
+    (("a+b=10", None), ("a+b=18", None)),
+    (("1000.00", None), ("1000,00", None)),
+    (("x", "1"), ("x", "2")),
+]
+
+
+class StubLatexOcr:
+    """
+    记录送入模型的每个公式，返回各不相同的结果
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, image):
+        return self.predict_batch([image])[0]
+
+    def predict_batch(self, images: list):
+        results = [{"latex": f"formula_{self.calls + idx}", "truncated": False} for idx in range(len(images))]
+        self.calls += len(images)
+        return results
+
+
+def render_formula(text: str, subscript: str = None) -> str:
+    img = np.full((80, 520, 3), 255, dtype=np.uint8)
+    cv2.putText(img, text, (20, 50), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 0), 2, cv2.LINE_AA)
+    if subscript:
+        width = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 1.0, 2)[0][0]
+        cv2.putText(img, subscript, (22 + width, 62), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 1, cv2.LINE_AA)
+    return base64.b64encode(cv2.imencode(".png", img)[1].tobytes()).decode("ascii")
+
+
+@pytest.fixture
+def task():
+    task = FormulaTask(model=StubLatexOcr())
+    # 使用进程内缓存，距离和桶大小沿用 formula_recognition.yaml 的默认配置
+    task.cache = HammingMemo(build_result_cache(TASK_NAME, {}, backend="memory"),
+                             task.cache.max_distance, task.cache.bucket_size)
+    return task
+
+
+@pytest.mark.parametrize("first, second", NEAR_IDENTICAL)
+def test_near_identical_formulas_in_one_batch_are_not_merged(task, first, second):
+    results = task.predict_formulas([render_formula(*first), render_formula(*second)])
+    assert task.model.calls == 2
+    assert results[0]["latex"] != results[1]["latex"]
+
+
+@pytest.mark.parametrize("first, second", NEAR_IDENTICAL)
+def test_near_identical_formula_is_not_reused_from_memo(task, first, second):
+    first_result = task.predict_formulas([render_formula(*first)])[0]
+    second_result = task.predict_formulas([render_formula(*second)])[0]
+    assert task.model.calls == 2
+    assert first_result["latex"] != second_result["latex"]
+
+
+def test_identical_formula_is_reused(task):
+    image = render_formula("a+b=10")
+    first_result = task.predict_formulas([image, image])
+    second_result = task.predict_formulas([image])
+    assert task.model.calls == 1
+    assert first_result[0] == first_result[1] == second_result[0]
+
+
+def test_exact_memo_is_not_limited_by_bucket_size(task):
+    task.cache.bucket_size = 1
+    image = render_formula("a+b=10")
+    task.predict_formulas([image])
+    task.predict_formulas([render_formula("a+b=20"), render_formula("a+c=10")])
+    task.predict_formulas([image])
+    assert task.model.calls == 3
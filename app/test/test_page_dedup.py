@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: test_page_dedup
+Time: 2025/7/8 15:30
+"""
+import numpy as np
+import pymupdf
+import pytest
+
+from app.common.utils import load_config
+from app.core.engine.dedup import MemoryPageIndex, PageDedup, page_dedup_scope
+from app.core.layout.models.yolo import LayoutYOLOv10
+from app.tasks.layout_task import TASK_NAME, LayoutTask
+
+SCOPE = page_dedup_scope(doc_id="invoice", mode="document")
+# 发票合计行的位置(pt)
+TOTAL_BOX = [60, 590, 300, 602]
+
+# 发票页面上只差一个字符的金额和币种
+ONE_GLYPH_CHANGES = [
+    {"total": "1000,00"},
+    {"currency": "USO"},
+]
+
+
+def render_invoice(total: str = "1000.00", currency: str = "USD", rows: int = 20, dpi: int = 150) -> np.ndarray:
+    with pymupdf.open() as doc:
+        page = doc.new_page(width=595, height=842)
+        page.insert_text((60, 70), "ACME Logistics GmbH", fontsize=22)
+        page.insert_text((60, 140), "Invoice 2025-00042", fontsize=12)
+        for i in range(rows):
+            page.insert_text((60, 170 + i * 20), f"Item {i + 1:02d}  pallet freight zone {i % 5}  amount 50.00",
+                             fontsize=10)
+        page.insert_text((60, 600), f"Total {total} {currency}", fontsize=10)
+        pix = page.get_pixmap(matrix=pymupdf.Matrix(dpi / 72, dpi / 72), alpha=False)
+        img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, 3)
+        return np.ascontiguousarray(img[:, :, ::-1])
+
+
+def layout_result(img: np.ndarray, dpi: int = 150) -> dict:
+    return {
+        "layout_dets": [{"poly": [value * dpi / 72 for value in TOTAL_BOX], "category_id": 1, "score": 0.9}],
+        "page_info": {"height": img.shape[0], "width": img.shape[1]},
+    }
+
+
+def triage(dedup: PageDedup, img: np.ndarray, task=None):
+    shift_result = task.shift_result if task is not None else None
+    return dedup.triage(SCOPE, img, (img.shape[1], img.shape[0]), lambda size: {"layout_dets": []}, shift_result)
+
+
+@pytest.fixture
+def layout_task():
+    config = load_config(TASK_NAME)[TASK_NAME].model_config
+    return LayoutTask(model=LayoutYOLOv10(config, model=object()))
+
+
+@pytest.fixture
+def layout_dedup(layout_task):
+    """
+    版面检测: 先处理一页原始发票并加入近似重复页索引
+    """
+    dedup = PageDedup(MemoryPageIndex("test", {}))
+    img = render_invoice()
+    fingerprint, result = triage(dedup, img, layout_task)
+    assert result is None
+    dedup.add(SCOPE, fingerprint, layout_result(img))
+    return dedup
+
+
+@pytest.fixture
+def ocr_dedup():
+    """
+    OCR: 只跳过空白页
+    """
+    dedup = PageDedup(namespace="ocr")
+    fingerprint, result = triage(dedup, render_invoice())
+    assert result is None
+    dedup.add(SCOPE, fingerprint, {"text": "Total 1000.00 USD"})
+    return dedup
+
+
+@pytest.mark.parametrize("change", ONE_GLYPH_CHANGES)
+def test_ocr_never_reuses_a_near_duplicate_page(ocr_dedup, change):
+    _, result = triage(ocr_dedup, render_invoice(**change))
+    assert result is None
+    _, result = triage(ocr_dedup, render_invoice())
+    assert result is None
+    assert ocr_dedup.duplicate == 0
+
+
+@pytest.mark.parametrize("change", ONE_GLYPH_CHANGES)
+def test_layout_is_reused_across_a_one_glyph_change(layout_dedup, layout_task, change):
+    img = render_invoice(**change)
+    _, result = triage(layout_dedup, img, layout_task)
+    assert result is not None
+    np.testing.assert_allclose(result["layout_dets"][0]["poly"], layout_result(img)["layout_dets"][0]["poly"], atol=3)
+
+
+def test_layout_of_a_shifted_page_is_moved_with_the_page(layout_dedup, layout_task):
+    img = np.roll(render_invoice(), (24, 16), axis=(0, 1))
+    _, result = triage(layout_dedup, img, layout_task)
+    assert result is not None
+    expected = np.array(layout_result(img)["layout_dets"][0]["poly"]) + [16, 24, 16, 24]
+    np.testing.assert_allclose(result["layout_dets"][0]["poly"], expected, atol=3)
+
+
+def test_layout_is_not_reused_when_a_line_is_added(layout_dedup, layout_task):
+    _, result = triage(layout_dedup, render_invoice(rows=21), layout_task)
+    assert result is None
+
+
+def test_blank_page_with_scan_specks_is_skipped(ocr_dedup):
+    img = np.full((1754, 1240, 3), 255, dtype=np.uint8)
+    rng = np.random.default_rng(0)
+    for y, x in rng.integers(0, 1700, size=(30, 2)):
+        img[y:y + 2, x:x + 2] = 60
+    _, result = triage(ocr_dedup, img)
+    assert result == {"layout_dets": []}
+    assert ocr_dedup.blank == 1
+
+
+def test_page_with_one_short_line_is_not_blank(ocr_dedup):
+    with pymupdf.open() as doc:
+        page = doc.new_page(width=595, height=842)
+        page.insert_text((280, 800), "- 2 -", fontsize=9)
+        pix = page.get_pixmap(matrix=pymupdf.Matrix(150 / 72, 150 / 72), alpha=False)
+        img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, 3).copy()
+    _, result = triage(ocr_dedup, img)
+    assert result is None
+    assert ocr_dedup.blank == 0
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: test_pdf_path
+Time: 2025/7/9 16:20
+"""
+import os
+
+import pytest
+
+from app.core.pdf import rasterize
+from app.core.pdf.rasterize import check_pdf_path
+
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(rasterize, "PDF_UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(rasterize, "PDF_URL_ALLOWED_HOSTS", {"files.example.com"})
+    return tmp_path
+
+
+def test_accepts_files_in_the_upload_directory(upload_dir):
+    assert check_pdf_path("a/b.pdf") == os.path.join(upload_dir, "a", "b.pdf")
+    assert check_pdf_path(str(upload_dir / "b.pdf")) == str(upload_dir / "b.pdf")
+    assert check_pdf_path("https://files.example.com/b.pdf") == "https://files.example.com/b.pdf"
+
+
+@pytest.mark.parametrize("pdf_path", [
+    "/etc/passwd",
+    "../secret.pdf",
+    "file:///etc/passwd",
+    "http://169.254.169.254/latest/meta-data",
+    "https://files.example.com.evil.com/b.pdf",
+])
+def test_rejects_paths_outside_the_upload_directory(upload_dir, pdf_path):
+    with pytest.raises(ValueError):
+        check_pdf_path(pdf_path)
+
+
+def test_rejects_symlinks_out_of_the_upload_directory(upload_dir):
+    (upload_dir / "link.pdf").symlink_to("/etc/passwd")
+    with pytest.raises(ValueError):
+        check_pdf_path("link.pdf")
+
+
+def test_rejects_local_paths_without_upload_directory(monkeypatch):
+    monkeypatch.setattr(rasterize, "PDF_UPLOAD_DIR", "")
+    with pytest.raises(ValueError):
+        check_pdf_path("/tmp/b.pdf")
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Copyright DataGrand Tech Inc. All Rights Reserved.
+Author: youshun xu
+File: test_worker_stats
+Time: 2025/7/9 11:10
+"""
+import json
+import time
+
+from app.core.engine.worker_stats import RedisWorkerStats, merge_counters
+
+
+class DictRedis:
+    """
+    只实现 RedisWorkerStats 用到的 hash 命令
+    """
+
+    def __init__(self):
+        self.hashes = {}
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def execute(self):
+        return []
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field.encode()] = value.encode()
+
+    def expire(self, key, ttl):
+        return True
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def hdel(self, key, *fields):
+        for field in fields:
+            self.hashes.get(key, {}).pop(field.encode(), None)
+
+
+def cache_item(hits: int, misses: int) -> dict:
+    return {"namespace": "ocr", "hits": hits, "misses": misses, "errors": 0, "hit_rate": hits / (hits + misses)}
+
+
+def test_reads_child_processes_of_one_worker():
+    sink = RedisWorkerStats(client=DictRedis(), ttl=60)
+    sink.write("celery@a", {"cache": [cache_item(3, 1)]}, pid=11)
+    sink.write("celery@a", {"cache": [cache_item(1, 3)]}, pid=12)
+    sink.write("celery@b", {"cache": [cache_item(9, 0)]}, pid=13)
+    processes = sink.read("celery@a")
+    assert sorted(processes) == ["celery@a|11", "celery@a|12"]
+    total = merge_counters([item for stats in processes.values() for item in stats["cache"]], "namespace",
+                           "hit_rate", ("hits",), ("hits", "misses"))
+    assert total == [{"namespace": "ocr", "hits": 4, "misses": 4, "errors": 0, "hit_rate": 0.5}]
+
+
+def test_expired_snapshots_are_dropped():
+    client = DictRedis()
+    sink = RedisWorkerStats(client=client, ttl=60)
+    sink.write("celery@a", {"cache": []}, pid=11)
+    stale = json.dumps({"updated": time.time() - 120, "stats": {"cache": []}})
+    client.hset(sink.key, "celery@a|12", stale)
+    assert list(sink.read()) == ["celery@a|11"]
+    assert list(client.hgetall(sink.key)) == [b"celery@a|11"]